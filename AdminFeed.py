@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from Message import Message, MessageType
+
+logger = logging.getLogger(__name__)
+
+BATCH_INTERVAL = 0.05   # secondes entre deux lots au plus
+BATCH_SIZE = 256        # événements par lot au plus
+MAX_PENDING = 8192      # au-delà, les ROUTING_LOG sont échantillonnés
+SAMPLE_EVERY = 10       # en surcharge : 1 ROUTING_LOG gardé sur N, les autres comptés
+
+# Jamais échantillonnés (sauf si la file atteint 2 x MAX_PENDING)
+CRITICAL_EVENTS = (
+    MessageType.ADMIN.CLIENT_CONNECTED,
+    MessageType.ADMIN.CLIENT_DISCONNECTED,
+)
+
+
+class AdminFeed:
+    """
+    Flux d'événements admin asynchrone et groupé.
+
+    publish() est appelé dans le chemin de routage : il ne fait qu'un
+    deque.append (atomique, sans verrou) et ne bloque jamais. Un thread
+    publie les événements par lots ADMIN_BATCH toutes les BATCH_INTERVAL
+    secondes ou dès BATCH_SIZE événements. En surcharge, les ROUTING_LOG sont
+    échantillonnés puis seulement comptés ; le lot suivant porte les compteurs.
+    """
+
+    def __init__(self, send, interval=BATCH_INTERVAL, batch_size=BATCH_SIZE, max_pending=MAX_PENDING, sample_every=SAMPLE_EVERY, log=None):
+        self.send = send
+        # log : ServerLog du serveur (erreurs du thread de publication), logging sinon
+        self.log = log or logger
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.sample_every = sample_every
+        self.events = deque()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.skipped = 0
+        self.dropped = {}
+        self.stats = {"published": 0, "batches": 0, "sampled_out": 0, "max_pending": 0}
+
+    def publish(self, log_type, emitter, receiver, message_type=None, value=None, meta=None):
+        pending = len(self.events)
+        if pending >= self.max_pending:
+            if pending >= 2 * self.max_pending or log_type not in CRITICAL_EVENTS:
+                self.skipped += 1
+                if pending >= 2 * self.max_pending or self.skipped % self.sample_every:
+                    self.dropped[log_type] = self.dropped.get(log_type, 0) + 1
+                    return
+        self.events.append((log_type, emitter, receiver, message_type, value, meta, time.time()))
+        if pending + 1 == self.batch_size:
+            self.wakeup.set()
+
+    def _take(self):
+        batch = []
+        events = self.events
+        while events and len(batch) < self.batch_size:
+            log_type, emitter, receiver, message_type, value, meta, timestamp = events.popleft()
+            payload = {"message_type": message_type, "value": value, "timestamp": timestamp}
+            if meta:
+                payload["meta"] = meta
+            batch.append({
+                "message_type": log_type,
+                "data": {"emitter": emitter, "receiver": receiver, "value": payload},
+            })
+        return batch
+
+    def flush(self):
+        """Publie tout ce qui est en attente ; renvoie le nombre d'événements envoyés"""
+        self.stats["max_pending"] = max(self.stats["max_pending"], len(self.events))
+        sent = 0
+        while True:
+            batch = self._take()
+            dropped, self.dropped = self.dropped, {}
+            if not batch and not dropped:
+                return sent
+            value = {"events": batch}
+            if dropped:
+                value["dropped"] = dropped
+                self.stats["sampled_out"] += sum(dropped.values())
+            self.send(Message(MessageType.ADMIN.BATCH, emitter="SERVER", receiver="ADMIN", value=value))
+            sent += len(batch)
+            self.stats["published"] += len(batch)
+            self.stats["batches"] += 1
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.log.error("[flux admin] %s: %s", type(e).__name__, e)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def snapshot(self):
+        return {"pending": len(self.events), **self.stats}
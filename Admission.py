@@ -0,0 +1,142 @@
+import threading
+
+from Message import BINARY_TYPES_BY_CODE, Message, MessageType
+from OutboundQueue import payload_offset
+from WSFrame import OPCODE, OPCODE_BINARY
+
+MAX_CONNECTIONS = 20000                 # connexions ouvertes par serveur (par worker en cluster)
+MAX_INFLIGHT_BYTES = 512 * 1024 * 1024  # octets en attente dans toutes les files d'envoi
+# Médias distincts en cours de relais par nature (une diffusion compte pour un relais,
+# un transfert par morceaux aussi, du TRANSFER_START au TRANSFER_END)
+MAX_RELAYS = {"image": 64, "audio": 32, "video": 8}
+RETRY_AFTER = 1.0                       # attente conseillée pour un média refusé, allongée avec la charge
+MAX_RETRY_AFTER = 30.0
+CONNECTION_RETRY_AFTER = 5              # secondes annoncées dans le Retry-After d'un handshake refusé
+
+MEDIA_KINDS = {
+    MessageType.ENVOI.IMAGE: "image",
+    MessageType.RECEPTION.IMAGE: "image",
+    MessageType.ENVOI.AUDIO: "audio",
+    MessageType.RECEPTION.AUDIO: "audio",
+    MessageType.ENVOI.VIDEO: "video",
+    MessageType.RECEPTION.VIDEO: "video",
+}
+
+
+def frame_kind(frame):
+    """Nature (image, audio, vidéo) d'une trame WebSocket média encodée ; None pour un autre contenu"""
+    offset = payload_offset(frame)
+    if frame[0] & OPCODE == OPCODE_BINARY:
+        message_type = BINARY_TYPES_BY_CODE.get(frame[offset]) if len(frame) > offset else None
+    else:
+        # média base64 dans le JSON : le type est en tête, seuls quelques octets sont décodés
+        message_type = Message.peek_type(bytes(frame[offset:offset + 128]).decode("utf-8", "ignore"))
+    return MEDIA_KINDS.get(message_type)
+
+
+class AdmissionControl:
+    """
+    Contrôle d'admission et délestage quand le serveur est chargé.
+
+    Trois plafonds : connexions ouvertes (vérifié au handshake, refusé en 503
+    avec Retry-After), octets en attente dans toutes les files d'envoi, et
+    relais média simultanés par nature. Les deux derniers ne refusent que les
+    médias : texte et contrôle passent toujours, un média refusé part plus
+    tard (retry_after) au lieu de faire grossir la mémoire.
+
+    Les files d'envoi (OutboundQueue, paramètre budget) appellent add() et
+    remove() sous leur verrou : un relais est une trame média distincte, qu'une
+    diffusion serialize-once met dans plusieurs files, et il se termine quand
+    la dernière copie est écrite ou jetée.
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_inflight_bytes=MAX_INFLIGHT_BYTES, max_relays=None, retry_after=RETRY_AFTER, connection_retry_after=CONNECTION_RETRY_AFTER):
+        self.max_connections = max_connections
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_relays = {**MAX_RELAYS, **(max_relays or {})}
+        self.retry_after = retry_after
+        self.connection_retry_after = connection_retry_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.inflight = 0
+        self.relays = dict.fromkeys(self.max_relays, 0)
+        # id(trame) -> [copies en file, nature]
+        self._copies = {}
+        self.stats = {"refused_connections": 0, "shed": 0, "shed_bytes": 0}
+
+    # --- connexions ---
+    def open_connection(self):
+        """Réserve une place pour un handshake ; False si le plafond est atteint (503, Retry-After connection_retry_after)"""
+        with self.lock:
+            if self.connections >= self.max_connections:
+                self.stats["refused_connections"] += 1
+                return False
+            self.connections += 1
+            return True
+
+    def close_connection(self):
+        with self.lock:
+            self.connections -= 1
+
+    # --- files d'envoi ---
+    def add(self, frame, media):
+        """Trame mise en file (verrou de la file tenu)"""
+        with self.lock:
+            self.inflight += len(frame)
+            if media:
+                copies = self._copies.get(id(frame))
+                if copies is None:
+                    kind = frame_kind(frame)
+                    self._copies[id(frame)] = [1, kind]
+                    if kind in self.relays:
+                        self.relays[kind] += 1
+                else:
+                    copies[0] += 1
+
+    def remove(self, frame, media):
+        """Trame écrite ou jetée (verrou de la file tenu)"""
+        with self.lock:
+            self.inflight -= len(frame)
+            if media:
+                copies = self._copies.get(id(frame))
+                if copies is not None:
+                    copies[0] -= 1
+                    if not copies[0]:
+                        del self._copies[id(frame)]
+                        if copies[1] in self.relays:
+                            self.relays[copies[1]] -= 1
+
+    # --- messages reçus ---
+    def check(self, message_type, size, transfers=0):
+        """Média à refuser : (raison, retry_after) ; None s'il passe (texte et contrôle passent toujours)
+
+        transfers : transferts par morceaux de même nature en cours, comptés comme des relais.
+        """
+        kind = MEDIA_KINDS.get(message_type)
+        if kind is None:
+            return None
+        load = (self.inflight + size) / self.max_inflight_bytes
+        if load > 1:
+            return self._shed(size, "inflight_bytes", self.retry_after * load)
+        limit = self.max_relays.get(kind)
+        if limit is not None and self.relays.get(kind, 0) + transfers >= limit:
+            return self._shed(size, "relays", self.retry_after * (1 + load))
+        return None
+
+    def _shed(self, size, reason, retry_after):
+        with self.lock:
+            self.stats["shed"] += 1
+            self.stats["shed_bytes"] += size
+        return reason, round(min(MAX_RETRY_AFTER, retry_after), 1)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "max_connections": self.max_connections,
+                "inflight_bytes": self.inflight,
+                "max_inflight_bytes": self.max_inflight_bytes,
+                "relays": dict(self.relays),
+                "max_relays": dict(self.max_relays),
+                **self.stats,
+            }
@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import threading
+import zlib
+
+from websocket_server.websocket_server import API
+
+from Deflate import DeflateServer
+from OutboundQueue import OutboundQueue
+from RateLimit import HandshakeLimiter
+from WSFrame import (
+    OPCODE_BINARY,
+    OPCODE_CLOSE_CONN,
+    OPCODE_CONTINUATION,
+    OPCODE_PING,
+    OPCODE_PONG,
+    OPCODE_TEXT,
+    CLOSE_STATUS_NORMAL,
+    MAX_MESSAGE_SIZE,
+    FrameError,
+    close_payload,
+    encode_frame,
+    frame_header,
+    handshake_response,
+    is_incomplete,
+    read_frame,
+    read_http_headers,
+    reject_response,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWebsocketServer(API):
+    """
+    Serveur WebSocket asyncio, interchangeable avec websocket_server.WebsocketServer.
+
+    Une seule boucle d'événements gère toutes les connexions (pas de thread par
+    client). Les callbacks new_client / client_left / message_received sont
+    appelés depuis la boucle avec les mêmes arguments que le moteur threadé, et
+    send_message peut être appelé depuis n'importe quel thread.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, loglevel=logging.WARNING, backlog=1024, outbound=None, deflate=None, sock=None, handshake=None, admission=None, max_message_size=None):
+        logger.setLevel(loglevel)
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        # sock : socket d'écoute déjà ouverte (workers de Cluster), utilisée au lieu d'en lier une
+        self.listen_sock = sock
+        # paramètres des OutboundQueue (max_frames, max_bytes, policy, block_timeout)
+        self.outbound = outbound or {}
+        # permessage-deflate : paramètres de DeflateServer, False pour ne pas le proposer
+        self.deflate = None if deflate is False else DeflateServer(**(deflate or {}))
+        # handshake : paramètres de HandshakeLimiter (rate, burst, max_wait), False pour ne pas limiter
+        self.handshakes = None if handshake is False else HandshakeLimiter(**(handshake or {}))
+        # admission : AdmissionControl partagé avec WSServer (plafond de connexions), None pour ne pas limiter
+        self.admission = admission
+        # max_message_size : octets au plus par trame reçue, vérifié avant d'en lire le payload ; False sans limite
+        self.max_message_size = None if max_message_size is False else (max_message_size or MAX_MESSAGE_SIZE)
+
+        self.clients = []
+        self.id_counter = 0
+        self.loop = None
+        self.thread = None
+        self._server = None
+        self._loop_thread_id = None
+        self._deny_clients = False
+
+    def _run_forever(self, threaded):
+        if threaded:
+            self.thread = threading.Thread(target=self._serve, daemon=True)
+            self.thread.start()
+        else:
+            self.thread = threading.current_thread()
+            self._serve()
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._loop_thread_id = threading.get_ident()
+        try:
+            self.loop.run_until_complete(self._start())
+            logger.info("Listening on port %d for clients.." % self.port)
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            logger.info("Server terminated.")
+        finally:
+            self.loop.close()
+
+    async def _start(self):
+        if self.listen_sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=self.listen_sock, backlog=self.backlog)
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port, backlog=self.backlog
+            )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle_connection(self, reader, writer):
+        handler = AsyncWebSocketHandler(self, reader, writer)
+        await handler.handle()
+
+    def in_loop(self):
+        return threading.get_ident() == self._loop_thread_id
+
+    def _message_received_(self, handler, msg):
+        self.message_received(handler.client, self, msg)
+
+    def frame_dropped(self, client, server, frame):
+        pass
+
+    def set_fn_frame_dropped(self, fn):
+        self.frame_dropped = fn
+
+    def _frame_dropped_(self, handler, frame):
+        if handler.client is not None:
+            self.frame_dropped(handler.client, self, frame)
+
+    def _new_client_(self, handler):
+        if self._deny_clients:
+            handler.send_close(self._deny_clients["status"], self._deny_clients["reason"])
+            handler.close()
+            return False
+
+        self.id_counter += 1
+        client = {
+            "id": self.id_counter,
+            "handler": handler,
+            "address": handler.client_address,
+        }
+        handler.client = client
+        self.clients.append(client)
+        self.new_client(client, self)
+        return True
+
+    def _client_left_(self, handler):
+        client = handler.client
+        if client is None:
+            return
+        self.client_left(client, self)
+        if client in self.clients:
+            self.clients.remove(client)
+        handler.client = None
+
+    def _unicast(self, receiver_client, msg):
+        receiver_client["handler"].send_message(msg)
+
+    def send_binary(self, client, data):
+        client["handler"].send_binary(data)
+
+    def send_frame(self, client, frame):
+        client["handler"].send_frame(frame)
+
+    def queue_stats(self, client):
+        handler = client["handler"]
+        stats = handler.outbound.snapshot()
+        if handler.deflate:
+            stats["deflate"] = handler.deflate.snapshot()
+        return stats
+
+    def drop_client(self, client):
+        """Coupe la connexion (client lent, keep-alive expiré) ; client_left suit"""
+        client["handler"].abort()
+
+    def _multicast(self, msg):
+        for client in list(self.clients):
+            self._unicast(client, msg)
+
+    def handler_to_client(self, handler):
+        return handler.client
+
+    def _call_in_loop(self, fn, *args):
+        if self.loop is None or self.loop.is_closed():
+            return
+        if self.in_loop():
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _shutdown_gracefully(self, status=CLOSE_STATUS_NORMAL, reason=b""):
+        self._call_in_loop(self._stop, status, reason, True)
+
+    def _shutdown_abruptly(self):
+        self._call_in_loop(self._stop, CLOSE_STATUS_NORMAL, b"", False)
+
+    def _disconnect_clients_gracefully(self, status=CLOSE_STATUS_NORMAL, reason=b""):
+        for client in list(self.clients):
+            client["handler"].send_close(status, reason)
+            client["handler"].close()
+
+    def _disconnect_clients_abruptly(self):
+        for client in list(self.clients):
+            client["handler"].close()
+
+    def _stop(self, status, reason, graceful):
+        if graceful:
+            self._disconnect_clients_gracefully(status, reason)
+        else:
+            self._disconnect_clients_abruptly()
+        if self._server:
+            self._server.close()
+        # laisse le temps aux trames CLOSE d'être écrites
+        self.loop.call_later(0.1 if graceful else 0, self.loop.stop)
+
+    def _deny_new_connections(self, status, reason):
+        self._deny_clients = {
+            "status": status,
+            "reason": reason,
+        }
+
+    def _allow_new_connections(self):
+        self._deny_clients = False
+
+
+class AsyncWebSocketHandler:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.client_address = writer.get_extra_info("peername")
+        self.client = None
+        self.keep_alive = True
+        self.outbound = OutboundQueue(
+            **server.outbound,
+            on_overflow=self.abort,
+            on_put=self._wake,
+            on_drop=lambda frame: server._frame_dropped_(self, frame),
+        )
+        self._wakeup = asyncio.Event()
+        self._writer_task = None
+        # PerMessageDeflate si le client a négocié la compression
+        self.deflate = None
+        # place réservée dans AdmissionControl au handshake, rendue à la fin de handle
+        self.admitted = False
+
+    async def handle(self):
+        try:
+            if not await self.handshake():
+                return
+            self._writer_task = asyncio.ensure_future(self._write_loop())
+            if not self.server._new_client_(self):
+                return
+            while self.keep_alive:
+                await self.read_next_message()
+        except Exception as e:
+            if not is_incomplete(e):
+                logger.error(str(e), exc_info=True)
+        finally:
+            self.server._client_left_(self)
+            self.outbound.close()
+            if self.admitted:
+                self.admitted = False
+                self.server.admission.close_connection()
+            self._wakeup.set()
+            self.close()
+
+    def abort(self):
+        """Coupe la connexion sans attendre : close() attendrait que le client vide le buffer"""
+        self.keep_alive = False
+        self.server._call_in_loop(self.writer.transport.abort)
+
+    def _wake(self):
+        self.server._call_in_loop(self._wakeup.set)
+
+    async def _write_loop(self):
+        """Writer de la connexion : vide la file et attend le drain TCP (backpressure réelle)"""
+        try:
+            while True:
+                frame = self.outbound.get_nowait()
+                if frame is None:
+                    if self.outbound.closed:
+                        return
+                    self._wakeup.clear()
+                    frame = self.outbound.get_nowait()
+                    if frame is None:
+                        await self._wakeup.wait()
+                        continue
+                if self.writer.is_closing():
+                    return
+                if self.deflate:
+                    frame = self.deflate.outgoing(frame)
+                self.writer.write(frame)
+                await self.writer.drain()
+        except ConnectionError:
+            self.close()
+
+    async def handshake(self):
+        request_line, headers = await read_http_headers(self.reader)
+        if not request_line.upper().startswith("GET"):
+            return False
+        if headers.get("upgrade", "").lower() != "websocket":
+            return False
+        key = headers.get("sec-websocket-key")
+        if not key:
+            logger.warning("Client tried to connect but was missing a key")
+            return False
+        admission = self.server.admission
+        if admission:
+            # plafond de connexions : refus immédiat, sans attendre le limiteur de handshakes
+            if not admission.open_connection():
+                self.writer.write(reject_response(admission.connection_retry_after))
+                return False
+            self.admitted = True
+        if self.server.handshakes:
+            # vague de reconnexions : le handshake attend son tour, ou est refusé si l'attente est trop longue
+            wait = self.server.handshakes.admit()
+            if wait is None:
+                self.writer.write(reject_response(self.server.handshakes.retry_after()))
+                return False
+            await asyncio.sleep(wait)
+        extensions = None
+        if self.server.deflate:
+            self.deflate, extensions = self.server.deflate.negotiate(headers.get("sec-websocket-extensions"))
+        self.writer.write(handshake_response(key, extensions))
+        return True
+
+    async def read_next_message(self):
+        try:
+            fin, opcode, payload, rsv1 = await read_frame(self.reader, self.server.max_message_size, require_mask=True)
+        except FrameError as e:
+            # rien n'a été lu ni alloué pour le payload : on ferme avec le code prévu
+            logger.warning("%s, closing connection." % e)
+            self.send_close(e.status, str(e).encode())
+            self.keep_alive = False
+            return
+        if rsv1:
+            if not self.deflate or opcode not in (OPCODE_TEXT, OPCODE_BINARY):
+                logger.warning("RSV1 set without permessage-deflate.")
+                self.keep_alive = False
+                return
+            try:
+                payload = self.deflate.inflate(payload)
+            except (ValueError, zlib.error) as e:
+                logger.warning("Invalid compressed message: %s" % e)
+                self.keep_alive = False
+                return
+        if opcode == OPCODE_CLOSE_CONN:
+            logger.info("Client asked to close connection.")
+            self.keep_alive = False
+        elif opcode == OPCODE_TEXT:
+            self.server._message_received_(self, payload.decode("utf-8"))
+        elif opcode == OPCODE_BINARY:
+            self.server._message_received_(self, bytearray(payload))
+        elif opcode == OPCODE_PING:
+            self.send_frame(encode_frame(payload, OPCODE_PONG))
+        elif opcode == OPCODE_PONG:
+            pass
+        elif opcode == OPCODE_CONTINUATION:
+            logger.warning("Continuation frames are not supported.")
+        else:
+            logger.warning("Unknown opcode %#x." % opcode)
+            self.keep_alive = False
+
+    def _write(self, data):
+        if self.writer.is_closing():
+            return
+        self.writer.write(data)
+
+    def send_message(self, message):
+        self.send_text(message)
+
+    def send_text(self, message, opcode=OPCODE_TEXT):
+        return self.send_frame(encode_frame(message, opcode))
+
+    def send_binary(self, data):
+        return self.send_frame(frame_header(len(data), OPCODE_BINARY) + data)
+
+    def send_frame(self, frame):
+        """Met en file une trame déjà encodée ; dans la boucle, la politique BLOCK ne peut pas attendre"""
+        return self.outbound.put(frame, can_block=not self.server.in_loop())
+
+    def send_close(self, status=CLOSE_STATUS_NORMAL, reason=b""):
+        frame = encode_frame(close_payload(status, reason), OPCODE_CLOSE_CONN)
+        self.server._call_in_loop(self._write, frame)
+
+    def close(self):
+        self.keep_alive = False
+        self.server._call_in_loop(self.writer.close)
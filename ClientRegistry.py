@@ -0,0 +1,109 @@
+import threading
+
+ADMIN_PREFIX = "ADMIN"
+
+
+def is_admin_name(name):
+    return isinstance(name, str) and name.upper().startswith(ADMIN_PREFIX)
+
+
+class ClientRegistry:
+    """
+    Clients déclarés, indexés par nom, par id websocket_server et par rôle (admin / normal).
+
+    Toutes les mutations passent par un verrou : les callbacks du moteur threaded
+    arrivent depuis un thread par connexion. Le rôle est calculé une seule fois à
+    la déclaration ; les listes renvoyées sont des instantanés mis en cache
+    jusqu'à la prochaine mutation, donc sûrs à parcourir sans verrou.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_name = {}
+        self.name_by_id = {}
+        self.admins = {}
+        self.regulars = {}
+        # capacité annoncée ("binary", "chunked", ...) -> noms
+        self.features = {}
+        self._cache = {}
+
+    def _forget(self, name):
+        """Retire name de tous les index (verrou tenu) ; renvoie son client"""
+        client = self.by_name.pop(name, None)
+        if client is None:
+            return None
+        if self.name_by_id.get(client["id"]) == name:
+            del self.name_by_id[client["id"]]
+        self.admins.pop(name, None)
+        self.regulars.pop(name, None)
+        for members in self.features.values():
+            members.discard(name)
+        return client
+
+    def add(self, name, client, features=()):
+        """Enregistre (ou ré-enregistre) name pour ce client ; renvoie le client remplacé"""
+        with self.lock:
+            # même connexion déclarée sous un autre nom : l'ancien nom disparaît
+            previous_name = self.name_by_id.get(client["id"])
+            if previous_name is not None and previous_name != name:
+                self._forget(previous_name)
+            replaced = self._forget(name)
+            self.by_name[name] = client
+            self.name_by_id[client["id"]] = name
+            (self.admins if is_admin_name(name) else self.regulars)[name] = client
+            for feature in features:
+                self.features.setdefault(feature, set()).add(name)
+            self._cache.clear()
+        if replaced is not None and replaced["id"] == client["id"]:
+            return None
+        return replaced
+
+    def remove_client(self, client):
+        """Retire la connexion ; renvoie le nom sous lequel elle était déclarée (ou None)"""
+        with self.lock:
+            name = self.name_by_id.get(client["id"])
+            if name is None:
+                return None
+            self._forget(name)
+            self._cache.clear()
+            return name
+
+    def get(self, name, default=None):
+        return self.by_name.get(name, default)
+
+    def name_of(self, client):
+        return self.name_by_id.get(client["id"])
+
+    def has_feature(self, name, feature):
+        members = self.features.get(feature)
+        return members is not None and name in members
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def _snapshot(self, key, build):
+        snapshot = self._cache.get(key)
+        if snapshot is None:
+            with self.lock:
+                snapshot = self._cache.get(key)
+                if snapshot is None:
+                    snapshot = self._cache[key] = build()
+        return snapshot
+
+    def names(self):
+        return self._snapshot("names", lambda: tuple(self.by_name))
+
+    def items(self):
+        return self._snapshot("items", lambda: tuple(self.by_name.items()))
+
+    def clients(self):
+        return self._snapshot("clients", lambda: tuple(self.by_name.values()))
+
+    def admin_clients(self):
+        return self._snapshot("admins", lambda: tuple(self.admins.values()))
+
+    def regular_names(self):
+        return self._snapshot("regular_names", lambda: tuple(self.regulars))
@@ -0,0 +1,373 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from Codecs import JSON
+from ClientRegistry import is_admin_name
+from Context import Context
+
+# Paquet broker <-> worker : [type 1 octet][taille en-tête JSON 4 octets][taille corps 4 octets][en-tête][corps]
+PACKET = struct.Struct(">BII")
+HELLO = 1     # {"worker": n} : premier paquet d'un worker
+JOIN = 2      # {"worker": n, "names": [...]} : clients déclarés sur ce worker
+LEAVE = 3     # {"worker": n, "names": [...]} : clients partis
+SEND = 4      # {"to": nom, "op": ...} + corps : pour le worker qui tient ce client
+PUBLISH = 5   # {"op": ...} + corps : pour tous les autres workers
+
+MAX_PENDING_BYTES = 64 * 1024 * 1024   # au-delà, un worker trop lent perd les paquets les plus anciens
+BACKLOG = 1024                         # file du listen() de chaque socket d'écoute
+
+logger = logging.getLogger(__name__)
+
+
+def pack(kind, header, body=b""):
+    head = JSON.encode(header)
+    head = head if isinstance(head, bytes) else head.encode("utf-8")
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return b"".join((PACKET.pack(kind, len(head), len(body)), head, body))
+
+
+def _read_exact(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            return None
+        received += count
+    return data
+
+
+def read_packets(sock):
+    """Paquets reçus : (type, en-tête, corps, paquet brut) jusqu'à la fermeture"""
+    while True:
+        prefix = _read_exact(sock, PACKET.size)
+        if prefix is None:
+            return
+        kind, head_len, body_len = PACKET.unpack(prefix)
+        rest = _read_exact(sock, head_len + body_len)
+        if rest is None:
+            return
+        header = JSON.decode(bytes(rest[:head_len]))
+        yield kind, header, memoryview(rest)[head_len:], prefix + rest
+
+
+class PacketWriter:
+    """
+    File d'envoi d'une connexion Unix, vidée par un thread dédié.
+
+    Les paquets en attente partent en un seul sendall : sous charge, un
+    appel système transporte des dizaines de messages relayés.
+    """
+
+    def __init__(self, sock, max_pending_bytes=MAX_PENDING_BYTES):
+        self.sock = sock
+        self.max_pending_bytes = max_pending_bytes
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.stats = {"packets": 0, "bytes": 0, "writes": 0, "dropped": 0}
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, packet):
+        with self.cond:
+            if self.closed:
+                return False
+            self.pending.append(packet)
+            self.pending_bytes += len(packet)
+            while self.pending_bytes > self.max_pending_bytes and len(self.pending) > 1:
+                self.pending_bytes -= len(self.pending.popleft())
+                self.stats["dropped"] += 1
+            self.cond.notify()
+        return True
+
+    def _write_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                batch = list(self.pending)
+                self.pending.clear()
+                self.pending_bytes = 0
+            data = batch[0] if len(batch) == 1 else b"".join(batch)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+            self.stats["packets"] += len(batch)
+            self.stats["bytes"] += len(data)
+            self.stats["writes"] += 1
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class Broker:
+    """
+    Annuaire et relais entre workers, dans le process parent.
+
+    Le broker sait sur quel worker chaque nom est déclaré. Un SEND part vers
+    ce seul worker, un PUBLISH vers tous les autres ; les paquets sont relayés
+    tels que reçus, sans décoder leur corps.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen()
+        self.workers = {}
+        self.owners = {}
+        self.lock = threading.Lock()
+        self.stats = {"sent": 0, "published": 0, "unknown": 0}
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _others(self, worker):
+        with self.lock:
+            return [writer for index, writer in self.workers.items() if index != worker]
+
+    def _serve(self, conn):
+        writer = PacketWriter(conn)
+        worker = None
+        for kind, header, body, raw in read_packets(conn):
+            if kind == HELLO:
+                worker = header["worker"]
+                with self.lock:
+                    self.workers[worker] = writer
+                    owners = {}
+                    for name, index in self.owners.items():
+                        owners.setdefault(index, []).append(name)
+                # annuaire actuel pour le nouveau worker
+                for index, names in owners.items():
+                    writer.send(pack(JOIN, {"worker": index, "names": names}))
+            elif kind == JOIN:
+                with self.lock:
+                    for name in header["names"]:
+                        self.owners[name] = worker
+                for other in self._others(worker):
+                    other.send(raw)
+            elif kind == LEAVE:
+                self._leave(worker, header["names"])
+            elif kind == SEND:
+                with self.lock:
+                    target = self.workers.get(self.owners.get(header["to"]))
+                if target is None or target is writer:
+                    self.stats["unknown"] += 1
+                    continue
+                target.send(raw)
+                self.stats["sent"] += 1
+            elif kind == PUBLISH:
+                for other in self._others(worker):
+                    other.send(raw)
+                self.stats["published"] += 1
+        writer.close()
+        if worker is not None:
+            with self.lock:
+                if self.workers.get(worker) is writer:
+                    del self.workers[worker]
+                names = [name for name, index in self.owners.items() if index == worker]
+            self._leave(worker, names)
+
+    def _leave(self, worker, names):
+        """Retire les noms encore tenus par ce worker (un nom redéclaré ailleurs reste)"""
+        with self.lock:
+            gone = [name for name in names if self.owners.get(name) == worker]
+            for name in gone:
+                del self.owners[name]
+        if gone:
+            packet = pack(LEAVE, {"worker": worker, "names": gone})
+            for other in self._others(worker):
+                other.send(packet)
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ClusterLink:
+    """
+    Connexion d'un worker au broker.
+
+    Garde l'annuaire des clients déclarés sur les autres workers et transmet
+    les messages pour eux ; on_packet(type, en-tête, corps) est appelé depuis
+    le thread lecteur pour les JOIN / LEAVE / SEND / PUBLISH reçus.
+    """
+
+    def __init__(self, on_packet, path, worker):
+        self.on_packet = on_packet
+        self.path = path
+        self.worker = worker
+        self.remote = {}
+        self.lock = threading.Lock()
+        self.writer = None
+        self._names = None
+
+    def start(self, timeout=10.0):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                sock.connect(self.path)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self.writer = PacketWriter(sock)
+        self.writer.send(pack(HELLO, {"worker": self.worker}))
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+
+    def _read_loop(self, sock):
+        for kind, header, body, _ in read_packets(sock):
+            if kind in (JOIN, LEAVE):
+                with self.lock:
+                    for name in header["names"]:
+                        if kind == JOIN:
+                            self.remote[name] = header["worker"]
+                        elif self.remote.get(name) == header["worker"]:
+                            del self.remote[name]
+                    self._names = None
+            try:
+                self.on_packet(kind, header, body)
+            except Exception:
+                logger.exception("paquet du broker non traité")
+        logger.warning("connexion au broker perdue")
+
+    def owner(self, name):
+        """Worker qui tient ce client, None s'il n'est déclaré sur aucun autre worker"""
+        return self.remote.get(name)
+
+    def remote_names(self):
+        names = self._names
+        if names is None:
+            with self.lock:
+                names = self._names = tuple(self.remote)
+        return names
+
+    def has_remote_admins(self):
+        return any(is_admin_name(name) for name in self.remote_names())
+
+    def join(self, name):
+        self.writer.send(pack(JOIN, {"worker": self.worker, "names": [name]}))
+
+    def leave(self, name):
+        self.writer.send(pack(LEAVE, {"worker": self.worker, "names": [name]}))
+
+    def send(self, name, op, body, **header):
+        """Transmet body au worker qui tient name ; False si name n'est connu nulle part"""
+        if self.owner(name) is None:
+            return False
+        return self.writer.send(pack(SEND, {"to": name, "op": op, **header}, body))
+
+    def publish(self, op, body, **header):
+        self.writer.send(pack(PUBLISH, {"op": op, **header}, body))
+
+    def snapshot(self):
+        return {"worker": self.worker, "remote_clients": len(self.remote), **self.writer.stats}
+
+
+def listen_socket(host, port, backlog=BACKLOG, reuse_port=False):
+    """
+    Socket d'écoute d'un worker.
+
+    Avec reuse_port, chaque worker lie sa propre socket (SO_REUSEPORT) et le
+    noyau répartit les nouvelles connexions entre elles : pas de réveil de
+    tous les workers à chaque connexion, chacun a sa file de backlog. Sinon,
+    une seule socket créée avant le fork et héritée par tous.
+    """
+    sock = socket.create_server((host, port), backlog=backlog, reuse_port=reuse_port)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(ctx, worker, engine, listener, path, options, backlog):
+    from WSServer import WSServer
+
+    # Ctrl+C est géré par le parent, qui arrête les workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if listener is None:
+        listener = listen_socket(ctx.host, ctx.port, backlog, reuse_port=True)
+    server = WSServer(ctx, engine, sock=listener, cluster={"path": path, "worker": worker}, backlog=backlog, **options)
+    server.start_services()
+    server.server.run_forever()
+
+
+def serve(ctx, workers=None, engine="asyncio", reuse_port=None, backlog=BACKLOG, **options):
+    """
+    Lance WSServer dans N processus workers qui se partagent le port de ctx.
+
+    Chaque worker écoute sur sa socket SO_REUSEPORT (ou, sans reuse_port, sur
+    une socket héritée du parent) et ils routent entre eux par le broker
+    (socket Unix locale) : un message vers un client tenu par un autre worker,
+    une diffusion "ALL" et la liste des clients couvrent tout le cluster.
+    """
+    workers = workers or os.cpu_count() or 1
+    if reuse_port is None:
+        reuse_port = hasattr(socket, "SO_REUSEPORT")
+    path = os.path.join(tempfile.gettempdir(), f"wsserver-{ctx.port}-{os.getpid()}.sock")
+    broker = Broker(path)
+    # fork : les workers héritent de la socket d'écoute partagée sans la sérialiser
+    listener = None if reuse_port else listen_socket(ctx.host, ctx.port, backlog)
+    fork = multiprocessing.get_context("fork")
+    processes = [
+        fork.Process(target=_run_worker, args=(ctx, index, engine, listener, path, options, backlog), daemon=True)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    if listener is not None:
+        listener.close()
+    broker.start()
+    # SIGTERM comme Ctrl+C : les workers ne doivent pas survivre au parent
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Serveur WS ({engine}, {workers} workers{', SO_REUSEPORT' if reuse_port else ''}) sur ws://{ctx.host}:{ctx.port}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        broker.close()
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    engine = sys.argv[2] if len(sys.argv) > 2 else "asyncio"
+    serve(Context.dev(), workers, engine)
@@ -0,0 +1,104 @@
+import json
+
+from WSFrame import OPCODE_BINARY, OPCODE_TEXT
+
+# Codecs optionnels : utilisés seulement s'ils sont installés
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Premier octet d'une trame binaire encodée par un codec ; les trames média
+# binaires (Message.BINARY_TYPES) utilisent les codes 0x01 à 0x20
+MSGPACK_TAG = 0x4D
+CBOR_TAG = 0x43
+
+
+class JsonCodec:
+    """JSON en trame texte : orjson s'il est installé, sinon json de la stdlib"""
+
+    name = "json"
+    opcode = OPCODE_TEXT
+    tag = None
+
+    def encode(self, data):
+        if orjson is not None:
+            try:
+                return orjson.dumps(data)
+            except TypeError:
+                pass
+        return json.dumps(data)
+
+    def decode(self, payload):
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    opcode = OPCODE_BINARY
+    tag = MSGPACK_TAG
+
+    def encode(self, data):
+        return bytes((self.tag,)) + msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload):
+        return msgpack.unpackb(memoryview(payload)[1:], raw=False)
+
+
+class CborCodec:
+    name = "cbor"
+    opcode = OPCODE_BINARY
+    tag = CBOR_TAG
+
+    def encode(self, data):
+        return bytes((self.tag,)) + cbor2.dumps(data)
+
+    def decode(self, payload):
+        return cbor2.loads(bytes(memoryview(payload)[1:]))
+
+
+JSON = JsonCodec()
+
+# Codecs disponibles dans ce process, par ordre de préférence
+CODECS = {"json": JSON}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS["cbor"] = CborCodec()
+# Ordre de préférence annoncé par défaut à la DECLARATION
+PREFERRED = [name for name in ("msgpack", "cbor", "json") if name in CODECS]
+
+CODECS_BY_TAG = {codec.tag: codec for codec in CODECS.values() if codec.tag is not None}
+CODEC_TAGS = (MSGPACK_TAG, CBOR_TAG)
+
+
+def negotiate(offered):
+    """Premier codec proposé par le client et disponible ici ; JSON sinon"""
+    for name in offered or ():
+        if name in CODECS:
+            return CODECS[name]
+    return JSON
+
+
+def is_codec_frame(data):
+    return len(data) > 0 and data[0] in CODEC_TAGS
+
+
+def decode_frame(data):
+    """Dict d'un message reçu : texte JSON ou trame binaire d'un codec"""
+    if isinstance(data, str):
+        return JSON.decode(data)
+    codec = CODECS_BY_TAG.get(data[0])
+    if codec is None:
+        raise ValueError(f"Codec {data[0]:#x} non disponible")
+    return codec.decode(data)
@@ -0,0 +1,268 @@
+import base64
+import threading
+import time
+import zlib
+
+from Message import BINARY_HEADER
+from OutboundQueue import MEDIA_BINARY_CODES, payload_offset
+from WSFrame import OPCODE, OPCODE_BINARY, OPCODE_TEXT, frame_header
+
+EXTENSION = "permessage-deflate"
+PARAMS = ("server_no_context_takeover", "client_no_context_takeover", "server_max_window_bits", "client_max_window_bits")
+
+LEVEL = 6
+MIN_SIZE = 128                   # en dessous, un message part tel quel
+MAX_INFLATED = 64 * 1024 * 1024  # taille décompressée maximale d'un message reçu
+CACHE_SIZE = 16                  # trames compressées gardées pour les diffusions
+SNIFF_WINDOW = 512               # octets du JSON où chercher le préfixe d'un média base64
+_TAIL = b"\x00\x00\xff\xff"
+
+# Préfixes historiques des médias base64 dans le JSON (voir Message.MEDIA_PREFIXES)
+_MEDIA_TEXT_PREFIXES = (b'"IMG:', b'"AUDIO:', b'"VIDEO:')
+
+
+def is_compressed_media(data):
+    """Vrai si data commence par la signature d'un format déjà compressé (jpeg, png, mp3, mp4...)"""
+    data = bytes(data[:16])
+    if data.startswith((b"\xff\xd8\xff", b"\x89PNG", b"GIF8", b"ID3", b"OggS", b"fLaC", b"\x1a\x45\xdf\xa3", b"PK\x03\x04", b"\x1f\x8b")):
+        return True
+    if data[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return True
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return True
+    return data[4:8] == b"ftyp"
+
+
+def _media_payload(payload, opcode):
+    """Début du média transporté par un message (octets bruts), None si ce n'est pas un média"""
+    if opcode == OPCODE_BINARY:
+        if len(payload) < BINARY_HEADER.size or payload[0] not in MEDIA_BINARY_CODES:
+            return None
+        _, emitter_len, receiver_len, _ = BINARY_HEADER.unpack_from(payload, 0)
+        return payload[BINARY_HEADER.size + emitter_len + receiver_len:]
+    head = bytes(payload[:SNIFF_WINDOW])
+    for prefix in _MEDIA_TEXT_PREFIXES:
+        start = head.find(prefix)
+        if start >= 0:
+            start += len(prefix)
+            try:
+                return base64.b64decode(bytes(payload[start:start + 24]))
+            except ValueError:
+                return None
+    return None
+
+
+def skip_reason(payload, opcode, min_size):
+    """Pourquoi ne pas compresser ce message ; None s'il faut le compresser"""
+    if len(payload) < min_size:
+        return "small"
+    media = _media_payload(payload, opcode)
+    if media is not None and is_compressed_media(media):
+        return "media"
+    return None
+
+
+def parse_extensions(header):
+    """Sec-WebSocket-Extensions -> [(nom, {paramètre: valeur ou True})], dans l'ordre des offres"""
+    offers = []
+    for offer in (header or "").split(","):
+        parts = [part.strip() for part in offer.split(";")]
+        if not parts[0]:
+            continue
+        params = {}
+        for part in parts[1:]:
+            if not part:
+                continue
+            key, _, value = part.partition("=")
+            params[key.strip().lower()] = value.strip().strip('"') or True
+        offers.append((parts[0].lower(), params))
+    return offers
+
+
+# zlib ne sait pas produire une fenêtre de 256 octets (8 bits) : il compresse alors sur 512
+MIN_WINDOW_BITS = 9
+
+
+def _window_bits(value, default=15):
+    if value is True or value is None:
+        return default
+    bits = int(value)
+    if not 8 <= bits <= 15:
+        raise ValueError(f"max_window_bits invalide: {bits}")
+    return bits
+
+
+class PerMessageDeflate:
+    """
+    permessage-deflate (RFC 7692) d'une connexion, côté serveur ou client.
+
+    Le serveur compresse toujours sans contexte (server_no_context_takeover) :
+    une trame compressée ne dépend pas de la connexion et une diffusion n'est
+    compressée qu'une fois (cache partagé de DeflateServer). Le client garde
+    son contexte, ce qui compresse bien les petits messages de chat répétitifs.
+    Les messages trop petits et les médias déjà compressés (détectés par type
+    et signature) partent tels quels.
+    """
+
+    def __init__(self, level=LEVEL, min_size=MIN_SIZE, wbits=15, context_takeover=False, max_inflated=MAX_INFLATED, cache=None):
+        self.level = level
+        self.min_size = min_size
+        self.wbits = wbits
+        self.max_inflated = max_inflated
+        self.cache = cache
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -wbits) if context_takeover else None
+        self.inflater = zlib.decompressobj(-15)
+        self.stats = {
+            "compressed": 0, "skipped_small": 0, "skipped_media": 0, "incompressible": 0, "cache_hits": 0,
+            "raw_bytes": 0, "wire_bytes": 0, "deflate_cpu_ms": 0.0,
+            "inflated": 0, "inflated_wire_bytes": 0, "inflated_bytes": 0, "inflate_cpu_ms": 0.0,
+        }
+
+    def compress(self, payload):
+        """Payload compressé, ou None s'il ne gagne rien"""
+        if self.compressor is not None:
+            data = self.compressor.compress(payload) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -self.wbits)
+            data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        data = data[:-4] if data.endswith(_TAIL) else data
+        if self.compressor is None and len(data) >= len(payload):
+            return None
+        return data
+
+    def deflate(self, payload, opcode):
+        """(payload à envoyer, compressé ?) pour un message TEXT / BINARY"""
+        data, skipped = self._deflate(payload, opcode)
+        self.count(skipped, len(payload), data)
+        return (payload, False) if skipped else (data, True)
+
+    def _deflate(self, payload, opcode):
+        """(payload compressé, None) ou (None, compteur du message non compressé)"""
+        reason = skip_reason(payload, opcode, self.min_size)
+        if reason:
+            return None, "skipped_" + reason
+        started = time.thread_time()
+        data = self.compress(payload)
+        self.stats["deflate_cpu_ms"] += (time.thread_time() - started) * 1000
+        return (None, "incompressible") if data is None else (data, None)
+
+    def count(self, skipped, raw_size, data):
+        if skipped:
+            self.stats[skipped] += 1
+            return
+        self.stats["compressed"] += 1
+        self.stats["raw_bytes"] += raw_size
+        self.stats["wire_bytes"] += len(data)
+
+    def outgoing(self, frame):
+        """Trame à écrire sur le socket : compressée (RSV1) si le message s'y prête"""
+        opcode = frame[0] & OPCODE
+        if opcode not in (OPCODE_TEXT, OPCODE_BINARY):
+            return frame
+        if self.cache is not None:
+            return self.cache.outgoing(self, frame, opcode)
+        return self.compress_frame(frame, opcode)[0]
+
+    def compress_frame(self, frame, opcode):
+        """(trame à écrire, compteur si non compressée, données compressées)"""
+        payload = memoryview(frame)[payload_offset(frame):]
+        data, skipped = self._deflate(payload, opcode)
+        self.count(skipped, len(payload), data)
+        if skipped:
+            return frame, skipped, None
+        return frame_header(len(data), opcode, rsv1=True) + data, None, data
+
+    def inflate(self, payload):
+        """Décompresse un message reçu avec RSV1 ; ValueError au-delà de max_inflated"""
+        started = time.thread_time()
+        data = self.inflater.decompress(bytes(payload) + _TAIL, self.max_inflated)
+        if self.inflater.unconsumed_tail:
+            raise ValueError(f"Message décompressé de plus de {self.max_inflated} octets")
+        self.stats["inflate_cpu_ms"] += (time.thread_time() - started) * 1000
+        self.stats["inflated"] += 1
+        self.stats["inflated_wire_bytes"] += len(payload)
+        self.stats["inflated_bytes"] += len(data)
+        return data
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["deflate_cpu_ms"] = round(stats["deflate_cpu_ms"], 3)
+        stats["inflate_cpu_ms"] = round(stats["inflate_cpu_ms"], 3)
+        # ratio = octets sur le fil / octets avant compression (plus petit = mieux)
+        stats["ratio_out"] = round(stats["wire_bytes"] / stats["raw_bytes"], 3) if stats["raw_bytes"] else None
+        stats["ratio_in"] = round(stats["inflated_wire_bytes"] / stats["inflated_bytes"], 3) if stats["inflated_bytes"] else None
+        return stats
+
+
+class DeflateServer:
+    """
+    Réglages permessage-deflate d'un moteur et cache des trames compressées.
+
+    Une diffusion met la même trame (même objet) dans la file de chaque
+    client : le premier writer la compresse, les suivants reprennent le
+    résultat du cache au lieu de recompresser.
+    """
+
+    def __init__(self, level=LEVEL, min_size=MIN_SIZE, max_inflated=MAX_INFLATED, cache_size=CACHE_SIZE):
+        self.level = level
+        self.min_size = min_size
+        self.max_inflated = max_inflated
+        self.cache_size = cache_size
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def negotiate(self, header):
+        """(PerMessageDeflate, valeur de Sec-WebSocket-Extensions) pour la première offre acceptable, sinon (None, None)"""
+        for name, params in parse_extensions(header):
+            if name != EXTENSION or any(key not in PARAMS for key in params):
+                continue
+            try:
+                wbits = _window_bits(params.get("server_max_window_bits"))
+                _window_bits(params.get("client_max_window_bits"))
+            except ValueError:
+                continue
+            if wbits < MIN_WINDOW_BITS:
+                # répondre une valeur plus grande que l'offre est interdit (RFC 7692 §7.1.2.1) : offre refusée
+                continue
+            response = f"{EXTENSION}; server_no_context_takeover"
+            if "server_max_window_bits" in params:
+                response += f"; server_max_window_bits={wbits}"
+            deflate = PerMessageDeflate(self.level, self.min_size, wbits, max_inflated=self.max_inflated, cache=self)
+            return deflate, response
+        return None, None
+
+    def outgoing(self, deflate, frame, opcode):
+        key = (id(frame), deflate.wbits)
+        with self.lock:
+            cached = self.frames.get(key)
+        if cached is not None and cached[0] is frame:
+            _, out, skipped, data = cached
+            deflate.stats["cache_hits"] += 1
+            deflate.count(skipped, len(frame) - payload_offset(frame), data)
+            return out
+        out, skipped, data = deflate.compress_frame(frame, opcode)
+        with self.lock:
+            if len(self.frames) >= self.cache_size:
+                del self.frames[next(iter(self.frames))]
+            # la trame d'origine est gardée : son id ne peut pas être réutilisé tant qu'elle est en cache
+            self.frames[key] = (frame, out, skipped, data)
+        return out
+
+
+def client_offer():
+    """Offre envoyée par WSClient : le serveur choisit, le client garde son contexte"""
+    return f"{EXTENSION}; client_max_window_bits"
+
+
+def client_deflate(headers, level=LEVEL, min_size=MIN_SIZE):
+    """PerMessageDeflate du client d'après la réponse du serveur ; None si l'extension est refusée"""
+    for name, params in parse_extensions((headers or {}).get("sec-websocket-extensions")):
+        if name != EXTENSION:
+            continue
+        wbits = _window_bits(params.get("client_max_window_bits"))
+        context_takeover = "client_no_context_takeover" not in params
+        if wbits < MIN_WINDOW_BITS:
+            # fenêtre imposée impossible à respecter : on décompresse ce qui arrive mais on n'envoie rien compressé
+            return PerMessageDeflate(level, float("inf"), MIN_WINDOW_BITS)
+        return PerMessageDeflate(level, min_size, wbits, context_takeover=context_takeover)
+    return None
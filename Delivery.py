@@ -0,0 +1,242 @@
+import threading
+from collections import deque
+
+from Message import Message, MessageType
+
+# Messages numérotés : chaque RECEPTION_* livré à une session a le numéro suivant
+SEQUENCED_TYPES = (
+    MessageType.RECEPTION.TEXT,
+    MessageType.RECEPTION.IMAGE,
+    MessageType.RECEPTION.AUDIO,
+    MessageType.RECEPTION.VIDEO,
+)
+
+ACK_EVERY = 16      # un ACK au plus tous les N messages...
+ACK_DELAY = 0.2     # ...ou T secondes après le premier message non acquitté
+MAX_OUTSTANDING = 4096
+
+RECEIVED = "message reçu"
+NOT_RECEIVED = "message non reçu"
+
+
+def receipt_message(emitter, receiver, status, count):
+    """SYS_MESSAGE envoyé à l'émetteur (dynamiques/envoi_message.md)"""
+    value = {"status": status, "receiver": receiver, "count": count}
+    return Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver=emitter, value=value)
+
+
+def describe_receipt(value):
+    """Texte lisible d'un accusé ; None si value n'en est pas un"""
+    if not isinstance(value, dict) or value.get("status") not in (RECEIVED, NOT_RECEIVED):
+        return None
+    count = value.get("count", 1)
+    suffix = f" (x{count})" if count > 1 else ""
+    return f"{value['status']} par {value.get('receiver')}{suffix}"
+
+
+# ----------------------------
+# Côté serveur
+# ----------------------------
+class Delivery:
+    __slots__ = ("frame", "emitter", "receiver")
+
+    def __init__(self, frame, emitter, receiver):
+        self.frame = frame
+        self.emitter = emitter
+        self.receiver = receiver
+
+
+class Session:
+    def __init__(self):
+        self.outstanding = deque()
+        self.acked = 0
+        self.stats = {"delivered": 0, "lost": 0, "untracked": 0}
+
+
+class DeliveryTracker:
+    """
+    Suivi de livraison par session, sans numéro dans les trames.
+
+    Le numéro d'un message est sa position parmi les RECEPTION_* de la session :
+    la file d'envoi est FIFO, donc le serveur (à l'envoi) et le client (à la
+    réception) comptent dans le même ordre. Le client renvoie un ACK cumulatif
+    (nombre total reçu) ; une trame jetée par la file d'envoi est retirée de la
+    session pour que les deux comptes restent alignés.
+
+    Plusieurs threads écrivent au même client (threads des autres clients, vidage
+    de l'outbox, lecteur du cluster) : send() enregistre et met en file sous un
+    verrou par client, pour que l'ordre des numéros soit celui de la file.
+    """
+
+    def __init__(self, max_outstanding=MAX_OUTSTANDING):
+        self.max_outstanding = max_outstanding
+        self.sessions = {}
+        # id client -> verrou tenu de record() à la fin de la mise en file
+        self.send_locks = {}
+        self.lock = threading.Lock()
+
+    def start(self, client):
+        """Ouvre (ou rouvre) la session : le client compte à partir de zéro"""
+        with self.lock:
+            self.sessions[client["id"]] = Session()
+            self.send_locks.setdefault(client["id"], threading.Lock())
+
+    def stop(self, client):
+        """Ferme la session ; renvoie les livraisons jamais acquittées"""
+        with self.lock:
+            session = self.sessions.pop(client["id"], None)
+            self.send_locks.pop(client["id"], None)
+        if session is None:
+            return []
+        return list(session.outstanding)
+
+    def tracked(self, client):
+        return client["id"] in self.sessions
+
+    def send(self, client, frame, send_frame, emitter=None, receiver=None):
+        """Enregistre frame puis la met en file (send_frame(client, frame)) d'un seul tenant pour ce client"""
+        lock = self.send_locks.get(client["id"])
+        if lock is None:
+            # session non suivie (client historique, ou pas encore déclaré)
+            return send_frame(client, frame)
+        with lock:
+            self.record((client,), frame, emitter, receiver)
+            return send_frame(client, frame)
+
+    def record(self, clients, frame, emitter=None, receiver=None):
+        """À appeler avant la mise en file de frame pour ces clients (voir send, qui garde l'ordre)"""
+        with self.lock:
+            for client in clients:
+                session = self.sessions.get(client["id"])
+                if session is None:
+                    continue
+                if len(session.outstanding) >= self.max_outstanding:
+                    # client qui n'acquitte plus : on cesse de suivre les plus anciens
+                    session.outstanding.popleft()
+                    session.acked += 1
+                    session.stats["untracked"] += 1
+                session.outstanding.append(Delivery(frame, emitter, receiver))
+
+    def dropped(self, client, frame):
+        """Trame jetée par la file d'envoi : le client ne la comptera jamais"""
+        with self.lock:
+            session = self.sessions.get(client["id"])
+            if session is None:
+                return None
+            for delivery in session.outstanding:
+                if delivery.frame is frame:
+                    session.outstanding.remove(delivery)
+                    session.stats["lost"] += 1
+                    return delivery
+        return None
+
+    def ack(self, client, count):
+        """ACK cumulatif : renvoie les livraisons confirmées par ce compte"""
+        with self.lock:
+            session = self.sessions.get(client["id"])
+            if session is None or count <= session.acked:
+                return []
+            confirmed = []
+            while session.acked < count and session.outstanding:
+                confirmed.append(session.outstanding.popleft())
+                session.acked += 1
+            session.acked = max(session.acked, count)
+            session.stats["delivered"] += len(confirmed)
+            return confirmed
+
+    def acked(self, client):
+        with self.lock:
+            session = self.sessions.get(client["id"])
+            return session.acked if session else 0
+
+    def snapshot(self, client):
+        with self.lock:
+            session = self.sessions.get(client["id"])
+            if session is None:
+                return None
+            return {"unacked": len(session.outstanding), "acked": session.acked, **session.stats}
+
+
+def group_by_emitter(deliveries):
+    """{(émetteur, destinataire): nombre} pour les livraisons qui attendent un accusé"""
+    counts = {}
+    for delivery in deliveries:
+        if delivery.emitter and delivery.emitter != "SERVER":
+            key = (delivery.emitter, delivery.receiver)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+# ----------------------------
+# Côté client
+# ----------------------------
+class CumulativeAck:
+    """
+    ACK différé côté client : un seul ACK pour N messages reçus ou après T secondes.
+
+    La session commence quand le serveur envoie ACK 0 ; avant cela (serveur
+    historique), rien n'est compté ni acquitté.
+    """
+
+    def __init__(self, send, every=ACK_EVERY, delay=ACK_DELAY):
+        self.send = send
+        self.every = every
+        self.delay = delay
+        self.received = 0
+        self.acked = 0
+        self.active = False
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self._cancel()
+            self.received = 0
+            self.acked = 0
+            self.active = True
+
+    def stop(self):
+        with self.lock:
+            self._cancel()
+            self.active = False
+
+    def _cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def on_message(self, message):
+        """Compte un message reçu ; True si c'était le début de session (ACK 0 du serveur)"""
+        if message.message_type == MessageType.ACK and message.emitter == "SERVER":
+            self.reset()
+            return True
+        if message.message_type not in SEQUENCED_TYPES:
+            return False
+        with self.lock:
+            if not self.active:
+                return False
+            self.received += 1
+            if self.received - self.acked >= self.every:
+                self._cancel()
+                flush = True
+            else:
+                flush = False
+                if self.timer is None:
+                    self.timer = threading.Timer(self.delay, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if flush:
+            self.flush()
+        return False
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+            if not self.active or self.received == self.acked:
+                return
+            count = self.acked = self.received
+        try:
+            self.send(count)
+        except Exception:
+            # connexion perdue : la session repartira de zéro à la reconnexion
+            pass
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import deque
+
+from WSFrame import OPCODE_BINARY, OPCODE_TEXT, encode_frame
+
+
+class FanOut:
+    """
+    Diffusion "serialize-once" : le payload et la trame WebSocket sont encodés
+    une seule fois, puis le même buffer est écrit sur chaque socket.
+
+    Chaque diffusion est chronométrée (encodage / écriture) ; le temps
+    d'écriture par socket doit rester stable quand le nombre de clients monte.
+    """
+
+    def __init__(self, server, history=256, metrics=None):
+        self.server = server
+        self.metrics = metrics
+        self.history = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.totals = {"broadcasts": 0, "sockets": 0, "bytes_encoded": 0, "bytes_written": 0}
+
+    def broadcast(self, clients, payload, opcode=None, label="", send=None):
+        """Envoie payload (str JSON ou bytes binaires) à tous les clients ; renvoie la mesure
+
+        send(client, frame), s'il est fourni, remplace server.send_frame (mise en file suivie pour les ACK).
+        """
+        if opcode is None:
+            opcode = OPCODE_TEXT if isinstance(payload, str) else OPCODE_BINARY
+        started = time.perf_counter()
+        frame = encode_frame(payload, opcode)
+        encoded = time.perf_counter()
+        send = send or self.server.send_frame
+
+        sent = 0
+        for client in clients:
+            try:
+                send(client, frame)
+                sent += 1
+            except OSError:
+                # socket mort : client_left fera le ménage
+                continue
+        finished = time.perf_counter()
+        if self.metrics:
+            self.metrics.fanout(label, len(frame), sent)
+
+        record = {
+            "label": label,
+            "clients": sent,
+            "frame_bytes": len(frame),
+            "encode_ms": round((encoded - started) * 1000, 3),
+            "write_ms": round((finished - encoded) * 1000, 3),
+            "per_socket_us": round((finished - encoded) * 1e6 / sent, 2) if sent else None,
+            "timestamp": time.time(),
+        }
+        with self.lock:
+            self.history.append(record)
+            self.totals["broadcasts"] += 1
+            self.totals["sockets"] += sent
+            self.totals["bytes_encoded"] += len(frame)
+            self.totals["bytes_written"] += len(frame) * sent
+        return record
+
+    def summary(self):
+        with self.lock:
+            recent = list(self.history)
+            totals = dict(self.totals)
+        if recent:
+            totals["recent_per_socket_us"] = round(
+                sum(r["write_ms"] for r in recent) * 1000 / max(1, sum(r["clients"] for r in recent)), 2
+            )
+            totals["recent_max_clients"] = max(r["clients"] for r in recent)
+        return totals
@@ -0,0 +1,285 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+from Codecs import JSON
+
+DIRECTORY = "journal"
+SEGMENT_BYTES = 64 * 1024 * 1024      # taille d'un segment avant d'en ouvrir un nouveau
+INDEX_EVERY = 4096                    # une entrée d'index tous les N octets de segment
+MAX_BYTES = 1024 * 1024 * 1024        # rétention : taille totale des segments
+MAX_AGE = 7 * 24 * 3600               # rétention : âge du dernier message d'un segment
+FLUSH_INTERVAL = 0.05                 # écriture groupée des messages journalisés
+RETENTION_INTERVAL = 60.0
+
+# Segment <base>.log : enregistrements [taille 4][numéro 8][timestamp 8][envelope JSON]
+# Index creux <base>.index : entrées [numéro 8][timestamp 8][position 4]
+RECORD = struct.Struct(">IQd")
+INDEX = struct.Struct(">QdI")
+
+
+def _scan(data, position, end):
+    """Enregistrements complets de data[position:end] : (numéro, timestamp, début, fin du JSON)"""
+    while position + RECORD.size <= end:
+        length, number, timestamp = RECORD.unpack_from(data, position)
+        start = position + RECORD.size
+        if start + length > end:
+            return
+        yield number, timestamp, start, start + length
+        position = start + length
+
+
+class Segment:
+    """Un fichier de segment et son index creux (timestamp -> position), gardé en mémoire"""
+
+    def __init__(self, directory, base):
+        self.base = base
+        self.path = os.path.join(directory, f"{base:020d}.log")
+        self.index_path = os.path.join(directory, f"{base:020d}.index")
+        self.index = []          # (timestamp, numéro, position), timestamps croissants
+        self.size = 0
+        self.next = base         # numéro du prochain message
+        self.last_ts = 0.0
+        self.indexed_at = -INDEX_EVERY
+        self.file = None
+        self.index_file = None
+
+    def load(self):
+        """Relit l'index, puis la fin du segment après sa dernière entrée ; coupe un enregistrement tronqué"""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX.size
+            for offset in range(0, usable, INDEX.size):
+                number, timestamp, position = INDEX.unpack_from(data, offset)
+                self.index.append((timestamp, number, position))
+        self.size = os.path.getsize(self.path)
+        while True:
+            # une entrée d'index au-delà de la fin ou sur un enregistrement tronqué est retirée
+            while self.index and self.index[-1][2] >= self.size:
+                self.index.pop()
+            start = self.index[-1][2] if self.index else 0
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                data = f.read()
+            end = start
+            for number, timestamp, _, stop in _scan(data, 0, len(data)):
+                self.next = number + 1
+                self.last_ts = max(self.last_ts, timestamp)
+                end = start + stop
+            if end > start or not self.index:
+                break
+            self.size = start
+        self.indexed_at = self.index[-1][2] if self.index else -INDEX_EVERY
+        if end < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        self.size = end
+        with open(self.index_path, "wb") as f:
+            f.write(b"".join(INDEX.pack(number, timestamp, position) for timestamp, number, position in self.index))
+
+    def open(self):
+        self.file = open(self.path, "ab")
+        self.index_file = open(self.index_path, "ab")
+
+    def write(self, number, timestamp, payload):
+        if self.size - self.indexed_at >= INDEX_EVERY:
+            self.index.append((timestamp, number, self.size))
+            self.index_file.write(INDEX.pack(number, timestamp, self.size))
+            self.indexed_at = self.size
+        self.file.write(RECORD.pack(len(payload), number, timestamp))
+        self.file.write(payload)
+        self.size += RECORD.size + len(payload)
+        self.next = number + 1
+        self.last_ts = timestamp
+
+    def flush(self, sync=False):
+        self.file.flush()
+        self.index_file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+            os.fsync(self.index_file.fileno())
+
+    def close(self):
+        if self.file:
+            self.flush(sync=True)
+            self.file.close()
+            self.index_file.close()
+            self.file = self.index_file = None
+
+    def scan(self, since, until):
+        """(numéro, timestamp, JSON) des messages de [since, until], lus dans le segment projeté en mémoire"""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+                # dernière entrée d'index avant since : on ne lit que la fin du segment
+                at = bisect.bisect_left(self.index, (since,)) - 1
+                position = self.index[at][2] if at >= 0 else 0
+                for number, timestamp, start, end in _scan(data, position, size):
+                    if timestamp > until:
+                        return
+                    if timestamp >= since:
+                        yield number, timestamp, data[start:end]
+
+
+class Journal:
+    """
+    Journal segmenté en ajout seul de tous les messages routés.
+
+    append() ne fait qu'un deque.append ; un thread numérote, encode et écrit
+    les messages par lots dans le segment courant, qui est remplacé au-delà
+    de segment_bytes. Chaque segment a un index creux (une entrée tous les
+    INDEX_EVERY octets) : replay() saute directement au premier message
+    d'une date et lit les segments projetés en mémoire (mmap), sans rien
+    charger d'autre. Les plus anciens segments sont supprimés au-delà de
+    max_bytes ou de max_age.
+    """
+
+    def __init__(self, directory=DIRECTORY, segment_bytes=SEGMENT_BYTES, max_bytes=MAX_BYTES, max_age=MAX_AGE, interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.pending = deque()
+        self.segments = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.stats = {"appended": 0, "written": 0, "segments_removed": 0, "replays": 0}
+        if os.path.isdir(directory):
+            self._load()
+        if not self.segments:
+            self.segments.append(Segment(directory, 0))
+
+    def _load(self):
+        bases = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log") and name[:-4].isdigit())
+        for base in bases:
+            segment = Segment(self.directory, base)
+            segment.load()
+            self.segments.append(segment)
+
+    def append(self, message_type, emitter, receiver, value=None, meta=None):
+        """Journalise un message routé ; ne bloque jamais le routage"""
+        envelope = {"message_type": message_type, "emitter": emitter, "receiver": receiver, "value": value}
+        if meta:
+            envelope["meta"] = meta
+        self.pending.append((time.time(), envelope))
+        self.stats["appended"] += 1
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def _write_loop(self):
+        next_retention = time.monotonic()
+        while self.running:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+            if time.monotonic() >= next_retention:
+                next_retention = time.monotonic() + RETENTION_INTERVAL
+                self.enforce_retention()
+        self.flush()
+        self.segments[-1].close()
+
+    def flush(self):
+        """Écrit les messages en attente dans le segment courant"""
+        pending = self.pending
+        if not pending:
+            return
+        segment = self.segments[-1]
+        if segment.file is None:
+            # répertoire et fichiers créés au premier message seulement
+            os.makedirs(self.directory, exist_ok=True)
+            segment.open()
+        written = 0
+        while pending:
+            timestamp, envelope = pending.popleft()
+            payload = JSON.encode(envelope)
+            payload = payload if isinstance(payload, bytes) else payload.encode("utf-8")
+            if segment.size >= self.segment_bytes:
+                segment = self._roll(segment)
+            # horodatage croissant : l'index reste trié même si deux threads se croisent
+            segment.write(segment.next, max(timestamp, segment.last_ts), payload)
+            written += 1
+        segment.flush()
+        self.stats["written"] += written
+
+    def _roll(self, segment):
+        segment.close()
+        new = Segment(self.directory, segment.next)
+        new.last_ts = segment.last_ts
+        new.open()
+        with self.lock:
+            self.segments.append(new)
+        self.enforce_retention()
+        return new
+
+    def enforce_retention(self):
+        """Supprime les plus anciens segments (jamais le segment courant) au-delà de max_bytes ou de max_age"""
+        cutoff = time.time() - self.max_age
+        with self.lock:
+            total = sum(segment.size for segment in self.segments)
+            removed = []
+            while len(self.segments) > 1 and (total > self.max_bytes or self.segments[0].last_ts < cutoff):
+                segment = self.segments.pop(0)
+                total -= segment.size
+                removed.append(segment)
+        for segment in removed:
+            for path in (segment.path, segment.index_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.stats["segments_removed"] += 1
+
+    def replay(self, since=0.0, until=None, match=None):
+        """
+        Messages journalisés entre since et until (timestamps), plus ancien d'abord.
+
+        Générateur : un segment à la fois, projeté en mémoire ; match(envelope)
+        filtre les messages (par exemple ceux d'un client).
+        """
+        until = time.time() if until is None else until
+        with self.lock:
+            segments = list(self.segments)
+        self.stats["replays"] += 1
+        # premier segment qui peut contenir since : le dernier qui commence avant
+        starts = [segment.index[0][0] if segment.index else float("inf") for segment in segments]
+        first = max(0, bisect.bisect_right(starts, since) - 1)
+        for segment in segments[first:]:
+            if segment.last_ts < since:
+                continue
+            for number, timestamp, payload in segment.scan(since, until):
+                envelope = JSON.decode(payload)
+                if match is None or match(envelope):
+                    envelope["offset"] = number
+                    envelope["timestamp"] = timestamp
+                    yield envelope
+
+    def snapshot(self):
+        with self.lock:
+            segments = list(self.segments)
+        return {
+            "segments": len(segments),
+            "bytes": sum(segment.size for segment in segments),
+            "first_offset": segments[0].base,
+            "next_offset": segments[-1].next,
+            "pending": len(self.pending),
+            **self.stats,
+        }
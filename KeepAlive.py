@@ -0,0 +1,103 @@
+import threading
+import time
+
+from Message import Message, MessageType
+from TimerWheel import TimerWheel
+from WSFrame import encode_frame
+
+PING_INTERVAL = 30   # secondes de silence avant un ping
+PONG_TIMEOUT = 10    # secondes pour répondre au ping avant éviction
+
+
+class KeepAlive:
+    """
+    Keep-alive ping / pong (dynamiques/keep_alive.md) sur une seule roue de timers.
+
+    Toute trame reçue compte comme activité : touch() ne fait qu'écrire une
+    date, le timer du client n'est pas réarmé à chaque message. Quand il
+    échoit, le client actif depuis est reprogrammé, le client silencieux reçoit
+    un ping SYS_MESSAGE, et celui qui n'a rien envoyé depuis le ping est évincé.
+    """
+
+    def __init__(self, server, on_evict, interval=PING_INTERVAL, timeout=PONG_TIMEOUT, tick=0.5, log=None):
+        self.server = server
+        self.on_evict = on_evict
+        self.interval = interval
+        self.timeout = timeout
+        self.wheel = TimerWheel(tick=tick, log=log)
+        self.clients = {}
+        self.last_seen = {}
+        self.pinged_at = {}
+        self.evicted = set()
+        self.lock = threading.Lock()
+        self.stats = {"pings": 0, "evictions": 0}
+        # même ping pour tout le monde : encodé une seule fois
+        ping = Message(MessageType.SYS_MESSAGE, emitter="", receiver="", value="ping")
+        self.ping_frame = encode_frame(ping.to_json())
+
+    def start(self):
+        self.wheel.start()
+
+    def stop(self):
+        self.wheel.stop()
+
+    def add(self, client):
+        with self.lock:
+            self.clients[client["id"]] = client
+            self.last_seen[client["id"]] = time.monotonic()
+        self.wheel.schedule(client["id"], self.interval, self._expired)
+
+    def touch(self, client):
+        self.last_seen[client["id"]] = time.monotonic()
+
+    def remove(self, client):
+        """Oublie le client ; renvoie True s'il a été évincé par le keep-alive"""
+        client_id = client["id"]
+        self.wheel.cancel(client_id)
+        with self.lock:
+            self.clients.pop(client_id, None)
+            self.last_seen.pop(client_id, None)
+            self.pinged_at.pop(client_id, None)
+            if client_id in self.evicted:
+                self.evicted.discard(client_id)
+                return True
+        return False
+
+    def _expired(self, client_id):
+        now = time.monotonic()
+        with self.lock:
+            client = self.clients.get(client_id)
+            if client is None:
+                return
+            seen = self.last_seen.get(client_id, 0)
+            pinged = self.pinged_at.pop(client_id, None)
+            if pinged is not None and seen < pinged:
+                self.evicted.add(client_id)
+                self.stats["evictions"] += 1
+                action = "evict"
+            elif now - seen < self.interval:
+                action = "wait"
+            else:
+                self.pinged_at[client_id] = now
+                self.stats["pings"] += 1
+                action = "ping"
+
+        if action == "evict":
+            self.on_evict(client)
+        elif action == "wait":
+            self.wheel.schedule(client_id, self.interval - (now - seen), self._expired)
+        else:
+            self.wheel.schedule(client_id, self.timeout, self._expired)
+            try:
+                self.server.send_frame(client, self.ping_frame)
+            except OSError:
+                pass
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "clients": len(self.clients),
+                "awaiting_pong": len(self.pinged_at),
+                "timers": len(self.wheel),
+                **self.stats,
+            }
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+MAX_BYTES = 256 * 1024 * 1024   # taille totale gardée au plus (LRU)
+MAX_KNOWN = 4096                 # empreintes retenues par client
+DIGEST_SIZE = 32                 # sha256
+DIGEST = re.compile(r"[0-9a-f]{64}")
+
+# Payload d'une trame MEDIA_DATA : [empreinte sha256 32 octets] + octets du média
+
+
+def media_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, block=1024 * 1024):
+    """Empreinte d'un fichier lu par blocs (sans le charger en mémoire)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def is_digest(value):
+    """True pour une empreinte sha256 hexadécimale (64 caractères), utilisable comme nom de fichier"""
+    return isinstance(value, str) and DIGEST.fullmatch(value) is not None
+
+
+def media_ref(value):
+    """Empreinte d'une value qui référence un média au lieu de le contenir ; None sinon"""
+    if isinstance(value, dict) and isinstance(value.get("media_ref"), str):
+        return value["media_ref"]
+    return None
+
+
+def ref_value(digest, size):
+    return {"media_ref": digest, "size": size}
+
+
+def pack_media_data(digest, data):
+    return bytes.fromhex(digest) + data
+
+
+def unpack_media_data(payload):
+    """(empreinte, octets) d'une trame MEDIA_DATA"""
+    return bytes(payload[:DIGEST_SIZE]).hex(), payload[DIGEST_SIZE:]
+
+
+class MediaStore:
+    """
+    Médias adressés par leur contenu (sha256), bornés en taille (LRU).
+
+    Sans directory, les octets sont gardés en mémoire (serveur). Avec un
+    répertoire, chaque média est un fichier nommé par son empreinte et l'index
+    est reconstruit au démarrage, plus ancien d'abord (client).
+    Garde aussi, par client, les empreintes qu'il a déjà reçues ou envoyées :
+    le serveur lui envoie alors une référence au lieu des octets.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, directory=None, max_known=MAX_KNOWN):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_known = max_known
+        self.entries = OrderedDict()
+        self.size = 0
+        self.known = {}
+        self.lock = threading.Lock()
+        self.stats = {"stored": 0, "duplicates": 0, "hits": 0, "misses": 0, "evicted": 0, "bytes_saved": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if is_digest(name) and os.path.isfile(path):
+                files.append((os.path.getmtime(path), name, os.path.getsize(path)))
+        for _, digest, size in sorted(files):
+            self.entries[digest] = size
+            self.size += size
+        self._evict()
+
+    def _path(self, digest):
+        # l'empreinte peut venir du réseau : jamais de séparateur ni de ".." dans le chemin
+        if not is_digest(digest):
+            raise ValueError(f"Empreinte invalide: {digest!r}")
+        return os.path.join(self.directory, digest)
+
+    def put(self, data, digest=None):
+        """Range data ; renvoie (empreinte, déjà présent ?)"""
+        digest = digest or media_hash(data)
+        with self.lock:
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                self.stats["duplicates"] += 1
+                self.stats["bytes_saved"] += len(data)
+                return digest, True
+            if len(data) > self.max_bytes:
+                return digest, False
+            if self.directory:
+                with open(self._path(digest), "wb") as f:
+                    f.write(data)
+                self.entries[digest] = len(data)
+            else:
+                self.entries[digest] = bytes(data)
+            self.size += len(data)
+            self.stats["stored"] += 1
+            self._evict()
+            return digest, False
+
+    def get(self, digest):
+        """Octets du média, None s'il n'est pas (ou plus) là"""
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.stats["hits"] += 1
+            if not self.directory:
+                return entry
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except OSError:
+            self.discard(digest)
+            return None
+
+    def has(self, digest):
+        with self.lock:
+            return digest in self.entries
+
+    def discard(self, digest):
+        with self.lock:
+            entry = self.entries.pop(digest, None)
+            if entry is not None:
+                self.size -= entry if isinstance(entry, int) else len(entry)
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            digest, entry = self.entries.popitem(last=False)
+            self.size -= entry if isinstance(entry, int) else len(entry)
+            self.stats["evicted"] += 1
+            if self.directory:
+                try:
+                    os.remove(self._path(digest))
+                except OSError:
+                    pass
+
+    # --- empreintes connues de chaque client (serveur) ---
+    def remember(self, client, digest):
+        with self.lock:
+            known = self.known.setdefault(client["id"], OrderedDict())
+            known[digest] = True
+            known.move_to_end(digest)
+            if len(known) > self.max_known:
+                known.popitem(last=False)
+
+    def knows(self, client, digest):
+        with self.lock:
+            known = self.known.get(client["id"])
+            return known is not None and digest in known
+
+    def forget(self, client):
+        with self.lock:
+            self.known.pop(client["id"], None)
+
+    def snapshot(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes, **self.stats}
@@ -1,4 +1,10 @@
-import json
+import base64
+import re
+import struct
+from json import JSONDecoder
+from json.decoder import scanstring
+
+from Codecs import JSON, decode_frame, is_codec_frame
 
 class ENVOI_TYPE:
     TEXT = "ENVOI_TEXT"
@@ -19,37 +25,222 @@ class ADMIN_TYPE:
     CLIENT_CONNECTED = "ADMIN_CLIENT_CONNECTED"
     CLIENT_DISCONNECTED = "ADMIN_CLIENT_DISCONNECTED"
     CLIENT_LIST_FULL = "ADMIN_CLIENT_LIST_FULL"
+    QUEUE_STATS = "ADMIN_QUEUE_STATS"
+    BATCH = "ADMIN_BATCH"
+    THROTTLE = "ADMIN_THROTTLE"
+    # compteurs et histogrammes du serveur (Metrics), envoyés avec ADMIN_QUEUE_STATS
+    METRICS = "ADMIN_METRICS"
+    # admin -> serveur : fenêtre de profilage (value = {"duration", "interval", "memory"}) ;
+    # serveur -> admins : état puis résumé (value = {"status": "started" / "busy" / "done"...})
+    PROFILE = "ADMIN_PROFILE"
+
+class TRANSFER_TYPE:
+    START = "TRANSFER_START"
+    CHUNK = "TRANSFER_CHUNK"
+    ACK = "TRANSFER_ACK"
+    END = "TRANSFER_END"
+
+class MEDIA_TYPE:
+    # demande des octets d'un média référencé par son empreinte (value = {"media_ref": sha256, ...})
+    FETCH = "MEDIA_FETCH"
+    # réponse binaire : [sha256 32 octets] + octets du média
+    DATA = "MEDIA_DATA"
+
+class HISTORY_TYPE:
+    # demande d'historique au journal du serveur (value = {"since": timestamp, "last": n})
+    REQUEST = "HISTORY_REQUEST"
+    # réponse par lots : value = {"events": [...], "done": bool}
+    BATCH = "HISTORY_BATCH"
+
+class ROOM_TYPE:
+    # rejoindre / quitter un salon (value = "#nom") ; le serveur répond avec le même type,
+    # value = {"room": "#nom", "members": n} ; un ENVOI_* vers "#nom" va à ses membres
+    JOIN = "ROOM_JOIN"
+    LEAVE = "ROOM_LEAVE"
 
 class MessageType:
     DECLARATION = "DECLARATION"
     ENVOI = ENVOI_TYPE
     RECEPTION = RECEPTION_TYPE
     ADMIN = ADMIN_TYPE
+    TRANSFER = TRANSFER_TYPE
+    MEDIA = MEDIA_TYPE
+    HISTORY = HISTORY_TYPE
+    ROOM = ROOM_TYPE
     WARNING = "WARNING"
     SYS_MESSAGE = "SYS_MESSAGE"
+    # ACK cumulatif : value = nombre de RECEPTION_* reçus depuis le début de session (ACK 0 du serveur)
+    ACK = "ACK"
+
+# Trames binaires média : [type u8][len emitter u8][len receiver u8][len payload u32] emitter receiver payload
+BINARY_HEADER = struct.Struct(">BBBI")
+
+BINARY_TYPES = {
+    MessageType.ENVOI.IMAGE: 0x01,
+    MessageType.ENVOI.AUDIO: 0x02,
+    MessageType.ENVOI.VIDEO: 0x03,
+    MessageType.RECEPTION.IMAGE: 0x11,
+    MessageType.RECEPTION.AUDIO: 0x12,
+    MessageType.RECEPTION.VIDEO: 0x13,
+    MessageType.TRANSFER.CHUNK: 0x20,
+    MessageType.MEDIA.DATA: 0x21,
+}
+BINARY_TYPES_BY_CODE = {code: message_type for message_type, code in BINARY_TYPES.items()}
+
+# Préfixes historiques des médias base64 dans le JSON
+MEDIA_PREFIXES = {
+    MessageType.ENVOI.IMAGE: "IMG:",
+    MessageType.ENVOI.AUDIO: "AUDIO:",
+    MessageType.ENVOI.VIDEO: "VIDEO:",
+    MessageType.RECEPTION.IMAGE: "IMG:",
+    MessageType.RECEPTION.AUDIO: "AUDIO:",
+    MessageType.RECEPTION.VIDEO: "VIDEO:",
+}
+
+RECEPTION_FOR = {
+    MessageType.ENVOI.TEXT: MessageType.RECEPTION.TEXT,
+    MessageType.ENVOI.IMAGE: MessageType.RECEPTION.IMAGE,
+    MessageType.ENVOI.AUDIO: MessageType.RECEPTION.AUDIO,
+    MessageType.ENVOI.VIDEO: MessageType.RECEPTION.VIDEO,
+}
+
+
+# Au-delà, un message JSON reçu n'est décodé que jusqu'à son en-tête : la value
+# reste une portion du texte reçu, décodée seulement si on la lit
+LAZY_THRESHOLD = 4 * 1024
+
+_UNPARSED = object()
+_DECODER = JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Début d'un message JSON tel que l'écrivent Message et les clients : le type s'y lit sans décoder
+_TYPE_PREFIX = re.compile(r'[ \t\n\r]*\{[ \t\n\r]*"message_type"[ \t\n\r]*:[ \t\n\r]*"([A-Za-z_]+)"')
+_TYPE_PREFIX_SIZE = 128
+
+
+def _skip_whitespace(text, index):
+    return _WHITESPACE.match(text, index).end()
+
+
+def _string_end(text, index):
+    """Fin (exclue) de la chaîne JSON qui commence en text[index], sans la décoder"""
+    end = index + 1
+    while True:
+        end = text.find('"', end)
+        if end < 0:
+            raise ValueError("Chaîne JSON non terminée")
+        # guillemet échappé s'il suit un nombre impair de backslashes
+        backslash = end - 1
+        while text[backslash] == "\\":
+            backslash -= 1
+        if (end - backslash) % 2:
+            return end + 1
+        end += 1
+
+
+def _scan_object(text, index, header, depth):
+    """Parcourt un objet JSON : garde message_type / emitter / receiver, repère la value sans la décoder"""
+    if text[index] != "{":
+        raise ValueError("Objet JSON attendu")
+    index = _skip_whitespace(text, index + 1)
+    if text[index] == "}":
+        return index + 1
+    while True:
+        if text[index] != '"':
+            raise ValueError("Clé JSON attendue")
+        key, index = scanstring(text, index + 1)
+        index = _skip_whitespace(text, index)
+        if text[index] != ":":
+            raise ValueError("':' attendu")
+        index = _skip_whitespace(text, index + 1)
+        if depth == 0 and key == "data":
+            index = _scan_object(text, index, header, 1)
+        elif depth == 1 and key == "value":
+            start = index
+            if text[index] == '"':
+                index = _string_end(text, index)
+            else:
+                header["parsed"], index = _DECODER.raw_decode(text, index)
+            header["value"] = (start, index)
+        elif text[index] == '"':
+            # chaîne courte (en-tête) : décodée ; les autres clés sont ignorées comme avant
+            value, index = scanstring(text, index + 1)
+            header[(depth, key)] = value
+        else:
+            header[(depth, key)], index = _DECODER.raw_decode(text, index)
+        index = _skip_whitespace(text, index)
+        if text[index] == "}":
+            return index + 1
+        if text[index] != ",":
+            raise ValueError("',' attendu")
+        index = _skip_whitespace(text, index + 1)
+
+
+def _json_bytes(data):
+    payload = JSON.encode(data)
+    return payload if isinstance(payload, bytes) else payload.encode("utf-8")
+
 
 class Message:
+    # raw / span : texte JSON reçu et position de la value dedans (message décodé paresseusement)
+    __slots__ = ("message_type", "emitter", "receiver", "_value", "_raw", "_span")
+
     def __init__(self, message_type: MessageType, value, emitter, receiver=None):
         self.message_type = message_type
-        self.value = value
+        self._value = value
         self.emitter = emitter
         self.receiver = receiver
+        self._raw = None
+        self._span = None
+
+    @property
+    def value(self):
+        if self._value is _UNPARSED:
+            start, end = self._span
+            self._value = JSON.decode(self._raw[start:end])
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._raw = None
+        self._span = None
+
+    def parsed_value(self, default=None):
+        """Value si elle est déjà décodée, default sinon (sans déclencher le décodage)"""
+        return default if self._value is _UNPARSED else self._value
+
+    def value_size(self):
+        """Taille de la value (caractères, octets ou éléments) sans la décoder"""
+        if self._value is _UNPARSED:
+            start, end = self._span
+            # chaîne JSON : sans les guillemets ; les échappements sont comptés tels quels
+            return end - start - 2 if self._raw[start] == '"' else end - start
+        try:
+            return len(self._value)
+        except TypeError:
+            return None
+
+    def forward(self, message_type, receiver=None):
+        """Copie retypée (ENVOI -> RECEPTION) qui garde la value telle que reçue, pour la recopier à l'envoi"""
+        message = Message(message_type, self._value, self.emitter, self.receiver if receiver is None else receiver)
+        message._raw = self._raw
+        message._span = self._span
+        return message
 
     @staticmethod
     def default_message():
         return Message(MessageType.DECLARATION, "System", "This is a default message", "All")
 
     @staticmethod
-    def from_json(json_data):
-        data = json.loads(json_data)
+    def from_dict(data):
         message_type = data['message_type']
         emitter = data['data']['emitter']
         receiver = data['data'].get('receiver', None)
         value = data['data']['value']
         return Message(message_type, value, emitter, receiver)
 
-    def to_json(self):
-        data = {
+    def to_dict(self):
+        return {
             'message_type': self.message_type,
             'data': {
                 'emitter': self.emitter,
@@ -58,7 +249,107 @@ class Message:
             }
         }
 
-        return json.dumps(data)
+    @staticmethod
+    def from_json(json_data):
+        if isinstance(json_data, str) and len(json_data) > LAZY_THRESHOLD:
+            message = Message.from_json_header(json_data)
+            if message is not None:
+                return message
+        return Message.from_dict(JSON.decode(json_data))
+
+    @staticmethod
+    def from_json_header(text):
+        """Décode l'en-tête seulement ; None si le document n'a pas la forme attendue"""
+        header = {}
+        try:
+            end = _scan_object(text, _skip_whitespace(text, 0), header, 0)
+        except (ValueError, IndexError):
+            return None
+        message_type = header.get((0, "message_type"))
+        emitter = header.get((1, "emitter"))
+        if "value" not in header or not isinstance(message_type, str) or (1, "emitter") not in header:
+            return None
+        if text[_skip_whitespace(text, end):]:
+            return None
+        message = Message(message_type, header.get("parsed", _UNPARSED), emitter, header.get((1, "receiver")))
+        message._raw = text
+        message._span = header["value"]
+        return message
+
+    def to_json(self):
+        payload = self.encode(JSON)
+        return payload if isinstance(payload, str) else payload.decode("utf-8")
+
+    def encode(self, codec=JSON):
+        """Payload de trame pour ce codec (str ou bytes) ; l'opcode est codec.opcode"""
+        if codec is JSON and self._raw is not None:
+            return self._splice()
+        return codec.encode(self.to_dict())
+
+    def _splice(self):
+        """JSON sortant construit autour de la value reçue, recopiée sans être décodée ni réencodée"""
+        start, end = self._span
+        return b"".join((
+            b'{"message_type":', _json_bytes(self.message_type),
+            b',"data":{"emitter":', _json_bytes(self.emitter),
+            b',"receiver":', _json_bytes(self.receiver),
+            b',"value":', self._raw[start:end].encode("utf-8"), b"}}",
+        ))
+
+    @staticmethod
+    def from_frame(data):
+        """Décode une trame reçue : JSON (str), codec binaire négocié ou média binaire"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            if is_codec_frame(data):
+                return Message.from_dict(decode_frame(data))
+            return Message.from_binary(data)
+        return Message.from_json(data)
+
+    @staticmethod
+    def peek_type(data):
+        """Type d'une trame reçue lu dans ses premiers octets, sans la décoder ; None s'il n'y est pas"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            if not data or is_codec_frame(data):
+                return None
+            return BINARY_TYPES_BY_CODE.get(data[0])
+        match = _TYPE_PREFIX.match(data, 0, _TYPE_PREFIX_SIZE)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def read_binary_header(data):
+        """Lit uniquement l'en-tête binaire : (message_type, emitter, receiver, offset du payload)"""
+        code, emitter_len, receiver_len, payload_len = BINARY_HEADER.unpack_from(data, 0)
+        offset = BINARY_HEADER.size
+        emitter = bytes(data[offset:offset + emitter_len]).decode("utf-8")
+        offset += emitter_len
+        receiver = bytes(data[offset:offset + receiver_len]).decode("utf-8")
+        offset += receiver_len
+        if len(data) - offset != payload_len:
+            raise ValueError("Trame binaire tronquée")
+        return BINARY_TYPES_BY_CODE[code], emitter, receiver, offset
+
+    @staticmethod
+    def from_binary(data):
+        message_type, emitter, receiver, offset = Message.read_binary_header(data)
+        return Message(message_type, memoryview(data)[offset:], emitter, receiver)
+
+    @staticmethod
+    def retype_binary(data, message_type):
+        """Change le type d'une trame binaire sur place (ENVOI -> RECEPTION) sans copier le payload"""
+        data[0] = BINARY_TYPES[message_type]
+        return data
+
+    def to_binary(self):
+        emitter = (self.emitter or "").encode("utf-8")
+        receiver = (self.receiver or "").encode("utf-8")
+        header = BINARY_HEADER.pack(BINARY_TYPES[self.message_type], len(emitter), len(receiver), len(self.value))
+        return b"".join((header, emitter, receiver, self.value))
+
+    def to_base64_json(self):
+        """Version JSON/base64 historique d'un message média binaire"""
+        encoded = base64.b64encode(self.value).decode("utf-8")
+        value = f"{MEDIA_PREFIXES[self.message_type]}{encoded}"
+        return Message(self.message_type, value, self.emitter, self.receiver).to_json()
 
 message = Message(MessageType.DECLARATION, emitter="System", receiver="All", value="This is a test message")
 messageRebuild = Message.from_json(message.to_json())
@@ -0,0 +1,252 @@
+import time
+
+from Message import MessageType
+
+# Histogrammes log-linéaires (façon HDR) : 2**SUB_BITS sous-seaux par puissance de 2,
+# soit une précision relative de 1/16 (~6 %) de la nanoseconde à l'heure
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+BUCKETS = (64 - SUB_BITS + 1) << SUB_BITS
+
+KINDS = {
+    MessageType.ENVOI.TEXT: "text",
+    MessageType.RECEPTION.TEXT: "text",
+    MessageType.ENVOI.IMAGE: "image",
+    MessageType.RECEPTION.IMAGE: "image",
+    MessageType.ENVOI.AUDIO: "audio",
+    MessageType.RECEPTION.AUDIO: "audio",
+    MessageType.ENVOI.VIDEO: "video",
+    MessageType.RECEPTION.VIDEO: "video",
+    MessageType.TRANSFER.CHUNK: "transfer",
+    MessageType.MEDIA.DATA: "media",
+}
+COUNTERS = {
+    "connects": "Connexions acceptées",
+    "disconnects": "Connexions fermées",
+    "evictions": "Clients coupés par le keep-alive",
+    "unknown_receiver": "Messages pour un destinataire introuvable",
+    "shed": "Médias différés par le contrôle d'admission (serveur chargé)",
+}
+# Relevés fournis par WSServer à chaque snapshot
+GAUGES = {
+    "clients": "Clients déclarés",
+    "queue_frames": "Trames en attente dans les files d'envoi",
+    "queue_bytes": "Octets en attente dans les files d'envoi",
+    "queue_depth_max": "Profondeur de la file d'envoi la plus chargée",
+}
+
+# Bornes "le" des histogrammes exportés pour Prometheus
+ROUTING_BOUNDS = tuple(float(f"{m}e{e}") for e in range(-6, 1) for m in (1, 2.5, 5))  # secondes, 1 µs -> 5 s
+FANOUT_BOUNDS = tuple(m * 10 ** e for e in range(0, 5) for m in (1, 2, 5)) + (100000,)
+
+
+class Histogram:
+    """Compteurs par seau log-linéaire : record() ne fait qu'un calcul d'indice et deux additions"""
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+    def record(self, value):
+        """Ajoute une valeur entière positive (nanosecondes, octets, clients...)"""
+        if value < SUB_COUNT:
+            index = value
+        else:
+            shift = value.bit_length() - SUB_BITS - 1
+            index = ((shift + 1) << SUB_BITS) + (value >> shift) - SUB_COUNT
+        self.counts[index] += 1
+        self.total += value
+
+    def snapshot(self):
+        buckets = {index: count for index, count in enumerate(self.counts) if count}
+        return {"buckets": buckets, "count": sum(buckets.values()), "sum": self.total}
+
+
+class RoutingStats(Histogram):
+    """Temps de routage (ns) des trames d'un type, et leurs octets"""
+
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        super().__init__()
+        self.bytes = 0
+
+
+def bucket_bounds(index):
+    """Valeurs [basse, haute[ d'un seau"""
+    if index < SUB_COUNT:
+        return index, index + 1
+    shift = (index >> SUB_BITS) - 1
+    mantissa = (index & (SUB_COUNT - 1)) + SUB_COUNT
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+def percentile(snapshot, pct):
+    """Plus grande valeur du seau qui contient le percentile pct d'un snapshot d'histogramme ; None s'il est vide"""
+    if not snapshot["count"]:
+        return None
+    rank = snapshot["count"] * pct / 100.0
+    seen = 0
+    for index, count in sorted((int(index), count) for index, count in snapshot["buckets"].items()):
+        seen += count
+        if seen >= rank:
+            return bucket_bounds(index)[1] - 1
+    return None
+
+
+class Metrics:
+    """
+    Compteurs et histogrammes du serveur, mis à jour sur le chemin de routage.
+
+    Une recherche de dict et quelques additions d'entiers par message, sans
+    verrou (une mise à jour concurrente perdue de temps en temps est acceptée) :
+    les trames reçues sont comptées par leur histogramme de temps de routage,
+    les octets par type, et regroupés par nature (texte, image...) seulement
+    dans snapshot(), le JSON envoyé au dashboard (ADMIN_METRICS) que
+    render_prometheus() met au format texte de /metrics.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.routing = {}        # type -> RoutingStats
+        self.outgoing = {}       # type -> [trames, octets]
+        self.fanout_sizes = {}   # type -> Histogram du nombre de destinataires par diffusion
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def message_in(self, message_type, size, elapsed_ns):
+        """Trame reçue et routée en elapsed_ns"""
+        stats = self.routing.get(message_type)
+        if stats is None:
+            stats = self.routing[message_type] = RoutingStats()
+        # Histogram.record() en ligne : un appel de moins par message
+        if elapsed_ns < SUB_COUNT:
+            index = elapsed_ns
+        else:
+            shift = elapsed_ns.bit_length() - SUB_BITS - 1
+            index = ((shift + 1) << SUB_BITS) + (elapsed_ns >> shift) - SUB_COUNT
+        stats.counts[index] += 1
+        stats.total += elapsed_ns
+        stats.bytes += size
+
+    def message_out(self, message_type, size, recipients=1):
+        """Trame de size octets envoyée à recipients clients"""
+        stats = self.outgoing.get(message_type)
+        if stats is None:
+            stats = self.outgoing[message_type] = [0, 0]
+        stats[0] += recipients
+        stats[1] += size * recipients
+
+    def fanout(self, message_type, size, recipients):
+        """Diffusion d'une même trame à recipients clients"""
+        self.message_out(message_type, size, recipients)
+        histogram = self.fanout_sizes.get(message_type)
+        if histogram is None:
+            histogram = self.fanout_sizes[message_type] = Histogram()
+        histogram.record(recipients)
+
+    def incr(self, name):
+        self.counters[name] += 1
+
+    def snapshot(self, gauges=None):
+        routing = list(self.routing.items())
+        outgoing = [(message_type, list(stats)) for message_type, stats in list(self.outgoing.items())]
+        bytes_in, bytes_out = {}, {}
+        for message_type, stats in routing:
+            kind = KINDS.get(message_type, "other")
+            bytes_in[kind] = bytes_in.get(kind, 0) + stats.bytes
+        for message_type, (_, size) in outgoing:
+            kind = KINDS.get(message_type, "other")
+            bytes_out[kind] = bytes_out.get(kind, 0) + size
+        return {
+            "timestamp": time.time(),
+            "uptime_s": round(time.time() - self.started, 3),
+            "counters": dict(self.counters),
+            "frames_out": {message_type: frames for message_type, (frames, _) in outgoing},
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "routing_ns": {message_type: stats.snapshot() for message_type, stats in routing},
+            "fanout_clients": {message_type: h.snapshot() for message_type, h in list(self.fanout_sizes.items())},
+            "gauges": gauges or {},
+        }
+
+    def summary(self):
+        """Trames reçues et p50 / p99 / p999 du routage par type, en µs (commande metrics)"""
+        summary = {}
+        for message_type, histogram in list(self.routing.items()):
+            snapshot = histogram.snapshot()
+            if not snapshot["count"]:
+                # entrée créée par un autre thread qui n'y a pas encore enregistré de trame
+                continue
+            summary[message_type] = {
+                "frames": snapshot["count"],
+                **{name: round(percentile(snapshot, pct) / 1000, 1) for name, pct in (("p50_us", 50), ("p99_us", 99), ("p999_us", 99.9))},
+            }
+        return summary
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, labels, snapshot, bounds, scale=1.0):
+    """Seaux cumulés aux bornes Prometheus ; un seau HDR compte sous la première borne qui contient sa valeur haute"""
+    buckets = sorted((bucket_bounds(int(index))[1] - 1, count) for index, count in snapshot["buckets"].items())
+    lines = []
+    seen = 0
+    position = 0
+    for bound in bounds:
+        while position < len(buckets) and buckets[position][0] * scale <= bound:
+            seen += buckets[position][1]
+            position += 1
+        lines.append(f"{name}_bucket{_labels(**labels, le=repr(float(bound)))} {seen}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {snapshot['count']}")
+    lines.append(f"{name}_sum{_labels(**labels)} {round(snapshot['sum'] * scale, 9)}")
+    lines.append(f"{name}_count{_labels(**labels)} {snapshot['count']}")
+    return lines
+
+
+def render_prometheus(snapshots):
+    """Format texte Prometheus des snapshots {serveur: snapshot} (un par worker en cluster)"""
+    families = {}
+
+    def add(name, kind, help_text, *lines):
+        families.setdefault(name, (kind, help_text, []))[2].extend(lines)
+
+    for server, snapshot in sorted(snapshots.items()):
+        for message_type, histogram in snapshot.get("routing_ns", {}).items():
+            labels = {"server": server, "type": message_type}
+            add("wsserver_frames_in_total", "counter", "Trames reçues par type de message",
+                f"wsserver_frames_in_total{_labels(**labels)} {histogram['count']}")
+            add("wsserver_routing_seconds", "histogram", "Temps de traitement d'une trame reçue",
+                *_histogram_lines("wsserver_routing_seconds", labels, histogram, ROUTING_BOUNDS, 1e-9))
+        for message_type, count in snapshot.get("frames_out", {}).items():
+            add("wsserver_frames_out_total", "counter", "Trames envoyées par type de message (une par destinataire)",
+                f"wsserver_frames_out_total{_labels(server=server, type=message_type)} {count}")
+        for direction, help_text in (("in", "Octets reçus par nature de contenu"), ("out", "Octets envoyés par nature de contenu")):
+            for kind, count in snapshot.get(f"bytes_{direction}", {}).items():
+                add(f"wsserver_bytes_{direction}_total", "counter", help_text,
+                    f"wsserver_bytes_{direction}_total{_labels(server=server, kind=kind)} {count}")
+        for message_type, histogram in snapshot.get("fanout_clients", {}).items():
+            add("wsserver_fanout_clients", "histogram", "Destinataires par diffusion",
+                *_histogram_lines("wsserver_fanout_clients", {"server": server, "type": message_type}, histogram, FANOUT_BOUNDS))
+        for name, count in snapshot.get("counters", {}).items():
+            add(f"wsserver_{name}_total", "counter", COUNTERS.get(name, name), f"wsserver_{name}_total{_labels(server=server)} {count}")
+        for name, value in snapshot.get("gauges", {}).items():
+            add(f"wsserver_{name}", "gauge", GAUGES.get(name, name), f"wsserver_{name}{_labels(server=server)} {value}")
+        add("wsserver_uptime_seconds", "gauge", "Temps depuis le démarrage du serveur",
+            f"wsserver_uptime_seconds{_labels(server=server)} {snapshot.get('uptime_s', 0)}")
+        add("wsserver_report_timestamp_seconds", "gauge", "Date du relevé (le dashboard les reçoit toutes les stats_interval secondes)",
+            f"wsserver_report_timestamp_seconds{_labels(server=server)} {snapshot.get('timestamp', 0)}")
+
+    output = []
+    for name, (kind, help_text, lines) in families.items():
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
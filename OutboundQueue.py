@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import deque
+
+from Codecs import CODEC_TAGS
+from WSFrame import OPCODE, OPCODE_BINARY, PAYLOAD_LEN
+
+# Politiques quand la file d'un client est pleine
+DROP_OLDEST_MEDIA = "drop_oldest_media"   # jette les médias les plus anciens ; plein de texte seul, déconnecte
+DISCONNECT = "disconnect"                 # ferme la connexion du client trop lent
+BLOCK = "block"                           # bloque l'émetteur jusqu'à un délai, puis déconnecte
+POLICIES = (DROP_OLDEST_MEDIA, DISCONNECT, BLOCK)
+
+# Au-delà, une trame texte est considérée comme un média (base64 dans le JSON)
+MEDIA_TEXT_THRESHOLD = 64 * 1024
+# Codes binaires (Message.BINARY_TYPES) des médias ; les morceaux TRANSFER_CHUNK ont leur propre fenêtre
+MEDIA_BINARY_CODES = (0x01, 0x02, 0x03, 0x11, 0x12, 0x13)
+
+
+def payload_offset(frame):
+    length = frame[1] & PAYLOAD_LEN
+    if length == 126:
+        return 4
+    if length == 127:
+        return 10
+    return 2
+
+
+def is_media_frame(frame):
+    if frame[0] & OPCODE == OPCODE_BINARY:
+        offset = payload_offset(frame)
+        if len(frame) > offset and frame[offset] in CODEC_TAGS:
+            # message msgpack/cbor : même règle que le JSON texte
+            return len(frame) > MEDIA_TEXT_THRESHOLD
+        return len(frame) > offset and frame[offset] in MEDIA_BINARY_CODES
+    return len(frame) > MEDIA_TEXT_THRESHOLD
+
+
+class OutboundQueue:
+    """
+    File d'envoi bornée (en trames et en octets) d'une connexion, vidée par son propre writer.
+
+    put() ne fait jamais d'I/O : un destinataire lent ne bloque plus le thread
+    de l'émetteur, sauf avec la politique BLOCK et au plus block_timeout secondes.
+    """
+
+    def __init__(self, max_frames=1024, max_bytes=16 * 1024 * 1024, policy=DROP_OLDEST_MEDIA, block_timeout=2.0, on_overflow=None, on_put=None, on_drop=None, budget=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Politique inconnue '{policy}', choix: {', '.join(POLICIES)}")
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.on_overflow = on_overflow
+        self.on_put = on_put
+        # on_drop(frame) : appelé hors verrou pour chaque trame jetée par la politique
+        self.on_drop = on_drop
+        # budget : compteur partagé par toutes les files (AdmissionControl), prévenu
+        # sous le verrou de chaque trame mise en file puis écrite ou jetée
+        self.budget = budget
+
+        self.frames = deque()
+        self.bytes = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "dropped": 0,
+            "dropped_bytes": 0,
+            "max_depth": 0,
+            "blocked_s": 0.0,
+            "overflow_disconnect": False,
+        }
+
+    def _full(self, size):
+        return self.frames and (len(self.frames) >= self.max_frames or self.bytes + size > self.max_bytes)
+
+    def _drop(self, size):
+        self.stats["dropped"] += 1
+        self.stats["dropped_bytes"] += size
+
+    def _drop_oldest_media(self, size, dropped):
+        while self._full(size):
+            for i, (queued, media) in enumerate(self.frames):
+                if media:
+                    del self.frames[i]
+                    self.bytes -= len(queued)
+                    if self.budget:
+                        self.budget.remove(queued, media)
+                    self._drop(len(queued))
+                    dropped.append(queued)
+                    break
+            else:
+                return
+
+    def _overflow(self, size):
+        self._drop(size)
+        self.stats["overflow_disconnect"] = True
+        self.closed = True
+        self._clear()
+        self.cond.notify_all()
+
+    def _clear(self):
+        if self.budget:
+            for frame, media in self.frames:
+                self.budget.remove(frame, media)
+        self.frames.clear()
+        self.bytes = 0
+
+    def put(self, frame, can_block=True):
+        """Ajoute une trame encodée ; False si elle a été jetée"""
+        size = len(frame)
+        media = is_media_frame(frame)
+        overflow = False
+        accepted = True
+        dropped = []
+        with self.cond:
+            if self.closed:
+                return False
+            if self._full(size):
+                if self.policy == DROP_OLDEST_MEDIA:
+                    self._drop_oldest_media(size, dropped)
+                    if self._full(size) and media:
+                        self._drop(size)
+                        dropped.append(frame)
+                        accepted = False
+                    elif self._full(size):
+                        # plus aucun média à jeter : la borne vaut aussi pour le texte et le contrôle
+                        self._overflow(size)
+                        overflow = True
+                elif self.policy == BLOCK and can_block:
+                    started = time.perf_counter()
+                    deadline = started + self.block_timeout
+                    while self._full(size) and not self.closed:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        self.cond.wait(remaining)
+                    self.stats["blocked_s"] += time.perf_counter() - started
+                    if self.closed:
+                        return False
+                    if self._full(size):
+                        self._overflow(size)
+                        overflow = True
+                else:
+                    self._overflow(size)
+                    overflow = True
+            if accepted and not overflow:
+                self.frames.append((frame, media))
+                self.bytes += size
+                if self.budget:
+                    self.budget.add(frame, media)
+                self.stats["enqueued"] += 1
+                self.stats["max_depth"] = max(self.stats["max_depth"], len(self.frames))
+                self.cond.notify_all()
+        if self.on_drop:
+            for queued in dropped:
+                self.on_drop(queued)
+        if overflow:
+            if self.on_overflow:
+                self.on_overflow()
+            return False
+        if not accepted:
+            return False
+        if self.on_put:
+            self.on_put()
+        return True
+
+    def get(self, timeout=None):
+        """Prochaine trame (bloquant) ; None si la file est fermée ou au timeout"""
+        with self.cond:
+            while not self.frames and not self.closed:
+                if not self.cond.wait(timeout):
+                    return None
+            return self._pop()
+
+    def get_nowait(self):
+        with self.cond:
+            return self._pop()
+
+    def _pop(self):
+        if not self.frames:
+            return None
+        frame, media = self.frames.popleft()
+        self.bytes -= len(frame)
+        if self.budget:
+            self.budget.remove(frame, media)
+        self.stats["sent"] += 1
+        self.cond.notify_all()
+        return frame
+
+    def close(self):
+        """Ferme la file ; les trames encore en attente sont abandonnées (connexion terminée)"""
+        with self.cond:
+            self.closed = True
+            self._clear()
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                "depth": len(self.frames),
+                "bytes": self.bytes,
+                "policy": self.policy,
+                **self.stats,
+                "blocked_s": round(self.stats["blocked_s"], 3),
+            }
@@ -0,0 +1,338 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+DIRECTORY = "outbox"
+TTL = 24 * 3600                          # un message non livré après ce délai est abandonné
+MAX_BYTES = 64 * 1024 * 1024             # par destinataire : au-delà, les plus anciens sont évincés
+MAX_TOTAL_BYTES = 1024 * 1024 * 1024     # toutes boîtes : au-delà, les nouveaux messages sont refusés
+SYNC_INTERVAL = 0.05                     # écriture + fsync groupés de tout ce qui a été mis en attente
+SWEEP_INTERVAL = 60.0                    # recherche des messages expirés
+# Noms qui se sont déjà déclarés, un par ligne (JSON) : seuls leurs messages sont gardés
+KNOWN_FILE = "known.jsonl"
+
+TEXT = 0    # RECEPTION_* encodé en JSON
+MEDIA = 1   # trame média binaire
+
+# Fichier d'une boîte : [magic 4][taille du nom 2][nom], puis des enregistrements
+# [expiration 8][type 1][taille émetteur 2][taille payload 4][émetteur][payload]
+MAGIC = b"WSOB"
+FILE_HEADER = struct.Struct(">4sH")
+RECORD = struct.Struct(">dBHI")
+
+
+def _encode(expires, kind, emitter, payload):
+    emitter = (emitter or "").encode("utf-8")
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return b"".join((RECORD.pack(expires, kind, len(emitter), len(payload)), emitter, payload))
+
+
+def _read_header(f):
+    magic, name_len = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("fichier de boîte invalide")
+    return f.read(name_len).decode("utf-8")
+
+
+def _read_records(f):
+    """Enregistrements (expiration, type, émetteur, payload, taille) jusqu'à la fin ou une écriture tronquée"""
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        expires, kind, emitter_len, payload_len = RECORD.unpack(head)
+        emitter = f.read(emitter_len)
+        payload = f.read(payload_len)
+        if len(payload) < payload_len:
+            return
+        size = RECORD.size + emitter_len + payload_len
+        yield expires, kind, emitter.decode("utf-8") or None, payload.decode("utf-8") if kind == TEXT else payload, size
+
+
+class _Box:
+    """Messages en attente d'un destinataire : d'abord sur disque, puis pas encore écrits"""
+
+    __slots__ = ("name", "path", "entries", "skip", "pending", "bytes")
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.entries = deque()   # (expiration, taille) de chaque message, plus ancien d'abord
+        self.skip = 0            # messages en tête du fichier déjà évincés
+        self.pending = []        # enregistrements encodés, pas encore écrits
+        self.bytes = 0
+
+    def on_disk(self):
+        return len(self.entries) - len(self.pending)
+
+
+class Outbox:
+    """
+    Messages pour des destinataires hors ligne, gardés sur disque jusqu'à leur retour.
+
+    Une boîte par destinataire, un fichier en ajout seul : put() ne fait que
+    mettre l'enregistrement en mémoire, un thread l'écrit et fait un fsync
+    groupé toutes les sync_interval secondes. drain() vide la boîte d'un
+    client qui vient de se déclarer ; tant qu'elle n'est pas vide, holds()
+    indique qu'un nouveau message pour lui doit passer derrière les anciens.
+    Seuls les noms déjà déclarés (remember(), gardés sur disque) ont une
+    boîte : un nom inconnu reste une erreur de destinataire, pas une boîte.
+    """
+
+    def __init__(self, directory=DIRECTORY, ttl=TTL, max_bytes=MAX_BYTES, max_total_bytes=MAX_TOTAL_BYTES, sync_interval=SYNC_INTERVAL):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.sync_interval = sync_interval
+        self.boxes = {}
+        self.draining = set()
+        # noms déjà déclarés ; new_known : pas encore écrits dans KNOWN_FILE
+        self.known = set()
+        self.new_known = []
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        # écritures et lectures de fichiers, sans jamais bloquer put()
+        self.io_lock = threading.Lock()
+        self.running = False
+        self.stats = {"queued": 0, "delivered": 0, "expired": 0, "evicted": 0, "refused": 0, "syncs": 0}
+        if os.path.isdir(directory):
+            self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, hashlib.sha1(name.encode("utf-8")).hexdigest() + ".log")
+
+    def _load(self):
+        """Boîtes laissées par le process précédent ; une vidange interrompue est rejouée en entier"""
+        try:
+            with open(os.path.join(self.directory, KNOWN_FILE), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.known.add(json.loads(line))
+                    except ValueError:
+                        continue   # dernière ligne tronquée par un crash
+        except OSError:
+            pass
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith(".drain"):
+                self._recover(os.path.join(self.directory, filename))
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".log"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                with open(path, "rb") as f:
+                    box = _Box(_read_header(f), path)
+                    for expires, _, _, _, size in _read_records(f):
+                        box.entries.append((expires, size))
+            except (OSError, ValueError, struct.error, UnicodeDecodeError):
+                continue
+            box.bytes = sum(size for _, size in box.entries)
+            self.boxes[box.name] = box
+            self.known.add(box.name)
+            self.total_bytes += box.bytes
+        now = time.time()
+        for box in list(self.boxes.values()):
+            self._trim(box, now)
+            self._drop_if_empty(box)
+
+    def _recover(self, drain_path):
+        log_path = drain_path[:-len(".drain")] + ".log"
+        if not os.path.exists(log_path):
+            os.replace(drain_path, log_path)
+            return
+        # messages de la vidange interrompue d'abord, puis ceux arrivés après
+        with open(drain_path, "ab") as out, open(log_path, "rb") as f:
+            _read_header(f)
+            out.write(f.read())
+        os.replace(drain_path, log_path)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._sync_loop, daemon=True).start()
+
+    def remember(self, name):
+        """name vient de se déclarer : ses messages pourront attendre son retour"""
+        with self.lock:
+            if name in self.known:
+                return
+            self.known.add(name)
+            self.new_known.append(name)
+
+    def knows(self, name):
+        return name in self.known
+
+    def holds(self, name):
+        """True si des messages attendent name : un nouveau message doit passer derrière eux"""
+        return name in self.boxes or name in self.draining
+
+    def put(self, name, kind, payload, emitter=None, expires=None):
+        """Met un message en attente ; False si name ne s'est jamais déclaré ou si la place manque"""
+        expires = expires or time.time() + self.ttl
+        record = _encode(expires, kind, emitter, payload)
+        with self.lock:
+            if name not in self.known:
+                return False
+            if len(record) > self.max_bytes or self.total_bytes + len(record) > self.max_total_bytes:
+                self.stats["refused"] += 1
+                return False
+            box = self.boxes.get(name)
+            if box is None:
+                box = self.boxes[name] = _Box(name, self._path(name))
+            box.pending.append(record)
+            box.entries.append((expires, len(record)))
+            box.bytes += len(record)
+            self.total_bytes += len(record)
+            self.stats["queued"] += 1
+            self._trim(box, time.time())
+        return True
+
+    def _trim(self, box, now):
+        """Évince les messages expirés, puis les plus anciens tant que la boîte dépasse max_bytes"""
+        while box.entries and (box.entries[0][0] <= now or box.bytes > self.max_bytes):
+            # les messages sur disque précèdent ceux pas encore écrits
+            if box.on_disk():
+                box.skip += 1
+            else:
+                box.pending.pop(0)
+            expires, size = box.entries.popleft()
+            box.bytes -= size
+            self.total_bytes -= size
+            self.stats["expired" if expires <= now else "evicted"] += 1
+
+    def _drop_if_empty(self, box):
+        if box.entries:
+            return
+        self.boxes.pop(box.name, None)
+        try:
+            os.remove(box.path)
+        except OSError:
+            pass
+
+    def _sync_loop(self):
+        next_sweep = time.monotonic() + SWEEP_INTERVAL
+        while self.running:
+            time.sleep(self.sync_interval)
+            self.flush()
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + SWEEP_INTERVAL
+                self.sweep()
+
+    def flush(self):
+        """Écrit tous les messages en attente, un fichier et un fsync par boîte"""
+        with self.io_lock:
+            with self.lock:
+                writes = [(box.name, box.path, box.pending) for box in self.boxes.values() if box.pending]
+                for box in self.boxes.values():
+                    box.pending = []
+                known, self.new_known = self.new_known, []
+            if not writes and not known:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if known:
+                with open(os.path.join(self.directory, KNOWN_FILE), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(name) + "\n" for name in known))
+                    f.flush()
+                    os.fsync(f.fileno())
+            for name, path, records in writes:
+                with open(path, "ab") as f:
+                    if f.tell() == 0:
+                        encoded = name.encode("utf-8")
+                        f.write(FILE_HEADER.pack(MAGIC, len(encoded)) + encoded)
+                    f.write(b"".join(records))
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.stats["syncs"] += 1
+
+    def sweep(self):
+        """Retire les messages expirés et supprime les boîtes vides"""
+        with self.io_lock, self.lock:
+            now = time.time()
+            for box in list(self.boxes.values()):
+                self._trim(box, now)
+                self._drop_if_empty(box)
+
+    def start_drain(self, name):
+        """True si l'appelant doit vider la boîte de name (elle existe et personne ne le fait déjà)"""
+        with self.lock:
+            if name in self.draining or name not in self.boxes:
+                return False
+            self.draining.add(name)
+            return True
+
+    def drain(self, name, send):
+        """
+        Livre les messages de name, plus ancien d'abord : send(type, émetteur, payload).
+
+        À appeler depuis un thread de fond après start_drain(). Si send renvoie
+        False (destinataire reparti), le reste est remis en attente. Les messages
+        arrivés pendant la vidange sont livrés dans la même boucle. Un crash en
+        cours de vidange laisse le fichier .drain, rejoué au redémarrage.
+        """
+        delivered = 0
+        try:
+            while True:
+                with self.io_lock:
+                    with self.lock:
+                        box = self.boxes.pop(name, None)
+                        if box is None:
+                            return delivered
+                        self.total_bytes -= box.bytes
+                    drain_path = box.path[:-len(".log")] + ".drain"
+                    if os.path.exists(box.path):
+                        os.replace(box.path, drain_path)
+                records = self._records(box, drain_path)
+                for record in records:
+                    expires, kind, emitter, payload, _ = record
+                    if expires <= time.time():
+                        self.stats["expired"] += 1
+                        continue
+                    if not send(kind, emitter, payload):
+                        for expires, kind, emitter, payload, _ in (record, *records):
+                            self.put(name, kind, payload, emitter, expires)
+                        break
+                    delivered += 1
+                    self.stats["delivered"] += 1
+                else:
+                    records = None
+                try:
+                    os.remove(drain_path)
+                except OSError:
+                    pass
+                if records is not None:
+                    return delivered
+        finally:
+            with self.lock:
+                self.draining.discard(name)
+
+    @staticmethod
+    def _records(box, drain_path):
+        """Messages d'une boîte retirée : son fichier (moins les évincés), puis ceux pas encore écrits"""
+        if os.path.exists(drain_path):
+            with open(drain_path, "rb") as f:
+                _read_header(f)
+                for index, record in enumerate(_read_records(f)):
+                    if index >= box.skip:
+                        yield record
+        yield from _read_records(io.BytesIO(b"".join(box.pending)))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "recipients": len(self.boxes),
+                "known": len(self.known),
+                "messages": sum(len(box.entries) for box in self.boxes.values()),
+                "bytes": self.total_bytes,
+                "draining": len(self.draining),
+                **self.stats,
+            }
+
+    def close(self):
+        self.running = False
+        self.flush()
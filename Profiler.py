@@ -0,0 +1,179 @@
+import json
+import linecache
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+DIRECTORY = "profiles"
+DURATION = 10.0        # fenêtre par défaut
+MAX_DURATION = 120.0   # jamais plus : le serveur est ralenti pendant la fenêtre
+INTERVAL = 0.005       # un relevé des piles de tous les threads toutes les 5 ms
+TOP = 15               # fonctions et lignes d'allocation gardées dans le résumé
+MEMORY_FRAMES = 1      # profondeur des traces tracemalloc
+
+# Ligne en cours d'une frame de tête qui attend (sommeil, verrou, socket, file...) :
+# l'échantillon compte comme attente, pas comme travail
+_WAITING = re.compile(r"\b(sleep|wait|select|poll|accept|acquire|recv|recv_into|readinto|readline|input|join)\(")
+# Fonctions de tête qui bloquent quelle que soit la ligne relevée (selectors, threading...)
+_WAITING_FUNCTIONS = frozenset(("select", "poll", "wait", "accept", "acquire", "recv", "recv_into", "readinto", "join"))
+
+
+class Profiler:
+    """
+    Profilage à la demande pendant une fenêtre bornée.
+
+    Un thread relève les piles de tous les autres (sys._current_frames) toutes
+    les interval secondes et, si memory, tracemalloc compare la mémoire du
+    début et de la fin. En dehors d'une fenêtre rien ne tourne : ni thread,
+    ni hook, ni tracemalloc. Résultats dans directory : profile-<date>.folded
+    (piles repliées, lisibles par les outils de flame graph) et .json (résumé).
+    """
+
+    def __init__(self, directory=DIRECTORY, max_duration=MAX_DURATION, top=TOP):
+        self.directory = directory
+        self.max_duration = max_duration
+        self.top = top
+        self.lock = threading.Lock()
+        self.active = None   # paramètres de la fenêtre en cours
+        self.last = None     # résumé de la dernière fenêtre
+
+    def start(self, duration=DURATION, interval=INTERVAL, memory=True, on_done=None):
+        """Ouvre une fenêtre ; renvoie ses paramètres, None si une fenêtre est déjà en cours.
+
+        on_done(résumé) est appelé depuis le thread du profileur à la fin.
+        """
+        params = {
+            "duration": min(max(float(duration), 0.1), self.max_duration),
+            "interval": max(float(interval), 0.001),
+            "memory": bool(memory),
+            "started": time.time(),
+        }
+        with self.lock:
+            if self.active:
+                return None
+            self.active = params
+        threading.Thread(target=self._run, args=(params, on_done), daemon=True).start()
+        return params
+
+    def _run(self, params, on_done):
+        try:
+            summary = self._profile(params)
+        except Exception as exc:
+            summary = {**params, "error": str(exc)}
+        with self.lock:
+            self.active = None
+            self.last = summary
+        if on_done:
+            on_done(summary)
+
+    def _profile(self, params):
+        memory = params["memory"]
+        # tracemalloc déjà lancé par quelqu'un d'autre : on ne l'arrête pas à la fin
+        own_tracing = memory and not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start(MEMORY_FRAMES)
+        before = tracemalloc.take_snapshot() if memory else None
+
+        stacks = Counter()
+        labels = {}    # code -> "fonction (fichier:ligne)"
+        waiting = {}   # (code, ligne) -> la ligne attend
+        me = threading.get_ident()
+        ticks = 0
+        started = time.monotonic()
+        deadline = started + params["duration"]
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                leaf = (code, frame.f_lineno)
+                idle = waiting.get(leaf)
+                if idle is None:
+                    idle = waiting[leaf] = code.co_name in _WAITING_FUNCTIONS or bool(
+                        _WAITING.search(linecache.getline(code.co_filename, frame.f_lineno))
+                    )
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(label)
+                    frame = frame.f_back
+                stacks[(idle, tuple(reversed(stack)))] += 1
+            ticks += 1
+            time.sleep(params["interval"])
+        elapsed = time.monotonic() - started
+
+        summary = {
+            **params,
+            "elapsed_s": round(elapsed, 3),
+            "ticks": ticks,
+            **self._cpu_summary(stacks),
+        }
+        if memory:
+            summary["memory"] = self._memory_summary(before, tracemalloc.take_snapshot())
+            if own_tracing:
+                tracemalloc.stop()
+        summary["files"] = self._write(stacks, summary)
+        return summary
+
+    def _cpu_summary(self, stacks):
+        """Fonctions les plus vues en tête de pile (self) et dans la pile (total), hors attente"""
+        busy = [(stack, count) for (idle, stack), count in stacks.items() if not idle]
+        busy_samples = sum(count for _, count in busy)
+        own, total = Counter(), Counter()
+        for stack, count in busy:
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+
+        def ranked(counter):
+            return [
+                {"function": label, "samples": count, "pct": round(100.0 * count / busy_samples, 1)}
+                for label, count in counter.most_common(self.top)
+            ]
+
+        return {
+            "samples": sum(stacks.values()),
+            "busy_samples": busy_samples,
+            "top_self": ranked(own),
+            "top_total": ranked(total),
+        }
+
+    def _memory_summary(self, before, after):
+        """Lignes dont la mémoire allouée a le plus grossi pendant la fenêtre"""
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_kb": current // 1024,
+            "peak_kb": peak // 1024,
+            "top": [
+                {
+                    "where": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count_diff,
+                }
+                for stat in diff[:self.top]
+            ],
+        }
+
+    def _write(self, stacks, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S", time.localtime(summary["started"])))
+        files = {"folded": base + ".folded", "summary": base + ".json"}
+        with open(files["folded"], "w") as f:
+            for (idle, stack), count in stacks.most_common():
+                f.write(f"{'attente' if idle else 'actif'};{';'.join(stack)} {count}\n")
+        with open(files["summary"], "w") as f:
+            json.dump({**summary, "files": files}, f, indent=2)
+        return files
+
+    def snapshot(self):
+        with self.lock:
+            return {"active": dict(self.active) if self.active else None, "last": self.last}
@@ -0,0 +1,185 @@
+import threading
+import time
+
+from Message import MessageType
+
+HANDSHAKE_RATE = 500.0      # handshakes acceptés par seconde en régime établi
+HANDSHAKE_BURST = 200       # handshakes acceptés d'un coup avant d'étaler
+HANDSHAKE_MAX_WAIT = 10.0   # au-delà de cette attente, le handshake est refusé (503)
+
+# Budgets par client et par type de message : messages/s, rafale, octets/s, rafale d'octets.
+# "default" couvre les types absents (déclaration, SYS_MESSAGE, trames d'un codec...)
+QUOTAS = {
+    "default": {"rate": 50, "burst": 100, "bytes_rate": 1024 * 1024, "bytes_burst": 4 * 1024 * 1024},
+    MessageType.ENVOI.TEXT: {"rate": 20, "burst": 40, "bytes_rate": 64 * 1024, "bytes_burst": 256 * 1024},
+    MessageType.ENVOI.IMAGE: {"rate": 2, "burst": 10, "bytes_rate": 4 * 1024 * 1024, "bytes_burst": 16 * 1024 * 1024},
+    MessageType.ENVOI.AUDIO: {"rate": 2, "burst": 10, "bytes_rate": 4 * 1024 * 1024, "bytes_burst": 16 * 1024 * 1024},
+    MessageType.ENVOI.VIDEO: {"rate": 1, "burst": 3, "bytes_rate": 8 * 1024 * 1024, "bytes_burst": 32 * 1024 * 1024},
+    MessageType.TRANSFER.CHUNK: {"rate": 200, "burst": 400, "bytes_rate": 16 * 1024 * 1024, "bytes_burst": 64 * 1024 * 1024},
+}
+# Jamais limités : un ACK refusé ferait renvoyer des accusés « non reçu »
+EXEMPT = (MessageType.ACK,)
+REPORT_INTERVAL = 1.0       # au plus un WARNING et un ADMIN_THROTTLE par client et par intervalle
+
+
+class TokenBucket:
+    """
+    Seau à jetons : rate jetons par seconde, au plus burst en réserve.
+
+    take() consomme tout de suite ou échoue ; reserve() consomme même à
+    découvert et renvoie l'attente avant laquelle le jeton sera réellement
+    disponible, ce qui étale une rafale au lieu de la refuser.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def take(self, count=1):
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens < count:
+                return False
+            self.tokens -= count
+            return True
+
+    def spend(self, count):
+        """Consomme count jetons, à découvert si besoin, tant que la réserve n'est pas vide"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens <= 0:
+                return False
+            self.tokens -= count
+            return True
+
+    def reserve(self, max_wait):
+        """Attente (s) avant d'utiliser le jeton réservé ; None si elle dépasserait max_wait"""
+        with self.lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class HandshakeLimiter:
+    """
+    Admission des handshakes WebSocket pendant une vague de reconnexions.
+
+    Les premiers passent tout de suite (burst), les suivants sont retardés pour
+    ne pas dépasser rate par seconde ; au-delà de max_wait d'attente, le serveur
+    répond 503 avec Retry-After au lieu de laisser la file grossir.
+    """
+
+    def __init__(self, rate=HANDSHAKE_RATE, burst=HANDSHAKE_BURST, max_wait=HANDSHAKE_MAX_WAIT):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.stats = {"admitted": 0, "delayed": 0, "rejected": 0, "wait_ms": 0.0, "max_wait_ms": 0.0}
+
+    def admit(self):
+        """Attente avant de répondre au handshake ; None pour le refuser"""
+        wait = self.bucket.reserve(self.max_wait)
+        with self.lock:
+            if wait is None:
+                self.stats["rejected"] += 1
+                return None
+            self.stats["admitted"] += 1
+            if wait > 0:
+                self.stats["delayed"] += 1
+                self.stats["wait_ms"] += wait * 1000
+                self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait * 1000)
+        return wait
+
+    def retry_after(self):
+        """Secondes à annoncer dans Retry-After"""
+        return max(1, int(self.max_wait))
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["wait_ms"] = round(stats["wait_ms"], 1)
+        stats["max_wait_ms"] = round(stats["max_wait_ms"], 1)
+        return stats
+
+
+class ClientQuotas:
+    """
+    Seaux à jetons par client et par type de message, en nombre et en octets.
+
+    check() est appelé avant tout décodage, avec le type lu en tête de trame
+    et sa taille : un client qui dépasse son budget voit ses messages jetés
+    sans coûter de parsing. Le seau d'octets peut passer à découvert (un gros
+    média passe s'il reste du budget, les suivants attendent qu'il soit
+    remboursé). Les refus sont comptés par client, par type et par raison.
+    """
+
+    def __init__(self, limits=None, report_interval=REPORT_INTERVAL):
+        self.limits = {key: dict(value) for key, value in QUOTAS.items()}
+        for key, value in (limits or {}).items():
+            self.limits[key] = {**self.limits.get(key, QUOTAS["default"]), **value}
+        self.report_interval = report_interval
+        self.buckets = {}
+        self.throttled = {}
+        self.reported = {}
+        self.lock = threading.Lock()
+        self.stats = {"checked": 0, "throttled": 0}
+
+    def _buckets(self, client, key):
+        per_client = self.buckets.get(client["id"])
+        if per_client is None:
+            per_client = self.buckets[client["id"]] = {}
+        pair = per_client.get(key)
+        if pair is None:
+            limits = self.limits[key]
+            pair = per_client[key] = (
+                TokenBucket(limits["rate"], limits["burst"]),
+                TokenBucket(limits["bytes_rate"], limits["bytes_burst"]),
+            )
+        return pair
+
+    def check(self, client, message_type, size):
+        """None si le message passe ; sinon (raison, à signaler ?) — au plus un signalement par intervalle"""
+        if message_type in EXEMPT:
+            return None
+        key = message_type if message_type in self.limits else "default"
+        with self.lock:
+            self.stats["checked"] += 1
+            messages, octets = self._buckets(client, key)
+            if not messages.take(1):
+                reason = "messages"
+            elif not octets.spend(size):
+                reason = "bytes"
+            else:
+                return None
+            self.stats["throttled"] += 1
+            counts = self.throttled.setdefault(client["id"], {}).setdefault(key, {"messages": 0, "bytes": 0})
+            counts[reason] += 1
+            now = time.monotonic()
+            report = now - self.reported.get(client["id"], float("-inf")) >= self.report_interval
+            if report:
+                self.reported[client["id"]] = now
+            return reason, report
+
+    def counters(self, client):
+        """Messages refusés de ce client, par type et par raison"""
+        with self.lock:
+            return {key: dict(counts) for key, counts in self.throttled.get(client["id"], {}).items()}
+
+    def forget(self, client):
+        with self.lock:
+            self.buckets.pop(client["id"], None)
+            self.throttled.pop(client["id"], None)
+            self.reported.pop(client["id"], None)
+
+    def snapshot(self):
+        with self.lock:
+            return {**self.stats, "clients_throttled": len(self.throttled), "limits": self.limits}
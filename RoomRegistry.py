@@ -0,0 +1,158 @@
+import re
+import threading
+
+ROOM_PREFIX = "#"
+MAX_ROOMS_PER_CLIENT = 100
+
+# "#" puis 1 à 64 lettres, chiffres, "_", "-" ou "." : pas de ":" (séparateur des commandes console)
+_ROOM_NAME = re.compile(r"#[\w.-]{1,64}")
+
+
+def is_room_name(name):
+    return isinstance(name, str) and name.startswith(ROOM_PREFIX)
+
+
+def room_name(value):
+    """Nom de salon normalisé ("dev" -> "#dev") depuis une value ROOM_* ; None s'il est invalide"""
+    if isinstance(value, dict):
+        value = value.get("room")
+    if not isinstance(value, str):
+        return None
+    name = value.strip()
+    if not name.startswith(ROOM_PREFIX):
+        name = ROOM_PREFIX + name
+    return name if _ROOM_NAME.fullmatch(name) else None
+
+
+class RoomRegistry:
+    """
+    Salons nommés ("#dev") et leurs membres, indexés dans les deux sens.
+
+    Un message de salon ne parcourt que ses membres : la liste de ses clients
+    est un instantané mis en cache jusqu'à la prochaine arrivée / départ dans
+    ce salon seulement, les milliers d'autres gardent le leur. L'appartenance
+    suit la connexion (id websocket_server) : elle disparaît à la déconnexion,
+    et un salon vide est fermé. En cluster, remote garde les salons ouverts
+    sur les autres workers, pour la liste des clients et pour ne publier que
+    les messages qu'un autre worker doit livrer.
+    """
+
+    def __init__(self, max_per_client=MAX_ROOMS_PER_CLIENT):
+        self.max_per_client = max_per_client
+        self.lock = threading.Lock()
+        # salon -> {id client: (nom, client)}
+        self.members = {}
+        # id client -> salons rejoints
+        self.rooms_by_client = {}
+        # salon -> workers qui y ont des membres
+        self.remote = {}
+        # salon -> ((nom, client)..., clients...) jusqu'à sa prochaine modification
+        self._snapshots = {}
+        self._names = None
+
+    def join(self, room, name, client):
+        """Ajoute la connexion à room ; renvoie (membres, salon créé), None au-delà de max_per_client salons"""
+        with self.lock:
+            joined = self.rooms_by_client.setdefault(client["id"], set())
+            if room not in joined and len(joined) >= self.max_per_client:
+                return None
+            members = self.members.get(room)
+            created = members is None
+            if created:
+                members = self.members[room] = {}
+                self._names = None
+            members[client["id"]] = (name, client)
+            joined.add(room)
+            self._snapshots.pop(room, None)
+            return len(members), created
+
+    def leave(self, room, client):
+        """Retire la connexion de room ; renvoie (membres restants, salon fermé), None si elle n'en était pas membre"""
+        with self.lock:
+            joined = self.rooms_by_client.get(client["id"])
+            if not joined or room not in joined:
+                return None
+            joined.discard(room)
+            if not joined:
+                del self.rooms_by_client[client["id"]]
+            remaining = self._forget(room, client["id"])
+            return remaining, not remaining
+
+    def remove_client(self, client):
+        """Connexion fermée : elle quitte tous ses salons ; renvoie les salons fermés"""
+        with self.lock:
+            joined = self.rooms_by_client.pop(client["id"], ())
+            return [room for room in joined if not self._forget(room, client["id"])]
+
+    def _forget(self, room, client_id):
+        """Retire un membre (verrou tenu) ; renvoie le nombre de membres restants"""
+        members = self.members.get(room)
+        if members is None:
+            return 0
+        members.pop(client_id, None)
+        self._snapshots.pop(room, None)
+        if not members:
+            del self.members[room]
+            self._names = None
+        return len(members)
+
+    def is_member(self, room, client):
+        members = self.members.get(room)
+        return members is not None and client["id"] in members
+
+    def rooms_of(self, client):
+        return frozenset(self.rooms_by_client.get(client["id"], ()))
+
+    def _snapshot(self, room):
+        snapshot = self._snapshots.get(room)
+        if snapshot is None:
+            with self.lock:
+                snapshot = self._snapshots.get(room)
+                if snapshot is None:
+                    items = tuple(self.members.get(room, {}).values())
+                    snapshot = (items, tuple(client for _, client in items))
+                    if items:
+                        self._snapshots[room] = snapshot
+        return snapshot
+
+    def items(self, room):
+        """(nom, client) des membres locaux de room, instantané sûr à parcourir sans verrou"""
+        return self._snapshot(room)[0]
+
+    def clients(self, room):
+        return self._snapshot(room)[1]
+
+    def set_remote(self, room, worker, opened):
+        """Salon ouvert (ou fermé) sur un autre worker du cluster"""
+        with self.lock:
+            workers = self.remote.setdefault(room, set())
+            (workers.add if opened else workers.discard)(worker)
+            if not workers:
+                del self.remote[room]
+            self._names = None
+
+    def has_remote(self, room):
+        return room in self.remote
+
+    def names(self):
+        """Salons ouverts ici ou sur un autre worker, triés"""
+        names = self._names
+        if names is None:
+            with self.lock:
+                names = self._names = tuple(sorted(self.members.keys() | self.remote.keys()))
+        return names
+
+    def __contains__(self, room):
+        return room in self.members or room in self.remote
+
+    def snapshot(self):
+        with self.lock:
+            sizes = {room: len(members) for room, members in self.members.items()}
+            remote = len(self.remote.keys() - self.members.keys())
+        largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:10]
+        return {
+            "rooms": len(sizes),
+            "remote_rooms": remote,
+            "memberships": sum(sizes.values()),
+            "largest": dict(largest),
+        }
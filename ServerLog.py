@@ -0,0 +1,136 @@
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+CAPACITY = 4096       # lignes en attente au plus (anneau : les plus anciennes sont écrasées)
+RATE = 500            # lignes écrites par seconde au plus
+MAX_VALUE = 200       # caractères gardés par argument texte
+FLUSH_INTERVAL = 0.1
+
+
+def truncate(value, limit=MAX_VALUE):
+    """Coupe un texte (ou résume des octets) sans jamais copier plus de limit caractères"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} octets>"
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... (+{len(value) - limit} car.)"
+    return value
+
+
+class ServerLog:
+    """
+    Journal non bloquant du serveur.
+
+    Les appels info() / warning() ... ne font que tronquer les arguments texte
+    et ajouter un tuple à un anneau borné ; le formatage et l'écriture
+    (console et/ou fichier) se font dans un thread dédié, limité à `rate`
+    lignes par seconde. Rien ne peut donc ralentir le routage : en cas
+    d'excès, des lignes sont perdues et comptées dans stats().
+    """
+
+    def __init__(self, level=INFO, capacity=CAPACITY, rate=RATE, max_value=MAX_VALUE, path=None, console=True, prompt=None):
+        self.level = LEVELS.get(level, level) if isinstance(level, str) else level
+        self.max_value = max_value
+        self.rate = rate
+        self.path = path
+        self.console = console
+        self.prompt = prompt
+        self.ring = deque(maxlen=capacity)
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.counters = {"written": 0, "overwritten": 0, "rate_limited": 0, "filtered": 0}
+
+    def log(self, level, fmt, *args):
+        if level < self.level:
+            self.counters["filtered"] += 1
+            return
+        if len(self.ring) == self.ring.maxlen:
+            self.counters["overwritten"] += 1
+        self.ring.append((time.time(), level, fmt, tuple(truncate(arg, self.max_value) for arg in args)))
+
+    def debug(self, fmt, *args):
+        self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt, *args):
+        self.log(INFO, fmt, *args)
+
+    def warning(self, fmt, *args):
+        self.log(WARNING, fmt, *args)
+
+    def error(self, fmt, *args):
+        self.log(ERROR, fmt, *args)
+
+    def _format(self, entry):
+        timestamp, level, fmt, args = entry
+        try:
+            text = fmt % args if args else fmt
+        except (TypeError, ValueError):
+            text = f"{fmt} {args}"
+        prefix = "" if level == INFO else f"[{LEVEL_NAMES.get(level, level)}] "
+        # les arguments non textuels (listes, dicts) sont bornés une fois formatés
+        text = truncate(text, self.max_value * 4)
+        return f"{time.strftime('%H:%M:%S', time.localtime(timestamp))} {prefix}{text}"
+
+    def _write(self, budget):
+        """Écrit au plus budget lignes ; le reste de l'anneau est compté puis jeté"""
+        lines = []
+        ring = self.ring
+        while ring:
+            entry = ring.popleft()
+            if len(lines) < budget:
+                lines.append(self._format(entry))
+            else:
+                self.counters["rate_limited"] += 1
+        if not lines:
+            return 0
+        text = "\n".join(lines) + "\n"
+        if self.console:
+            # sys.stdout lu à chaque écriture : il peut avoir été redirigé après l'import
+            prefix = "\n" if self.prompt else ""
+            sys.stdout.write(prefix + text + (self.prompt or ""))
+            sys.stdout.flush()
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(text)
+        self.counters["written"] += len(lines)
+        return len(lines)
+
+    def _run(self):
+        last = time.monotonic()
+        while self.running:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            now = time.monotonic()
+            budget = max(1, int(self.rate * (now - last)))
+            last = now
+            try:
+                self._write(budget)
+            except Exception as e:
+                sys.__stderr__.write(f"[erreur] journal: {e}\n")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """Arrête le writer et écrit ce qui reste (sans limite de débit)"""
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(1)
+        self._write(len(self.ring))
+
+    def stats(self):
+        return {"pending": len(self.ring), "level": self.level, **self.counters}
@@ -0,0 +1,286 @@
+import errno
+import logging
+import socket
+import struct
+import threading
+import time
+import zlib
+from socket import error as SocketError
+
+from websocket_server import WebsocketServer
+from websocket_server.websocket_server import WebSocketHandler
+
+from Deflate import DeflateServer
+from RateLimit import HandshakeLimiter
+from WSFrame import (
+    CLOSE_STATUS_MESSAGE_TOO_BIG,
+    CLOSE_STATUS_PROTOCOL_ERROR,
+    MASKED,
+    MAX_MESSAGE_SIZE,
+    OPCODE,
+    OPCODE_BINARY,
+    OPCODE_CLOSE_CONN,
+    OPCODE_CONTINUATION,
+    OPCODE_PING,
+    OPCODE_PONG,
+    OPCODE_TEXT,
+    PAYLOAD_LEN,
+    RSV1,
+    apply_mask,
+    encode_frame,
+    frame_header,
+    handshake_response,
+    reject_response,
+)
+from OutboundQueue import OutboundQueue
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadedWebSocketHandler(WebSocketHandler):
+    """
+    Handler websocket_server qui accepte aussi les trames binaires.
+
+    Le démasquage se fait en un seul XOR au lieu d'une boucle octet par octet,
+    ce qui compte pour les médias de plusieurs Mo. Les envois passent par une
+    OutboundQueue bornée vidée par un thread writer dédié à la connexion.
+    """
+
+    def setup(self):
+        # PerMessageDeflate si le client a négocié la compression (voir handshake)
+        self.deflate = None
+        # place réservée dans AdmissionControl au handshake, rendue dans finish
+        self.admitted = False
+        super().setup()
+        self.outbound = OutboundQueue(
+            **self.server.outbound,
+            on_overflow=self.abort,
+            on_drop=lambda frame: self.server._frame_dropped_(self, frame),
+        )
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            frame = self.outbound.get()
+            if frame is None:
+                return
+            try:
+                if self.deflate:
+                    frame = self.deflate.outgoing(frame)
+                with self._send_lock:
+                    self.request.sendall(frame)
+            except OSError:
+                self.abort()
+                return
+
+    def abort(self):
+        """Coupe la socket : le thread lecteur sort et client_left est appelé"""
+        self.keep_alive = False
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def handshake(self):
+        """Handshake de websocket_server, avec négociation de permessage-deflate"""
+        headers = self.read_http_headers()
+        if headers.get("upgrade", "").lower() != "websocket":
+            self.keep_alive = False
+            return
+        key = headers.get("sec-websocket-key")
+        if not key:
+            logger.warning("Client tried to connect but was missing a key")
+            self.keep_alive = False
+            return
+        admission = self.server.admission
+        if admission:
+            # plafond de connexions : refus immédiat, sans attendre le limiteur de handshakes
+            if not admission.open_connection():
+                with self._send_lock:
+                    self.request.send(reject_response(admission.connection_retry_after))
+                self.keep_alive = False
+                return
+            self.admitted = True
+        if self.server.handshakes:
+            # vague de reconnexions : le handshake attend son tour, ou est refusé si l'attente est trop longue
+            wait = self.server.handshakes.admit()
+            if wait is None:
+                with self._send_lock:
+                    self.request.send(reject_response(self.server.handshakes.retry_after()))
+                self.keep_alive = False
+                return
+            time.sleep(wait)
+        extensions = None
+        if self.server.deflate:
+            self.deflate, extensions = self.server.deflate.negotiate(headers.get("sec-websocket-extensions"))
+        with self._send_lock:
+            self.handshake_done = self.request.send(handshake_response(key, extensions))
+        self.valid_client = True
+        self.server._new_client_(self)
+
+    def finish(self):
+        super().finish()
+        self.outbound.close()
+        if self.admitted:
+            self.admitted = False
+            self.server.admission.close_connection()
+
+    def read_next_message(self):
+        try:
+            b1, b2 = self.read_bytes(2)
+        except SocketError as e:
+            if e.errno == errno.ECONNRESET:
+                logger.info("Client closed connection.")
+            self.keep_alive = 0
+            return
+        except ValueError:
+            # connexion fermée (lecture vide) : pas de trame CLOSE à renvoyer
+            self.keep_alive = 0
+            return
+
+        opcode = b1 & OPCODE
+        compressed = b1 & RSV1
+        masked = b2 & MASKED
+        payload_length = b2 & PAYLOAD_LEN
+
+        if opcode == OPCODE_CLOSE_CONN:
+            logger.info("Client asked to close connection.")
+            self.keep_alive = 0
+            return
+        if not masked:
+            logger.warning("Client must always be masked.")
+            self.close_with(CLOSE_STATUS_PROTOCOL_ERROR, b"Client must always be masked")
+            return
+        if opcode == OPCODE_CONTINUATION:
+            logger.warning("Continuation frames are not supported.")
+            return
+        elif opcode in (OPCODE_TEXT, OPCODE_BINARY):
+            opcode_handler = self.server._message_received_
+        elif opcode == OPCODE_PING:
+            opcode_handler = self.server._ping_received_
+        elif opcode == OPCODE_PONG:
+            opcode_handler = self.server._pong_received_
+        else:
+            logger.warning("Unknown opcode %#x." % opcode)
+            self.keep_alive = 0
+            return
+
+        if payload_length == 126:
+            payload_length = struct.unpack(">H", self.rfile.read(2))[0]
+        elif payload_length == 127:
+            payload_length = struct.unpack(">Q", self.rfile.read(8))[0]
+        max_size = self.server.max_message_size
+        if max_size and payload_length > max_size:
+            # refusé sur l'en-tête, avant de lire (et d'allouer) le payload
+            logger.warning("Message too big (%d bytes), closing connection." % payload_length)
+            self.close_with(CLOSE_STATUS_MESSAGE_TOO_BIG, f"Message too big ({payload_length} bytes)".encode())
+            return
+
+        masks = self.read_bytes(4)
+        payload = apply_mask(self.read_bytes(payload_length), masks)
+        if compressed:
+            if not self.deflate or opcode not in (OPCODE_TEXT, OPCODE_BINARY):
+                logger.warning("RSV1 set without permessage-deflate.")
+                self.keep_alive = 0
+                return
+            try:
+                payload = self.deflate.inflate(payload)
+            except (ValueError, zlib.error) as e:
+                logger.warning("Invalid compressed message: %s" % e)
+                self.keep_alive = 0
+                return
+        if opcode == OPCODE_BINARY:
+            # bytearray : le serveur peut réécrire l'en-tête sur place avant relais
+            opcode_handler(self, bytearray(payload))
+        else:
+            opcode_handler(self, payload.decode("utf8"))
+
+    def close_with(self, status, reason):
+        """Trame CLOSE avec un code d'erreur, puis fin de la boucle de lecture (le client a pu déjà partir)"""
+        try:
+            self.send_close(status, reason)
+        except OSError:
+            pass
+        self.keep_alive = 0
+
+    def send_text(self, message, opcode=OPCODE_TEXT):
+        if not isinstance(message, (str, bytes)):
+            logger.warning("Can't send message, message has to be a string or bytes. Got %s" % type(message))
+            return False
+        return self.outbound.put(encode_frame(message, opcode))
+
+    def send_binary(self, data):
+        return self.outbound.put(frame_header(len(data), OPCODE_BINARY) + data)
+
+    def send_frame(self, frame):
+        """Met en file une trame déjà encodée (diffusion serialize-once)"""
+        return self.outbound.put(frame)
+
+
+class ThreadedWebsocketServer(WebsocketServer):
+    """websocket_server.WebsocketServer (un thread par client) avec trames binaires"""
+
+    def __init__(self, host="127.0.0.1", port=0, loglevel=logging.WARNING, key=None, cert=None, outbound=None, deflate=None, sock=None, backlog=1024, handshake=None, admission=None, max_message_size=None):
+        # sock : socket d'écoute déjà ouverte (workers de Cluster), utilisée au lieu d'en lier une
+        self.listen_sock = sock
+        # file d'attente du listen() (5 par défaut dans socketserver : trop peu pour une vague de reconnexions)
+        self.request_queue_size = backlog
+        super().__init__(host=host, port=port, loglevel=loglevel, key=key, cert=cert)
+        self.RequestHandlerClass = ThreadedWebSocketHandler
+        # paramètres des OutboundQueue (max_frames, max_bytes, policy, block_timeout)
+        self.outbound = outbound or {}
+        # permessage-deflate : paramètres de DeflateServer, False pour ne pas le proposer
+        self.deflate = None if deflate is False else DeflateServer(**(deflate or {}))
+        # handshake : paramètres de HandshakeLimiter (rate, burst, max_wait), False pour ne pas limiter
+        self.handshakes = None if handshake is False else HandshakeLimiter(**(handshake or {}))
+        # admission : AdmissionControl partagé avec WSServer (plafond de connexions), None pour ne pas limiter
+        self.admission = admission
+        # max_message_size : octets au plus par trame reçue, vérifié avant d'en lire le payload ; False sans limite
+        self.max_message_size = None if max_message_size is False else (max_message_size or MAX_MESSAGE_SIZE)
+
+    def server_bind(self):
+        if self.listen_sock is None:
+            return super().server_bind()
+        self.socket.close()
+        self.socket = self.listen_sock
+        # socket partagée entre process : un accept perdu au profit d'un autre worker ne doit pas bloquer
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()
+
+    def server_activate(self):
+        if self.listen_sock is None:
+            super().server_activate()
+
+    def frame_dropped(self, client, server, frame):
+        pass
+
+    def set_fn_frame_dropped(self, fn):
+        self.frame_dropped = fn
+
+    def _client_left_(self, handler):
+        # handshake refusé (503, plafond de connexions) : ce handler n'a jamais été un client
+        if self.handler_to_client(handler) is not None:
+            super()._client_left_(handler)
+
+    def _frame_dropped_(self, handler, frame):
+        client = self.handler_to_client(handler)
+        if client is not None:
+            self.frame_dropped(client, self, frame)
+
+    def send_binary(self, client, data):
+        client["handler"].send_binary(data)
+
+    def send_frame(self, client, frame):
+        client["handler"].send_frame(frame)
+
+    def queue_stats(self, client):
+        handler = client["handler"]
+        stats = handler.outbound.snapshot()
+        if handler.deflate:
+            stats["deflate"] = handler.deflate.snapshot()
+        return stats
+
+    def drop_client(self, client):
+        """Coupe la connexion (client lent, keep-alive expiré) ; client_left suit"""
+        client["handler"].abort()
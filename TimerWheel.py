@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    Roue de timers hiérarchique : un seul thread de tick, quel que soit le nombre de timers.
+
+    Un timer est identifié par une clé (ex: id du client) ; schedule() remplace
+    le timer existant de la clé et cancel() le retire, tous deux en O(1). Les
+    timers lointains attendent dans les niveaux supérieurs et redescendent
+    d'un niveau à chaque tour complet du niveau inférieur.
+    """
+
+    def __init__(self, tick=0.5, slots=64, levels=3, log=None):
+        self.tick = tick
+        # log : ServerLog du serveur (erreurs des callbacks hors du chemin de routage), logging sinon
+        self.log = log or logger
+        self.slots = slots
+        self.levels = levels
+        # levels x slots, chaque case : {clé: (tick d'échéance, callback)}
+        self.wheel = [[{} for _ in range(slots)] for _ in range(levels)]
+        # clé -> (niveau, case) pour annuler / remplacer sans parcours
+        self.where = {}
+        self.now = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        return len(self.where)
+
+    def _place(self, key, expires, callback):
+        delta = max(1, expires - self.now)
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.slots or level == self.levels - 1:
+                # au-delà de la portée de la roue, le timer attend dans la dernière case du dernier niveau
+                expires_at = min(expires, self.now + span * self.slots - 1) if delta >= span * self.slots else expires
+                slot = (expires_at // span) % self.slots
+                self.wheel[level][slot][key] = (expires, callback)
+                self.where[key] = (level, slot)
+                return
+            span *= self.slots
+
+    def _remove(self, key):
+        position = self.where.pop(key, None)
+        if position is not None:
+            level, slot = position
+            self.wheel[level][slot].pop(key, None)
+
+    def schedule(self, key, delay, callback):
+        """Arme (ou réarme) le timer de key : callback(key) dans delay secondes"""
+        with self.lock:
+            self._remove(key)
+            self._place(key, self.now + max(1, int(round(delay / self.tick))), callback)
+
+    def cancel(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _cascade(self, level):
+        span = self.slots ** level
+        slot = (self.now // span) % self.slots
+        bucket = self.wheel[level][slot]
+        self.wheel[level][slot] = {}
+        for key, (expires, callback) in bucket.items():
+            del self.where[key]
+            self._place(key, expires, callback)
+
+    def advance(self):
+        """Avance d'un tick ; renvoie les (clé, callback) échus, appelés hors verrou"""
+        with self.lock:
+            self.now += 1
+            # les niveaux supérieurs redescendent d'abord, du plus haut au plus bas
+            for level in range(self.levels - 1, 0, -1):
+                if self.now % (self.slots ** level) == 0:
+                    self._cascade(level)
+            slot = self.now % self.slots
+            bucket = self.wheel[0][slot]
+            expired = [(key, callback) for key, (expires, callback) in bucket.items() if expires <= self.now]
+            for key, _ in expired:
+                del bucket[key]
+                del self.where[key]
+        for key, callback in expired:
+            callback(key)
+        return expired
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while self.running:
+            time.sleep(max(0, next_tick - time.monotonic()))
+            next_tick += self.tick
+            try:
+                self.advance()
+            except Exception as e:
+                self.log.error("[timer] %s: %s", type(e).__name__, e)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
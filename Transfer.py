@@ -0,0 +1,356 @@
+import math
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+import websocket
+
+from Message import Message, MessageType, RECEPTION_FOR
+
+CHUNK_SIZE = 256 * 1024
+WINDOW = 4            # morceaux envoyés et non acquittés au maximum
+ACK_TIMEOUT = 30      # secondes sans ACK avant de resynchroniser avec un TRANSFER_START
+TRANSFER_TTL = 600    # secondes sans progrès avant d'abandonner / d'oublier un transfert
+
+# Payload d'une trame TRANSFER_CHUNK : [transfer_id 16 octets][index u32] + données
+CHUNK_HEADER = struct.Struct(">16sI")
+# transfer_id : uuid4().hex, le seul format que pack_chunk sait mettre dans un morceau
+TRANSFER_ID = re.compile(r"[0-9a-f]{32}")
+
+TRANSFER_TYPES = (
+    MessageType.TRANSFER.START,
+    MessageType.TRANSFER.CHUNK,
+    MessageType.TRANSFER.ACK,
+    MessageType.TRANSFER.END,
+)
+
+
+def is_transfer_id(value):
+    """True pour un transfer_id bien formé (32 caractères hexadécimaux), utilisable comme clé et nom de fichier"""
+    return isinstance(value, str) and TRANSFER_ID.fullmatch(value) is not None
+
+
+def pack_chunk(transfer_id, index, data):
+    return CHUNK_HEADER.pack(uuid.UUID(transfer_id).bytes, index) + data
+
+
+def unpack_chunk_header(payload):
+    raw_id, index = CHUNK_HEADER.unpack_from(payload, 0)
+    return uuid.UUID(bytes=raw_id).hex, index
+
+
+# ----------------------------
+# Côté serveur
+# ----------------------------
+class RelayedTransfer:
+    def __init__(self, transfer_id, emitter, receiver, media_type, size, chunks):
+        self.transfer_id = transfer_id
+        self.emitter = emitter
+        self.receiver = receiver
+        self.media_type = media_type
+        self.size = size
+        self.chunks = chunks
+        self.acked = -1
+        self.updated_at = time.time()
+
+    def touch(self):
+        self.updated_at = time.time()
+
+
+class TransferRelay:
+    """État serveur des transferts par morceaux : des compteurs, jamais le contenu du fichier"""
+
+    def __init__(self, ttl=TRANSFER_TTL):
+        self.ttl = ttl
+        self.transfers = {}
+        self.lock = threading.Lock()
+
+    def start(self, emitter, receiver, value):
+        """Crée le transfert, ou renvoie l'existant pour une reprise"""
+        transfer_id = value["transfer_id"]
+        with self.lock:
+            self._purge()
+            transfer = self.transfers.get(transfer_id)
+            if transfer is None or transfer.emitter != emitter:
+                transfer = RelayedTransfer(
+                    transfer_id,
+                    emitter,
+                    receiver,
+                    value.get("media_type"),
+                    value.get("size"),
+                    value.get("chunks"),
+                )
+                self.transfers[transfer_id] = transfer
+            transfer.touch()
+            return transfer
+
+    def get(self, transfer_id):
+        with self.lock:
+            return self.transfers.get(transfer_id)
+
+    def active(self, media_type):
+        """Transferts de ce type en cours (pour le plafond de relais simultanés)"""
+        with self.lock:
+            self._purge()
+            return sum(1 for transfer in self.transfers.values() if transfer.media_type == media_type)
+
+    def ack(self, transfer_id, index, reset=False):
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if transfer is None:
+                return None
+            transfer.acked = index if reset else max(transfer.acked, index)
+            transfer.touch()
+            return transfer
+
+    def end(self, transfer_id):
+        with self.lock:
+            return self.transfers.pop(transfer_id, None)
+
+    def _purge(self):
+        limit = time.time() - self.ttl
+        for transfer_id in [tid for tid, t in self.transfers.items() if t.updated_at < limit]:
+            del self.transfers[transfer_id]
+
+
+# ----------------------------
+# Côté client
+# ----------------------------
+class OutgoingTransfer:
+    def __init__(self, filepath, dest, message_type, chunk_size=CHUNK_SIZE):
+        self.transfer_id = uuid.uuid4().hex
+        self.filepath = filepath
+        self.dest = dest
+        self.message_type = message_type
+        self.size = os.path.getsize(filepath)
+        self.chunk_size = chunk_size
+        self.chunks = max(1, math.ceil(self.size / chunk_size))
+        self.acked = -1
+        self.next_index = None
+        self.generation = 0
+        self.progress_at = time.time()
+
+    def start_message(self, emitter):
+        value = {
+            "transfer_id": self.transfer_id,
+            "media_type": self.message_type,
+            "name": os.path.basename(self.filepath),
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "chunks": self.chunks,
+        }
+        return Message(MessageType.TRANSFER.START, emitter=emitter, receiver=self.dest, value=value)
+
+
+class IncomingTransfer:
+    def __init__(self, transfer_id, emitter, value, path):
+        self.transfer_id = transfer_id
+        self.emitter = emitter
+        self.message_type = value.get("media_type")
+        self.size = value.get("size")
+        self.chunk_size = value.get("chunk_size", CHUNK_SIZE)
+        self.chunks = value.get("chunks")
+        self.path = path
+        self.handle = open(path, "w+b")
+        self.received = -1
+
+
+class ChunkedTransfers:
+    """
+    Envoi et réception de médias par morceaux pour un WSClient.
+
+    L'émetteur lit le fichier morceau par morceau et n'a jamais plus de WINDOW
+    morceaux non acquittés ; le destinataire écrit directement sur disque et
+    acquitte chaque morceau. Après une coupure, resume_all() renvoie un
+    TRANSFER_START et le serveur répond avec le dernier morceau acquitté.
+    """
+
+    def __init__(self, client, media_dir=None):
+        self.client = client
+        self.media_dir = media_dir or tempfile.gettempdir()
+        self.outgoing = {}
+        self.incoming = {}
+        self.cond = threading.Condition()
+
+    def _send(self, message):
+        self.client.ws.send(message.to_json())
+
+    # --- envoi ---
+    def send_file(self, filepath, dest, message_type):
+        transfer = OutgoingTransfer(filepath, dest, message_type)
+        with self.cond:
+            self.outgoing[transfer.transfer_id] = transfer
+        self._launch(transfer)
+        return transfer.transfer_id
+
+    def resume_all(self):
+        with self.cond:
+            pending = list(self.outgoing.values())
+        for transfer in pending:
+            self._launch(transfer)
+
+    def _launch(self, transfer):
+        with self.cond:
+            transfer.generation += 1
+            transfer.next_index = None
+            generation = transfer.generation
+            self.cond.notify_all()
+        self._send(transfer.start_message(self.client.username))
+        threading.Thread(target=self._pump, args=(transfer, generation), daemon=True).start()
+
+    def defer(self, transfer_id, delay):
+        """Transfert refusé par le serveur chargé : nouveau TRANSFER_START dans delay secondes"""
+        with self.cond:
+            transfer = self.outgoing.get(transfer_id)
+        if transfer is None:
+            return False
+        timer = threading.Timer(delay, self._relaunch, args=(transfer,))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _relaunch(self, transfer):
+        with self.cond:
+            pending = self.outgoing.get(transfer.transfer_id) is transfer
+        if pending and self.client.connected:
+            self._launch(transfer)
+
+    def _next_chunk(self, transfer, generation):
+        """Attend qu'un morceau puisse partir ; None quand tout est acquitté ou le pump obsolète"""
+        with self.cond:
+            while transfer.generation == generation:
+                if transfer.next_index is not None:
+                    if transfer.acked >= transfer.chunks - 1:
+                        return None
+                    if transfer.next_index < transfer.chunks and transfer.next_index - transfer.acked <= WINDOW:
+                        index = transfer.next_index
+                        transfer.next_index += 1
+                        return index
+                if not self.cond.wait(ACK_TIMEOUT):
+                    if time.time() - transfer.progress_at > TRANSFER_TTL:
+                        print(f"\n[transfert] {transfer.transfer_id} abandonné (aucun progrès)")
+                        self.outgoing.pop(transfer.transfer_id, None)
+                        transfer.generation += 1
+                        return None
+                    # pas d'ACK : on redemande au serveur où reprendre
+                    transfer.next_index = None
+                    self._send(transfer.start_message(self.client.username))
+            return None
+
+    def _pump(self, transfer, generation):
+        try:
+            with open(transfer.filepath, "rb") as f:
+                while True:
+                    index = self._next_chunk(transfer, generation)
+                    if index is None:
+                        break
+                    f.seek(index * transfer.chunk_size)
+                    data = f.read(transfer.chunk_size)
+                    chunk = Message(
+                        MessageType.TRANSFER.CHUNK,
+                        emitter=self.client.username,
+                        receiver=transfer.dest,
+                        value=pack_chunk(transfer.transfer_id, index, data),
+                    )
+                    self.client.ws.send(chunk.to_binary(), opcode=websocket.ABNF.OPCODE_BINARY)
+            with self.cond:
+                if transfer.generation != generation:
+                    return
+                self.outgoing.pop(transfer.transfer_id, None)
+            end = Message(MessageType.TRANSFER.END, emitter=self.client.username, receiver=transfer.dest, value={"transfer_id": transfer.transfer_id})
+            self._send(end)
+        except (websocket.WebSocketException, OSError):
+            # connexion perdue : le transfert reste dans outgoing pour resume_all()
+            pass
+
+    def _on_ack(self, value):
+        with self.cond:
+            transfer = self.outgoing.get(value.get("transfer_id"))
+            if transfer is None:
+                return
+            index = value.get("index", -1)
+            if value.get("reset"):
+                transfer.acked = index
+                transfer.next_index = index + 1
+            else:
+                if index > transfer.acked:
+                    transfer.progress_at = time.time()
+                transfer.acked = max(transfer.acked, index)
+                if transfer.next_index is None:
+                    transfer.next_index = transfer.acked + 1
+            self.cond.notify_all()
+
+    # --- réception ---
+    def _on_start(self, message):
+        value = message.value
+        transfer_id = value.get("transfer_id")
+        if not is_transfer_id(transfer_id):
+            # l'id entre dans le nom du fichier partiel
+            return
+        resume_from = value.get("resume_from", 0)
+        transfer = self.incoming.get(transfer_id)
+        if transfer is None:
+            if resume_from > 0:
+                # fichier partiel perdu : on demande à l'émetteur de tout renvoyer
+                self._send(self._ack_message(transfer_id, message.emitter, -1, reset=True))
+                resume_from = 0
+            path = os.path.join(self.media_dir, f"transfer_{transfer_id}.part")
+            transfer = IncomingTransfer(transfer_id, message.emitter, value, path)
+            self.incoming[transfer_id] = transfer
+        transfer.handle.truncate(resume_from * transfer.chunk_size)
+        transfer.received = resume_from - 1
+
+    def _on_chunk(self, message):
+        transfer_id, index = unpack_chunk_header(message.value)
+        transfer = self.incoming.get(transfer_id)
+        if transfer is None or index != transfer.received + 1:
+            return
+        transfer.handle.seek(index * transfer.chunk_size)
+        transfer.handle.write(message.value[CHUNK_HEADER.size:])
+        transfer.received = index
+        self._send(self._ack_message(transfer_id, transfer.emitter, index))
+
+    def _on_end(self, message):
+        transfer = self.incoming.pop(message.value.get("transfer_id"), None)
+        if transfer is None:
+            return
+        transfer.handle.close()
+        if transfer.received != transfer.chunks - 1:
+            print(f"\n[transfert] {transfer.transfer_id} incomplet ({transfer.received + 1}/{transfer.chunks})")
+            os.remove(transfer.path)
+            return
+        path = transfer.path[:-len(".part")]
+        os.replace(transfer.path, path)
+        self.client.on_transfer_complete(transfer.message_type, transfer.emitter, path)
+
+    def _ack_message(self, transfer_id, dest, index, reset=False):
+        value = {"transfer_id": transfer_id, "index": index}
+        if reset:
+            value["reset"] = True
+        return Message(MessageType.TRANSFER.ACK, emitter=self.client.username, receiver=dest, value=value)
+
+    def on_message(self, message):
+        """Traite un message de transfert ; renvoie False pour les autres types"""
+        if message.message_type == MessageType.TRANSFER.CHUNK:
+            self._on_chunk(message)
+        elif message.message_type == MessageType.TRANSFER.START:
+            self._on_start(message)
+        elif message.message_type == MessageType.TRANSFER.ACK:
+            self._on_ack(message.value)
+        elif message.message_type == MessageType.TRANSFER.END:
+            self._on_end(message)
+        else:
+            return False
+        return True
+
+
+def reception_start(value, resume_from):
+    """Valeur du TRANSFER_START relayé au destinataire"""
+    forwarded = dict(value)
+    forwarded["media_type"] = RECEPTION_FOR.get(value.get("media_type"), value.get("media_type"))
+    forwarded["resume_from"] = resume_from
+    return forwarded
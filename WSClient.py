@@ -1,17 +1,106 @@
 import websocket
 import threading
 import base64
+import os
+import time
 
+from Codecs import CODECS, JSON
 from Context import Context
-from Message import Message, MessageType
+from Deflate import PerMessageDeflate, client_deflate, client_offer
+from Delivery import CumulativeAck, describe_receipt
+from MediaStore import MediaStore, file_hash, media_hash, media_ref, ref_value, unpack_media_data
+from Message import Message, MessageType, RECEPTION_FOR
+from RoomRegistry import is_room_name
+from Transfer import CHUNK_SIZE, ChunkedTransfers
+from WSFrame import encode_frame
+
+# renvois au plus d'un média différé par le serveur chargé (WARNING avec retry_after)
+MEDIA_RETRIES = 5
+
+
+class InflatingFrameBuffer(websocket._abnf.frame_buffer):
+    """frame_buffer de websocket-client qui décompresse les messages RSV1 (permessage-deflate)
+
+    websocket-client n'a pas de point d'extension pour permessage-deflate : cette
+    classe dérive de sa classe privée frame_buffer, écrite pour la version fixée
+    dans requirements.txt. deflate_supported() vérifie qu'elle fonctionne encore
+    avant que la compression soit proposée au serveur.
+    """
+
+    def __init__(self, recv_fn, skip_utf8_validation, deflate):
+        super().__init__(recv_fn, skip_utf8_validation)
+        self.deflate = deflate
+        self.compressed = False
+
+    def recv_header(self):
+        super().recv_header()
+        fin, rsv1, rsv2, rsv3, opcode, has_mask, length_bits = self.header
+        # websocket-client refuse RSV1 : on le retire avant sa validation
+        self.compressed = bool(rsv1)
+        self.header = (fin, 0, rsv2, rsv3, opcode, has_mask, length_bits)
+
+    def recv_frame(self):
+        frame = super().recv_frame()
+        if self.compressed:
+            self.compressed = False
+            frame.data = self.deflate.inflate(frame.data)
+        return frame
+
+
+_deflate_supported = None
+
+
+def deflate_supported():
+    """True si InflatingFrameBuffer décompresse une trame RSV1 avec le websocket-client installé (vérifié une fois)"""
+    global _deflate_supported
+    if _deflate_supported is None:
+        text = b'{"message_type":"SYS_MESSAGE","value":"' + b"deflate " * 32 + b'"}'
+        deflate = PerMessageDeflate(min_size=0)
+        pending = [deflate.outgoing(encode_frame(text))]
+
+        def recv(size):
+            data, pending[0] = pending[0][:size], pending[0][size:]
+            return data
+
+        try:
+            _deflate_supported = InflatingFrameBuffer(recv, True, deflate).recv_frame().data == text
+        except Exception:
+            _deflate_supported = False
+        if not _deflate_supported:
+            print(f"[warning] permessage-deflate désactivé : websocket-client {websocket.__version__} incompatible avec InflatingFrameBuffer")
+    return _deflate_supported
 
 
 class WSClient:
-    def __init__(self, ctx, username="Client"):
+    def __init__(self, ctx, username="Client", binary=False, chunked=False, media_dir=None, codecs=None, deflate=False, media_store=None):
         self.username = username
         self.connected = False
+        # True : médias envoyés/reçus en trames binaires au lieu de base64 dans le JSON
+        self.binary = binary
+        # True : gros médias envoyés par morceaux acquittés et reprenables (implique binary)
+        self.chunked = chunked
+        self.transfers = ChunkedTransfers(self, media_dir)
+        # un ACK cumulatif tous les N messages ou T ms au lieu d'un "MESSAGE OK" par message
+        self.acks = CumulativeAck(self.send_ack)
+        # codecs proposés à la DECLARATION (None : JSON seulement) ; JSON jusqu'à la réponse du serveur
+        self.codecs = codecs
+        self.codec = JSON
+        # permessage-deflate proposé au handshake ; self.deflate n'est posé que si le serveur l'accepte
+        self.offer_deflate = deflate and deflate_supported()
+        self.deflate = None
+        # le contexte de compression impose d'envoyer dans l'ordre de compression
+        self.send_lock = threading.Lock()
+        # media_store (True ou paramètres de MediaStore) : médias déjà vus envoyés / reçus par empreinte
+        self.store = MediaStore(**(media_store if isinstance(media_store, dict) else {})) if media_store else None
+        # capacités annoncées par le serveur après la DECLARATION ; pas de références média avant
+        self.server_features = set()
+        # empreinte -> messages reçus par référence en attente des octets (MEDIA_DATA)
+        self.pending_media = {}
+        # (type, destinataire) -> (chemin, préfixe, tentative) du dernier média envoyé, à renvoyer s'il est différé
+        self.sent_media = {}
         self.ws = websocket.WebSocketApp(
             ctx.url(),
+            header=[f"Sec-WebSocket-Extensions: {client_offer()}"] if deflate else None,
             on_open=self.on_open,
             on_message=self.on_message,
             on_error=self.on_error,
@@ -19,7 +108,10 @@ class WSClient:
         )
 
     def on_message(self, ws, message):
-        received_msg = Message.from_json(message)
+        received_msg = Message.from_frame(message)
+
+        if self.transfers.on_message(received_msg):
+            return
 
         # Répondre au ping du serveur
         if received_msg.message_type == MessageType.SYS_MESSAGE and received_msg.value == "ping":
@@ -27,14 +119,169 @@ class WSClient:
             ws.send(pong_msg.to_json())
             return
 
+        if self.on_codec(received_msg):
+            return
+
+        # Début de session (ACK 0) ou message à compter pour le prochain ACK
+        if self.acks.on_message(received_msg):
+            return
+
+        if received_msg.message_type == MessageType.HISTORY.BATCH:
+            self.display_history(received_msg.value)
+            return
+
+        self.on_deferred(received_msg)
+
+        for message in self.on_media(received_msg):
+            self.display(message)
+
+    def display(self, received_msg):
+        receipt = describe_receipt(received_msg.value) if received_msg.message_type == MessageType.SYS_MESSAGE else None
+
         # Affichage selon le type de message
-        print(f"\n[{received_msg.emitter}] {received_msg.value}")
+        if received_msg.message_type == MessageType.ADMIN.METRICS:
+            # relevé périodique pour /metrics du dashboard, trop volumineux pour la console
+            return
+        if receipt:
+            print(f"\n[{received_msg.emitter}] {receipt}")
+        elif received_msg.message_type in (MessageType.ROOM.JOIN, MessageType.ROOM.LEAVE) and isinstance(received_msg.value, dict):
+            action = "rejoint" if received_msg.message_type == MessageType.ROOM.JOIN else "quitté"
+            print(f"\n[{received_msg.emitter}] salon {received_msg.value.get('room')} {action} ({received_msg.value.get('members')} membres)")
+        elif received_msg.message_type == MessageType.WARNING and isinstance(received_msg.value, dict) and "retry_after" in received_msg.value:
+            # serveur chargé : le média repart tout seul après retry_after (voir on_deferred)
+            print(f"\n[{received_msg.emitter}] serveur chargé, {received_msg.value.get('message_type')} pour {received_msg.value.get('receiver')} différé ({received_msg.value['reason']}), réessai dans {received_msg.value['retry_after']} s")
+        elif received_msg.message_type == MessageType.WARNING and isinstance(received_msg.value, dict) and "reason" in received_msg.value:
+            # quota dépassé : le serveur a ignoré nos derniers messages de ce type
+            print(f"\n[{received_msg.emitter}] trop de messages {received_msg.value.get('message_type')} ({received_msg.value['reason']}), messages ignorés")
+        elif isinstance(received_msg.value, (bytes, memoryview)):
+            print(f"\n[{received_msg.emitter}] [{received_msg.message_type} {len(received_msg.value)} octets]")
+        else:
+            print(f"\n[{received_msg.emitter}] {received_msg.value}")
         print(f"[{self.username}] > ", end="", flush=True)
 
-        # Accusé de réception pour les messages RECEPTION
-        if received_msg.message_type in [MessageType.RECEPTION.TEXT, MessageType.RECEPTION.IMAGE, MessageType.RECEPTION.AUDIO, MessageType.RECEPTION.VIDEO]:
-            ack_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="MESSAGE OK")
-            ws.send(ack_msg.to_json())
+    def display_history(self, batch):
+        """Messages rejoués par le journal du serveur, plus ancien d'abord"""
+        for event in batch.get("events", []):
+            when = time.strftime("%d/%m %H:%M:%S", time.localtime(event.get("timestamp", 0)))
+            value = event.get("value")
+            if isinstance(value, dict) and value.get("kind"):
+                value = f"[{value['kind']} {value.get('size')} octets]"
+            print(f"\n[historique {when}] {event.get('emitter')} -> {event.get('receiver')} : {value}")
+        if batch.get("done"):
+            print(f"[{self.username}] > ", end="", flush=True)
+
+    def request_history(self, since=None, last=None):
+        """Demande au serveur les derniers messages (les siens et les diffusions) depuis since"""
+        value = {"since": since or 0}
+        if last:
+            value["last"] = last
+        self.send_message(Message(MessageType.HISTORY.REQUEST, emitter=self.username, receiver="SERVER", value=value))
+
+    def on_codec(self, message):
+        """Codec choisi ou capacités annoncées par le serveur ; True si message était une de ses réponses à la DECLARATION"""
+        if message.message_type != MessageType.SYS_MESSAGE or message.emitter != "SERVER":
+            return False
+        if not isinstance(message.value, dict):
+            return False
+        if "features" in message.value:
+            self.server_features = set(message.value["features"])
+            return True
+        if "codec" not in message.value:
+            return False
+        self.codec = CODECS.get(message.value["codec"], JSON)
+        return True
+
+    def on_deferred(self, message):
+        """Média refusé par le serveur chargé : renvoyé après le retry_after indiqué ; True si un renvoi est prévu"""
+        value = message.value
+        if message.message_type != MessageType.WARNING or not isinstance(value, dict) or "retry_after" not in value:
+            return False
+        if value.get("transfer_id"):
+            return self.transfers.defer(value["transfer_id"], value["retry_after"])
+        key = (value.get("message_type"), value.get("receiver"))
+        sent = self.sent_media.pop(key, None)
+        if sent is None or sent[2] >= MEDIA_RETRIES:
+            return False
+        filepath, prefix, attempt = sent
+        timer = threading.Timer(value["retry_after"], self._retry_media, args=(filepath, key[1], key[0], prefix, attempt + 1))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _retry_media(self, filepath, dest, message_type, prefix, attempt):
+        if self.connected:
+            self._send_media(filepath, dest, message_type, prefix, attempt)
+
+    def on_media(self, message):
+        """Résout les médias envoyés par empreinte ; renvoie les messages prêts à afficher"""
+        if self.store is None:
+            return [message]
+        if message.message_type == MessageType.MEDIA.DATA:
+            digest, data = unpack_media_data(message.value)
+            if media_hash(data) != digest:
+                print(f"\n[warning] média {digest[:12]} corrompu, ignoré")
+                return []
+            self.store.put(data, digest)
+            ready = self.pending_media.pop(digest, [])
+            for pending in ready:
+                pending.value = data
+            return ready
+        if message.message_type == MessageType.MEDIA.FETCH:
+            self.resend_media(message.value)
+            return []
+        digest = media_ref(message.value)
+        if digest is None:
+            if message.message_type in RECEPTION_FOR.values() and isinstance(message.value, (bytes, memoryview)):
+                self.store.put(message.value)
+            return [message]
+        if message.message_type == MessageType.WARNING:
+            # le serveur n'a plus le média : les messages en attente ne seront pas complétés
+            self.pending_media.pop(digest, None)
+            return [message]
+        data = self.store.get(digest)
+        if data is not None:
+            message.value = data
+            return [message]
+        if digest not in self.pending_media:
+            fetch = Message(MessageType.MEDIA.FETCH, emitter=self.username, receiver="SERVER", value={"media_ref": digest})
+            self.send_message(fetch)
+        self.pending_media.setdefault(digest, []).append(message)
+        return []
+
+    def resend_media(self, request):
+        """Le serveur n'a plus le média qu'on a envoyé par empreinte : on renvoie les octets"""
+        data = self.store.get(media_ref(request))
+        if data is None:
+            print(f"\n[warning] média {media_ref(request)[:12]} introuvable, envoi abandonné")
+            return
+        message = Message(request["message_type"], emitter=self.username, receiver=request["receiver"], value=data)
+        self.send_payload(message.to_binary(), websocket.ABNF.OPCODE_BINARY)
+
+    def send_message(self, message):
+        """Envoie message avec le codec négocié"""
+        self.send_payload(message.encode(self.codec), self.codec.opcode)
+
+    def send_payload(self, payload, opcode=websocket.ABNF.OPCODE_TEXT):
+        """Envoie un message, compressé si permessage-deflate est actif et que le message s'y prête"""
+        if self.deflate is None:
+            self.ws.send(payload, opcode=opcode)
+            return
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self.send_lock:
+            data, compressed = self.deflate.deflate(payload, opcode)
+            self.ws.sock.send_frame(websocket.ABNF(1, int(compressed), 0, 0, opcode, 1, data))
+
+    def enable_deflate(self, ws):
+        """À appeler dans on_open : active la compression si le serveur l'a acceptée"""
+        self.deflate = client_deflate(ws.sock.getheaders()) if self.offer_deflate else None
+        if self.deflate:
+            buffer = ws.sock.frame_buffer
+            ws.sock.frame_buffer = InflatingFrameBuffer(buffer.recv, buffer.skip_utf8_validation, self.deflate)
+
+    def send_ack(self, count):
+        ack_msg = Message(MessageType.ACK, emitter=self.username, receiver="", value=count)
+        self.send_message(ack_msg)
 
     def on_error(self, ws, error):
         print(f"\n[error] {error}")
@@ -42,16 +289,41 @@ class WSClient:
     def on_close(self, ws, close_status_code, close_msg):
         print(f"\n[close] code={close_status_code} msg={close_msg}")
         self.connected = False
+        self.codec = JSON
+        self.server_features = set()
+        self.acks.stop()
 
     def on_client_list(self):
         message = Message(MessageType.ENVOI.CLIENT_LIST, emitter=self.username, receiver="", value="")
-        self.ws.send(message.to_json())
+        self.send_message(message)
+
+    def join_room(self, room):
+        """Rejoint un salon ("#nom") : ses messages arrivent avec receiver = "#nom" """
+        self.send_message(Message(MessageType.ROOM.JOIN, emitter=self.username, receiver="SERVER", value=room))
+
+    def leave_room(self, room):
+        self.send_message(Message(MessageType.ROOM.LEAVE, emitter=self.username, receiver="SERVER", value=room))
+
+    def declaration(self):
+        """Message DECLARATION ; la value annonce les capacités du client (vide = client historique)"""
+        features = ["ack"]
+        if self.binary or self.chunked or self.store is not None:
+            features.append("binary")
+        if self.chunked:
+            features.append("chunked")
+        if self.store is not None:
+            features.append("media_ref")
+        value = {"features": features}
+        if self.codecs:
+            value["codecs"] = list(self.codecs)
+        return Message(MessageType.DECLARATION, emitter=self.username, receiver="", value=value)
 
     def on_open(self, ws):
         print("[open] connecté")
         self.connected = True
-        message = Message(MessageType.DECLARATION, emitter=self.username, receiver="", value="")
-        ws.send(message.to_json())
+        self.enable_deflate(ws)
+        ws.send(self.declaration().to_json())
+        self.transfers.resume_all()
 
         input_thread = threading.Thread(target=self.input_loop, daemon=True)
         input_thread.start()
@@ -60,7 +332,8 @@ class WSClient:
         print(f"Chat démarré. Tapez 'dest:message' pour envoyer (ex: SERVER:bonjour)")
         print(f"Tapez 'img:dest:chemin' pour envoyer une image (ex: img:Client2:/path/image.png)")
         print(f"Tapez 'audio:dest:chemin' pour envoyer un audio (ex: audio:Client2:/path/audio.mp3)")
-        print(f"Tapez 'disconnect' pour quitter.\n")
+        print(f"Tapez 'join:#salon' / 'leave:#salon' pour les salons, puis '#salon:message' pour y écrire")
+        print(f"Tapez 'history' pour les 50 derniers messages, 'disconnect' pour quitter.\n")
         while self.connected:
             try:
                 print(f"[{self.username}] > ", end="", flush=True)
@@ -70,6 +343,13 @@ class WSClient:
                     self.ws.send(disconnect_msg.to_json())
                     self.ws.close()
                     break
+                if user_input.lower() == "history":
+                    self.request_history(last=50)
+                    continue
+                if user_input.lower().startswith(("join:", "leave:")):
+                    command, room = user_input.split(":", 1)
+                    (self.join_room if command.lower() == "join" else self.leave_room)(room.strip())
+                    continue
                 if user_input.lower().startswith("img:"):
                     parts = user_input[4:].split(":", 1)
                     if len(parts) == 2:
@@ -110,36 +390,54 @@ class WSClient:
 
     def send(self, value, dest):
         message = Message(MessageType.ENVOI.TEXT, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+        self.send_message(message)
 
-    def send_image(self, filepath, dest):
+    def on_transfer_complete(self, message_type, emitter, path):
+        print(f"\n[{emitter}] [{message_type} reçu par morceaux : {path}]")
+        print(f"[{self.username}] > ", end="", flush=True)
+
+    def _send_media(self, filepath, dest, message_type, prefix, attempt=0):
+        size = os.path.getsize(filepath)
+        self.sent_media[(message_type, dest)] = (filepath, prefix, attempt)
+        if self.store is not None:
+            # média déjà envoyé ou reçu : seule son empreinte part, le serveur la relaie depuis son store
+            digest = file_hash(filepath)
+            if "media_ref" in self.server_features and self.store.has(digest):
+                message = Message(message_type, emitter=self.username, receiver=dest, value=ref_value(digest, size))
+                self.send_message(message)
+                return
+        # un transfert par morceaux a un seul destinataire : pas pour ALL ni un salon
+        if self.chunked and dest != "ALL" and not is_room_name(dest) and size > CHUNK_SIZE:
+            self.transfers.send_file(filepath, dest, message_type)
+            return
         with open(filepath, "rb") as f:
-            img_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"IMG:{img_base64}"
-        message = Message(MessageType.ENVOI.IMAGE, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+            raw = f.read()
+        if self.store is not None:
+            self.store.put(raw, digest)
+        if self.binary or self.chunked or self.store is not None:
+            message = Message(message_type, emitter=self.username, receiver=dest, value=raw)
+            self.send_payload(message.to_binary(), websocket.ABNF.OPCODE_BINARY)
+            return
+        value = f"{prefix}{base64.b64encode(raw).decode('utf-8')}"
+        message = Message(message_type, emitter=self.username, receiver=dest, value=value)
+        self.send_message(message)
+
+    def send_image(self, filepath, dest):
+        self._send_media(filepath, dest, MessageType.ENVOI.IMAGE, "IMG:")
 
     def send_audio(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            audio_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"AUDIO:{audio_base64}"
-        message = Message(MessageType.ENVOI.AUDIO, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
-    
+        self._send_media(filepath, dest, MessageType.ENVOI.AUDIO, "AUDIO:")
+
     def send_video(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            video_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"VIDEO:{video_base64}"
-        message = Message(MessageType.ENVOI.VIDEO, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+        self._send_media(filepath, dest, MessageType.ENVOI.VIDEO, "VIDEO:")
 
     @staticmethod
-    def dev(username="Client"):
-        return WSClient(Context.dev(), username)
+    def dev(username="Client", binary=False):
+        return WSClient(Context.dev(), username, binary)
 
     @staticmethod
-    def prod(username="Client"):
-        return WSClient(Context.prod(), username)
+    def prod(username="Client", binary=False):
+        return WSClient(Context.prod(), username, binary)
 
 if __name__ == "__main__":
     import sys
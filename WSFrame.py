@@ -0,0 +1,144 @@
+import asyncio
+import os
+import struct
+from base64 import b64encode
+from hashlib import sha1
+
+# Constantes RFC 6455 (mêmes valeurs que websocket_server)
+FIN = 0x80
+RSV1 = 0x40     # message compressé (permessage-deflate)
+OPCODE = 0x0f
+MASKED = 0x80
+PAYLOAD_LEN = 0x7f
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE_CONN = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_STATUS_NORMAL = 1000
+CLOSE_STATUS_PROTOCOL_ERROR = 1002
+CLOSE_STATUS_MESSAGE_TOO_BIG = 1009
+
+# Taille maximale d'une trame reçue par le serveur (même borne que la décompression, voir Deflate)
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def accept_key(key):
+    """Calcule Sec-WebSocket-Accept à partir de Sec-WebSocket-Key"""
+    digest = sha1(key.encode() + GUID).digest()
+    return b64encode(digest).decode("ascii")
+
+
+def handshake_response(key, extensions=None):
+    extra = f"Sec-WebSocket-Extensions: {extensions}\r\n" if extensions else ""
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key(key)}\r\n"
+        f"{extra}"
+        "\r\n"
+    ).encode()
+
+
+def reject_response(retry_after):
+    """Réponse au handshake d'un client refusé parce que le serveur est saturé"""
+    return (
+        "HTTP/1.1 503 Service Unavailable\r\n"
+        f"Retry-After: {retry_after}\r\n"
+        "Content-Length: 0\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    ).encode()
+
+
+def frame_header(payload_length, opcode=OPCODE_TEXT, mask=False, rsv1=False):
+    """En-tête d'une trame FIN (sans la clé de masque)"""
+    mask_bit = MASKED if mask else 0
+    first = FIN | (RSV1 if rsv1 else 0) | opcode
+    if payload_length <= 125:
+        return struct.pack(">BB", first, mask_bit | payload_length)
+    if payload_length <= 65535:
+        return struct.pack(">BBH", first, mask_bit | 126, payload_length)
+    return struct.pack(">BBQ", first, mask_bit | 127, payload_length)
+
+
+def apply_mask(payload, masks):
+    """XOR du payload avec la clé de masque (4 octets)"""
+    if not payload:
+        return b""
+    length = len(payload)
+    key = int.from_bytes((masks * (length // 4 + 1))[:length], "big")
+    return (int.from_bytes(payload, "big") ^ key).to_bytes(length, "big")
+
+
+def encode_frame(payload, opcode=OPCODE_TEXT, mask=False):
+    """Construit une trame complète, prête à être écrite sur le socket"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    header = frame_header(len(payload), opcode, mask)
+    if mask:
+        masks = os.urandom(4)
+        return header + masks + apply_mask(payload, masks)
+    return header + payload
+
+
+def close_payload(status=CLOSE_STATUS_NORMAL, reason=b""):
+    return struct.pack("!H", status) + reason
+
+
+async def read_http_headers(reader):
+    """Lit la requête (ou réponse) HTTP d'ouverture et renvoie (ligne, headers)"""
+    raw = await reader.readuntil(b"\r\n\r\n")
+    lines = raw.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        head, value = line.split(":", 1)
+        headers[head.lower().strip()] = value.strip()
+    return lines[0], headers
+
+
+class FrameError(ValueError):
+    """Trame refusée avant la lecture de son payload ; status : code de fermeture à renvoyer"""
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+
+
+async def read_frame(reader, max_size=None, require_mask=False):
+    """Lit une trame et renvoie (fin, opcode, payload démasqué, rsv1)
+
+    max_size : FrameError (1009) dès l'en-tête si la trame annonce un payload plus grand.
+    require_mask : FrameError (1002) pour une trame non masquée (côté serveur, RFC 6455 §5.1).
+    """
+    b1, b2 = await reader.readexactly(2)
+    fin = b1 & FIN
+    rsv1 = b1 & RSV1
+    opcode = b1 & OPCODE
+    masked = b2 & MASKED
+    payload_length = b2 & PAYLOAD_LEN
+    if require_mask and not masked:
+        raise FrameError(CLOSE_STATUS_PROTOCOL_ERROR, "Client must always be masked")
+    if payload_length == 126:
+        payload_length = struct.unpack(">H", await reader.readexactly(2))[0]
+    elif payload_length == 127:
+        payload_length = struct.unpack(">Q", await reader.readexactly(8))[0]
+    if max_size and payload_length > max_size:
+        raise FrameError(CLOSE_STATUS_MESSAGE_TOO_BIG, f"Message too big ({payload_length} bytes)")
+    masks = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(payload_length)
+    if masks:
+        payload = apply_mask(payload, masks)
+    return fin, opcode, payload, rsv1
+
+
+def is_incomplete(exc):
+    return isinstance(exc, (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError))
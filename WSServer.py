@@ -1,51 +1,353 @@
-from websocket_server import WebsocketServer
+import math
+import os
 import threading
-import base64
+import struct
 import time
+from collections import deque
 
+from Admission import MEDIA_KINDS, AdmissionControl
+from AdminFeed import AdminFeed
+from AsyncWebsocketServer import AsyncWebsocketServer
+from ClientRegistry import ClientRegistry, is_admin_name
+from Cluster import JOIN, LEAVE, SEND, ClusterLink
+from Codecs import JSON, is_codec_frame, negotiate
 from Context import Context
-from Message import Message, MessageType
+from Delivery import NOT_RECEIVED, RECEIVED, DeliveryTracker, group_by_emitter, receipt_message
+from FanOut import FanOut
+from Journal import DIRECTORY as JOURNAL_DIRECTORY, Journal
+from KeepAlive import KeepAlive
+from MediaStore import MediaStore, media_ref, pack_media_data, ref_value
+from Message import BINARY_TYPES_BY_CODE, Message, MessageType, RECEPTION_FOR
+from Metrics import Metrics
+from Outbox import DIRECTORY as OUTBOX_DIRECTORY, MEDIA, TEXT, Outbox
+from Profiler import DIRECTORY as PROFILER_DIRECTORY, DURATION as PROFILE_DURATION, INTERVAL as PROFILE_INTERVAL, Profiler
+from RateLimit import ClientQuotas
+from RoomRegistry import RoomRegistry, is_room_name, room_name
+from ServerLog import ServerLog
+from ThreadedWebsocketServer import ThreadedWebsocketServer
+from Transfer import TRANSFER_TYPES, TransferRelay, is_transfer_id, reception_start, unpack_chunk_header
+from WSFrame import OPCODE_BINARY, OPCODE_TEXT, encode_frame
+
+
+# Les arrivées / départs dans cette fenêtre ne donnent qu'une RECEPTION_CLIENT_LIST ;
+# la fenêtre s'allonge avec le nombre de clients (chaque liste coûte O(N) à chacun des N)
+CLIENTS_LIST_DELAY = 0.05
+CLIENTS_LIST_MAX_DELAY = 1.0
+
+HISTORY_LAST = 500        # messages rejoués au plus par HISTORY_REQUEST
+HISTORY_BATCH_SIZE = 256  # messages par HISTORY_BATCH
+
+# Moteurs de transport disponibles : même API (set_fn_*, send_message, run_forever)
+ENGINES = {
+    "threaded": ThreadedWebsocketServer,
+    "asyncio": AsyncWebsocketServer,
+}
 
 
 class WSServer:
-    def __init__(self, ctx):
+    def __init__(self, ctx, engine="threaded", outbound=None, stats_interval=2.0, keepalive=None, admin_feed=None, log=None, deflate=None, media_store=None, sock=None, cluster=None, backlog=1024, handshake=None, quotas=None, outbox=None, journal=None, metrics=None, profiler=None, rooms=None, admission=None, max_message_size=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Moteur inconnu '{engine}', choix: {', '.join(ENGINES)}")
         self.host = ctx.host
+        # log : paramètres de ServerLog (level, rate, max_value, path, capacity)
+        self.log = ServerLog(**{"prompt": "[SERVER] > ", **(log or {})})
         self.port = ctx.port
-        self.server = WebsocketServer(host=self.host, port=self.port, loglevel=1)
+        self.engine = engine
+        # outbound : paramètres des files d'envoi par client (voir OutboundQueue)
+        # deflate : paramètres de permessage-deflate (level, min_size, max_inflated), False pour le refuser
+        # sock : socket d'écoute des workers de Cluster ; backlog : file du listen()
+        # handshake : paramètres de HandshakeLimiter (rate, burst, max_wait), False pour ne pas limiter
+        # admission : paramètres d'AdmissionControl (max_connections, max_inflight_bytes, max_relays,
+        # retry_after, connection_retry_after), False pour ne rien plafonner ; compté par worker en cluster
+        # max_message_size : taille maximale d'une trame reçue (64 Mo), au-delà la connexion est fermée en 1009
+        self.admission = None if admission is False else AdmissionControl(**(admission or {}))
+        if self.admission:
+            # toutes les files d'envoi tiennent le compte des octets et relais en cours
+            outbound = {**(outbound or {}), "budget": self.admission}
+        self.server = ENGINES[engine](
+            host=self.host, port=self.port, loglevel=1, outbound=outbound, deflate=deflate,
+            sock=sock, backlog=backlog, handshake=handshake, admission=self.admission,
+            max_message_size=max_message_size,
+        )
+        self.stats_interval = stats_interval
         self.server.set_fn_new_client(self.on_new_client)
         self.server.set_fn_client_left(self.on_client_left)
         self.server.set_fn_message_received(self.on_message_received)
+        self.server.set_fn_frame_dropped(self.on_frame_dropped)
 
-        self.clients = {}
+        # index nom / id / rôle ; capacités "binary" (trames média binaires) et "chunked" (TRANSFER_*)
+        self.clients = ClientRegistry()
+        self.transfers = TransferRelay()
+        # RECEPTION_* livrés et pas encore acquittés, par session (clients "ack")
+        self.delivery = DeliveryTracker()
+        # metrics : compteurs et histogrammes exportés vers le dashboard (/metrics), False pour ne rien mesurer
+        self.metrics = None if metrics is False else Metrics()
+        self.fanout = FanOut(self.server, metrics=self.metrics)
+        # keepalive : paramètres de KeepAlive (interval, timeout, tick), False pour désactiver
+        self.keepalive = None if keepalive is False else KeepAlive(self.server, self._evict, log=self.log, **(keepalive or {}))
+        # admin_feed : paramètres d'AdminFeed (interval, batch_size, max_pending, sample_every),
+        # False pour l'envoi synchrone historique d'un message par événement
+        self.admin_feed = None if admin_feed is False else AdminFeed(self._send_admin_message, log=self.log, **(admin_feed or {}))
+        # media_store : paramètres de MediaStore (max_bytes, directory), False pour relayer sans dédupliquer
+        self.media = None if media_store is False else MediaStore(**(media_store or {}))
+        # cluster : {"path": socket du broker, "worker": numéro} quand le serveur est un worker de Cluster
+        self.cluster = ClusterLink(self.on_cluster_packet, **cluster) if cluster else None
+        # quotas : {"limits": {type: {rate, burst, bytes_rate, bytes_burst}}, "report_interval": s}, False pour ne pas limiter
+        self.quotas = None if quotas is False else ClientQuotas(**(quotas or {}))
+        # outbox : paramètres d'Outbox (directory, ttl, max_bytes, max_total_bytes, sync_interval),
+        # False pour répondre "destinataire non trouvé" comme avant ; un répertoire par worker en cluster
+        if outbox is not False:
+            outbox = dict(outbox or {})
+            if cluster:
+                outbox["directory"] = os.path.join(outbox.get("directory", OUTBOX_DIRECTORY), f"worker-{cluster['worker']}")
+        self.outbox = None if outbox is False else Outbox(**outbox)
+        # journal : paramètres de Journal (directory, segment_bytes, max_bytes, max_age), False pour ne rien journaliser
+        if journal is not False:
+            journal = dict(journal or {})
+            if cluster:
+                journal["directory"] = os.path.join(journal.get("directory", JOURNAL_DIRECTORY), f"worker-{cluster['worker']}")
+        self.journal = None if journal is False else Journal(**journal)
+        # profiler : paramètres de Profiler (directory, max_duration, top), False pour refuser ADMIN_PROFILE
+        if profiler is not False:
+            profiler = dict(profiler or {})
+            if cluster:
+                profiler["directory"] = os.path.join(profiler.get("directory", PROFILER_DIRECTORY), f"worker-{cluster['worker']}")
+        self.profiler = None if profiler is False else Profiler(**profiler)
+        # rooms : paramètres de RoomRegistry (max_per_client), False pour refuser ROOM_JOIN
+        self.rooms = None if rooms is False else RoomRegistry(**(rooms or {}))
+        self._clients_list_timer = None
+        self._clients_list_lock = threading.Lock()
         self.running = False
 
-    def _admin_clients(self):
-        return [
-            client
-            for name, client in self.clients.items()
-            if name.upper().startswith("ADMIN")
-        ]
-
     def _send_admin_message(self, message):
-        for client in self._admin_clients():
-            self.server.send_message(client, message.to_json())
+        payload = message.to_json()
+        self._send_local_admins(payload, message.message_type)
+        if self.cluster and self.cluster.has_remote_admins():
+            self.cluster.publish("admin", payload, type=message.message_type)
+
+    def _send_local_admins(self, payload, label):
+        admins = self.clients.admin_clients()
+        if admins:
+            self.fanout.broadcast(admins, payload, label=label)
+
+    def _has_admins(self):
+        return bool(self.clients.admin_clients()) or bool(self.cluster and self.cluster.has_remote_admins())
+
+    def _client_names(self):
+        """Noms déclarés sur ce serveur, puis sur les autres workers du cluster, puis les salons ouverts"""
+        names = self.clients.names()
+        if self.cluster:
+            names += self.cluster.remote_names()
+        if self.rooms:
+            names += self.rooms.names()
+        return names
+
+    def _send_remote(self, name, op, payload, **header):
+        """Transmet au worker qui tient name ; False s'il n'est déclaré nulle part ailleurs"""
+        return bool(self.cluster) and self.cluster.send(name, op, payload, **header)
+
+    def on_cluster_packet(self, kind, header, body):
+        """Paquet d'un autre worker : annuaire modifié, ou message à livrer à nos clients"""
+        if kind in (JOIN, LEAVE):
+            self.schedule_clients_list()
+            if kind == JOIN:
+                for name in header["names"]:
+                    if self.outbox:
+                        # déclaré sur un autre worker : ses messages peuvent aussi attendre ici
+                        self.outbox.remember(name)
+                    self._drain_outbox(name)
+            return
+        op = header.get("op")
+        if op == "admin":
+            self._send_local_admins(bytes(body).decode("utf-8"), header.get("type"))
+            return
+        if op == "room":
+            if self.rooms:
+                self.rooms.set_remote(header["room"], header["worker"], header["open"])
+                self.schedule_clients_list()
+            return
+        if kind == SEND:
+            client = self.clients.get(header["to"], None)
+            if client is None:
+                return
+            targets = [(header["to"], client)]
+        elif header.get("room"):
+            # message de salon : seulement nos membres, s'il y en a
+            targets = self.rooms.items(header["room"]) if self.rooms else ()
+            if not targets:
+                return
+        else:
+            targets = self.clients.items()
+        if op == "text":
+            text = bytes(body).decode("utf-8")
+            for _, client in targets:
+                self.server.send_message(client, text)
+        elif op == "reception":
+            message = Message.from_json(bytes(body).decode("utf-8"))
+            if kind == SEND:
+                self._send_reception(targets[0][1], message, header.get("emitter"), header["to"])
+            else:
+                self._broadcast_reception([client for _, client in targets], message, message.message_type)
+        elif op == "media":
+            frame = bytearray(body)
+            digest = header.get("digest")
+            if self.media and digest:
+                digest, _ = self.media.put(memoryview(frame)[Message.read_binary_header(frame)[3]:], digest)
+            self._deliver_media(frame, targets, header.get("emitter"), digest)
+
+    def _hold(self, client, name, kind, payload, emitter):
+        """Garde un message pour name, hors ligne ou dont la boîte se vide encore ; False s'il ne s'est jamais déclaré ou si elle est pleine"""
+        if not name or name == "SERVER" or not self.outbox.put(name, kind, payload, emitter):
+            return False
+        if self.clients.get(name, None) is not None or (self.cluster and self.cluster.owner(name) is not None):
+            # en ligne, boîte en cours de vidange : il passe derrière les messages plus anciens
+            self._drain_outbox(name)
+        else:
+            notice = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=emitter, value=f"{name} est hors ligne, message mis en attente.")
+            self._send_reception(client, notice)
+        return True
+
+    def _drain_outbox(self, name):
+        """Vide la boîte de name dans un thread de fond : le routage en direct n'attend pas"""
+        if self.outbox and self.outbox.start_drain(name):
+            threading.Thread(target=self._drain_loop, args=(name,), daemon=True).start()
+
+    def _drain_loop(self, name):
+        def send(kind, emitter, payload):
+            client = self.clients.get(name, None)
+            if client is not None:
+                if kind == MEDIA:
+                    self._deliver_media(bytearray(payload), [(name, client)], emitter)
+                else:
+                    self._send_reception(client, payload, emitter, name)
+                return True
+            return self._send_remote(name, "media" if kind == MEDIA else "reception", payload, emitter=emitter)
+
+        delivered = self.outbox.drain(name, send)
+        if delivered:
+            self.log.info("[outbox] %d messages en attente livrés à %s", delivered, name)
 
     def _summarize_value(self, message_type, value):
-        if message_type in (MessageType.ENVOI.IMAGE, MessageType.RECEPTION.IMAGE):
-            size = len(value) if isinstance(value, str) else None
-            return {"kind": "image", "size": size}
-        if message_type in (MessageType.ENVOI.AUDIO, MessageType.RECEPTION.AUDIO):
-            size = len(value) if isinstance(value, str) else None
-            return {"kind": "audio", "size": size}
-        if message_type in (MessageType.ENVOI.VIDEO, MessageType.RECEPTION.VIDEO):
-            size = len(value) if isinstance(value, str) else None
-            return {"kind": "video", "size": size}
+        # un Message reçu est résumé sans décoder sa value
+        if isinstance(value, Message):
+            size = value.value_size()
+            value = value.value if message_type not in MEDIA_KINDS else value.parsed_value()
+            if media_ref(value):
+                return {"kind": MEDIA_KINDS.get(message_type), "size": value.get("size"), "media_ref": media_ref(value)}
+        else:
+            size = len(value) if isinstance(value, (str, bytes, bytearray, memoryview)) else None
+        if message_type in MEDIA_KINDS:
+            return {"kind": MEDIA_KINDS[message_type], "size": size}
         return value
 
+    @staticmethod
+    def _declared_codecs(value):
+        """Codecs proposés par le client, par préférence ; None s'il ne négocie pas"""
+        if isinstance(value, dict) and isinstance(value.get("codecs"), list):
+            return value["codecs"]
+        return None
+
+    @staticmethod
+    def _declared_features(value):
+        """Capacités annoncées dans la DECLARATION (value vide pour les anciens clients)"""
+        if isinstance(value, dict):
+            return set(value.get("features", []))
+        return set()
+
+    @staticmethod
+    def _codec(client):
+        # codec négocié à la DECLARATION, rangé dans le dict client du moteur
+        return client.get("codec", JSON)
+
+    def _send_reception(self, client, payload, emitter=None, receiver=None):
+        """Envoie un RECEPTION_* (Message, JSON ou trame binaire) à un client, suivi jusqu'à son ACK"""
+        if isinstance(payload, Message):
+            codec = self._codec(client)
+            frame = encode_frame(payload.encode(codec), codec.opcode)
+        else:
+            frame = encode_frame(payload, OPCODE_TEXT if isinstance(payload, str) else OPCODE_BINARY)
+        self.delivery.send(client, frame, self.server.send_frame, emitter, receiver)
+        if self.metrics:
+            self.metrics.message_out(payload.message_type if isinstance(payload, Message) else Message.peek_type(payload), len(frame))
+
+    def _broadcast(self, clients, payload, label, send=None):
+        """Diffusion serialize-once ; un Message est encodé une fois par codec présent"""
+        if not isinstance(payload, Message):
+            return self.fanout.broadcast(clients, payload, label=label, send=send)
+        groups = {}
+        for client in clients:
+            groups.setdefault(self._codec(client), []).append(client)
+        total = {"clients": 0, "write_ms": 0.0}
+        for codec, members in groups.items():
+            record = self.fanout.broadcast(members, payload.encode(codec), opcode=codec.opcode, label=label, send=send)
+            total["clients"] += record["clients"]
+            total["write_ms"] = round(total["write_ms"] + record["write_ms"], 3)
+        return total
+
+    def _broadcast_reception(self, clients, payload, label):
+        return self._broadcast(clients, payload, label, send=self._send_tracked)
+
+    def _send_tracked(self, client, frame):
+        """Mise en file d'une trame de diffusion, numérotée pour l'ACK cumulatif du client"""
+        return self.delivery.send(client, frame, self.server.send_frame)
+
+    def _send_receipts(self, deliveries, status):
+        """Accusés "message reçu / non reçu" groupés : un SYS_MESSAGE par émetteur et destinataire"""
+        for (emitter, receiver), count in group_by_emitter(deliveries).items():
+            emitter_client = self.clients.get(emitter, None)
+            if emitter_client:
+                self.server.send_message(emitter_client, receipt_message(emitter, receiver, status, count).to_json())
+            else:
+                self._send_remote(emitter, "text", receipt_message(emitter, receiver, status, count).to_json())
+
+    def _deliver_media(self, frame, targets, emitter=None, digest=None):
+        """Envoie une trame média binaire, convertie une seule fois en JSON/base64 pour les anciens clients
+
+        Avec une empreinte, les clients "media_ref" qui ont déjà reçu ou envoyé ce média
+        reçoivent une référence de quelques octets et ne demandent les octets qu'en cas d'absence.
+        """
+        refs, binary, legacy = [], [], []
+        for name, client in targets:
+            if digest and self.clients.has_feature(name, "media_ref"):
+                # seulement si ce client l'a eu : sinon la référence coûterait un aller-retour MEDIA_FETCH
+                (refs if self.media.knows(client, digest) else binary).append((name, client))
+                self.media.remember(client, digest)
+            elif self.clients.has_feature(name, "binary"):
+                binary.append((name, client))
+            else:
+                legacy.append((name, client))
+        label, frame_emitter, frame_receiver, offset = Message.read_binary_header(frame)
+        groups = (
+            (refs, lambda: Message(label, ref_value(digest, len(frame) - offset), frame_emitter, frame_receiver)),
+            (binary, lambda: frame),
+            (legacy, lambda: Message.from_binary(frame).to_base64_json()),
+        )
+        for group, payload in groups:
+            if not group:
+                continue
+            if len(targets) == 1:
+                self._send_reception(group[0][1], payload(), emitter, group[0][0])
+            else:
+                self._broadcast_reception([client for _, client in group], payload(), label)
+
     def _log_admin_event(self, log_type, emitter, receiver, message_type=None, value=None, meta=None):
+        journaled = self.journal is not None and log_type == MessageType.ADMIN.ROUTING_LOG
+        admins = self._has_admins()
+        if not journaled and not admins:
+            return
+        summary = self._summarize_value(message_type, value)
+        if journaled:
+            # chaque message routé, résumé comme pour le dashboard (un média n'y est que sa taille ou son empreinte)
+            self.journal.append(message_type, emitter, receiver, summary, meta)
+        if not admins:
+            return
+        if self.admin_feed:
+            # mise en file seulement : le routage n'attend jamais le dashboard
+            self.admin_feed.publish(log_type, emitter, receiver, message_type, summary, meta)
+            return
         payload = {
             "message_type": message_type,
-            "value": self._summarize_value(message_type, value),
+            "value": summary,
             "timestamp": time.time(),
         }
         if meta:
@@ -53,57 +355,575 @@ class WSServer:
         admin_msg = Message(log_type, emitter=emitter, receiver=receiver, value=payload)
         self._send_admin_message(admin_msg)
 
+    def queue_stats(self):
+        """Profondeur de file et compteurs de pertes par client déclaré"""
+        stats = {}
+        for name, client in self.clients.items():
+            stats[name] = self.server.queue_stats(client)
+            delivery = self.delivery.snapshot(client)
+            if delivery:
+                stats[name]["delivery"] = delivery
+            throttled = self.quotas.counters(client) if self.quotas else None
+            if throttled:
+                stats[name]["throttled"] = throttled
+        return stats
+
+    def metrics_snapshot(self):
+        """Compteurs et histogrammes, plus les relevés du moment (clients, files d'envoi)"""
+        queues = [self.server.queue_stats(client) for client in self.clients.clients()]
+        return self.metrics.snapshot({
+            "clients": len(self.clients),
+            "queue_frames": sum(queue["depth"] for queue in queues),
+            "queue_bytes": sum(queue["bytes"] for queue in queues),
+            "queue_depth_max": max((queue["depth"] for queue in queues), default=0),
+        })
+
+    def _stats_loop(self):
+        while self.running:
+            time.sleep(self.stats_interval)
+            if self._has_admins():
+                # en cluster, chaque worker envoie les files de ses propres clients
+                emitter = f"SERVER-{self.cluster.worker}" if self.cluster else "SERVER"
+                stats_msg = Message(MessageType.ADMIN.QUEUE_STATS, emitter=emitter, receiver="ADMIN", value=self.queue_stats())
+                self._send_admin_message(stats_msg)
+                if self.metrics:
+                    metrics_msg = Message(MessageType.ADMIN.METRICS, emitter=emitter, receiver="ADMIN", value=self.metrics_snapshot())
+                    self._send_admin_message(metrics_msg)
+
+    def _evict(self, client):
+        """Client sans pong dans le délai : connexion coupée, client_left fera le ménage"""
+        name = self.clients.name_of(client) or f"id={client['id']}"
+        self.log.warning("[keep-alive] %s ne répond plus au ping, déconnexion", name)
+        self.server.drop_client(client)
+
     def on_new_client(self, client, server):
-        print(f"\n[+] Client connecté: id={client['id']} addr={client['address']}")
+        self.log.info("[+] Client connecté: id=%s addr=%s", client["id"], client["address"])
+        if self.metrics:
+            self.metrics.incr("connects")
+        if self.keepalive:
+            self.keepalive.add(client)
         welcome_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver="", value="Bienvenue !")
         server.send_message(client, welcome_msg.to_json())
-        self.broadcast_clients_list()
-        print("[SERVER] > ", end="", flush=True)
+        # pas de liste ici : le client n'est pas encore déclaré, elle ne changerait pas
 
     def on_client_left(self, client, server):
-        print(f"\n[-] Client déconnecté: id={client['id']}")
-        left_name = None
-        for name, c in list(self.clients.items()):
-            if c['id'] == client['id']:
-                left_name = name
-                del self.clients[name]
-        
-        self.broadcast_clients_list()
+        self.log.info("[-] Client déconnecté: id=%s", client["id"])
+        left_name = self.clients.remove_client(client)
+        if left_name and self.cluster:
+            self.cluster.leave(left_name)
+        if self.media:
+            self.media.forget(client)
+        if self.quotas:
+            self.quotas.forget(client)
+        self._send_receipts(self.delivery.stop(client), NOT_RECEIVED)
+        evicted = self.keepalive.remove(client) if self.keepalive else False
+        if self.metrics:
+            self.metrics.incr("disconnects")
+            if evicted:
+                self.metrics.incr("evictions")
+        if self.rooms:
+            for room in self.rooms.remove_client(client):
+                self._room_changed(room, opened=False)
         if left_name:
+            self.schedule_clients_list()
+        if left_name or evicted:
+            meta = {"client_id": client["id"], "address": client.get("address"), "queue": self.server.queue_stats(client)}
+            if evicted:
+                meta["reason"] = "keepalive_timeout"
             self._log_admin_event(
                 MessageType.ADMIN.CLIENT_DISCONNECTED,
-                emitter=left_name,
+                emitter=left_name or f"id={client['id']}",
                 receiver="SERVER",
                 message_type=MessageType.ADMIN.CLIENT_DISCONNECTED,
-                value="disconnected",
-                meta={"client_id": client["id"], "address": client.get("address")},
+                value="evicted" if evicted else "disconnected",
+                meta=meta,
             )
 
-        print("[SERVER] > ", end="", flush=True)
+
+    def schedule_clients_list(self):
+        """Diffuse la liste des clients sous peu : une vague de connexions n'en envoie qu'une"""
+        with self._clients_list_lock:
+            if self._clients_list_timer is not None:
+                return
+            delay = min(CLIENTS_LIST_MAX_DELAY, CLIENTS_LIST_DELAY * (1 + len(self.clients) / 100))
+            self._clients_list_timer = threading.Timer(delay, self._flush_clients_list)
+            self._clients_list_timer.daemon = True
+            self._clients_list_timer.start()
+
+    def _flush_clients_list(self):
+        with self._clients_list_lock:
+            self._clients_list_timer = None
+        self.broadcast_clients_list()
 
     def broadcast_clients_list(self):
         """Envoie la liste des clients à tous"""
-        clients_ids = list(self.clients.keys())
+        clients_ids = list(self._client_names())
 
         msg = Message(
             MessageType.RECEPTION.CLIENT_LIST,
             emitter="SERVER",
             receiver="ALL",
             value=clients_ids
-        ).to_json()
+        )
 
-        for client in self.clients.values():
-            self.server.send_message(client, msg)
+        self._broadcast(self.clients.clients(), msg, MessageType.RECEPTION.CLIENT_LIST)
+
+    def on_frame_dropped(self, client, server, frame):
+        """Trame jetée par la file d'envoi d'un client lent"""
+        lost = self.delivery.dropped(client, frame)
+        if lost:
+            self._send_receipts([lost], NOT_RECEIVED)
+
+    def on_ack(self, client, received_msg):
+        """ACK cumulatif (ou "MESSAGE OK" historique, qui vaut un message de plus)"""
+        if received_msg.message_type == MessageType.ACK:
+            try:
+                count = int(received_msg.value)
+            except (TypeError, ValueError):
+                return
+        else:
+            count = self.delivery.acked(client) + 1
+        self._send_receipts(self.delivery.ack(client, count), RECEIVED)
+
+    def on_binary_received(self, client, server, message):
+        """Relaie une trame média binaire en ne lisant que son en-tête"""
+        try:
+            message_type, emitter, receiver, offset = Message.read_binary_header(message)
+        except (KeyError, ValueError, struct.error):
+            self.log.warning("trame binaire invalide")
+            return
+        payload = memoryview(message)[offset:]
+        if message_type == MessageType.TRANSFER.CHUNK:
+            self._relay_chunk(server, client, message, payload)
+            return
+        if not self._admit_media(client, message_type, emitter, receiver, len(payload)):
+            return
+        self.log.info("[message binaire reçu] %s %s -> %s (%d octets)", message_type, emitter, receiver, len(payload))
+        reception_type = RECEPTION_FOR.get(message_type)
+        if reception_type is None:
+            return
+        digest, repeated = None, False
+        if self.media:
+            digest, repeated = self.media.put(payload)
+            self.media.remember(client, digest)
+        self._log_admin_event(
+            MessageType.ADMIN.ROUTING_LOG,
+            emitter=emitter,
+            receiver=receiver,
+            message_type=message_type,
+            value=payload,
+            meta={"media_ref": digest, "duplicate": repeated} if digest else None,
+        )
+        self._route_media(client, message, reception_type, emitter, receiver, digest)
+
+    def _route_media(self, client, frame, reception_type, emitter, receiver, digest=None):
+        frame = Message.retype_binary(frame, reception_type)
+        if receiver == "ALL":
+            targets = self.clients.items()
+            if self.cluster:
+                self.cluster.publish("media", frame, emitter=emitter, digest=digest)
+        elif is_room_name(receiver):
+            targets = self._room_members(client, receiver, emitter)
+            if targets is None:
+                return
+            if self.cluster and self.rooms.has_remote(receiver):
+                self.cluster.publish("media", frame, emitter=emitter, digest=digest, room=receiver)
+        else:
+            receiver_client = self.clients.get(receiver, None)
+            if self.outbox and self.outbox.holds(receiver) and self._hold(client, receiver, MEDIA, frame, emitter):
+                return
+            if not receiver_client and self._send_remote(receiver, "media", frame, emitter=emitter, digest=digest):
+                return
+            if not receiver_client and self.outbox and self._hold(client, receiver, MEDIA, frame, emitter):
+                return
+            if not receiver_client:
+                error_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=emitter, value=f"Erreur: destinataire {receiver} non trouvé.")
+                self._send_reception(client, error_msg)
+                if self.metrics:
+                    self.metrics.incr("unknown_receiver")
+                return
+            targets = [(receiver, receiver_client)]
+        self._deliver_media(frame, targets, emitter, digest)
+
+    def _room_members(self, client, room, emitter):
+        """Membres locaux du salon ; None (et une erreur à l'émetteur) s'il n'en est pas membre"""
+        if self.rooms and self.rooms.is_member(room, client):
+            return self.rooms.items(room)
+        error_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=emitter, value=f"Erreur: vous n'êtes pas membre de {room}.")
+        self._send_reception(client, error_msg)
+        return None
+
+    def on_room_request(self, client, received_msg):
+        """ROOM_JOIN / ROOM_LEAVE d'un client déclaré ; la réponse porte le nombre de membres"""
+        name = self.clients.name_of(client)
+        room = room_name(received_msg.parsed_value())
+        joining = received_msg.message_type == MessageType.ROOM.JOIN
+        result = error = None
+        if not self.rooms:
+            error = "Salons désactivés"
+        elif name is None:
+            error = "Déclaration requise avant de rejoindre un salon"
+        elif room is None:
+            error = "Nom de salon invalide"
+        elif joining:
+            result = self.rooms.join(room, name, client)
+            if result is None:
+                error = f"Trop de salons (max {self.rooms.max_per_client})"
+        else:
+            result = self.rooms.leave(room, client)
+            if result is None:
+                error = f"Vous n'êtes pas membre de {room}"
+        if error:
+            warning = Message(MessageType.WARNING, emitter="SERVER", receiver=received_msg.emitter, value=error)
+            self.server.send_message(client, warning.to_json())
+            return
+        members, changed = result
+        self.log.info("[salon] %s %s %s (%d membres)", name, "rejoint" if joining else "quitte", room, members)
+        response = Message(received_msg.message_type, emitter="SERVER", receiver=name, value={"room": room, "members": members})
+        self.server.send_message(client, response.to_json())
+        if changed:
+            self._room_changed(room, opened=joining)
+
+    def _room_changed(self, room, opened):
+        """Salon ouvert ou fermé sur ce serveur : les autres workers et la liste des clients suivent"""
+        if self.cluster:
+            self.cluster.publish("room", b"", room=room, worker=self.cluster.worker, open=opened)
+        self.schedule_clients_list()
+
+    def on_media_ref(self, client, server, received_msg, digest):
+        """Média envoyé par référence : relayé depuis le store, ou redemandé à l'émetteur s'il n'y est plus"""
+        data = self.media.get(digest)
+        if data is None:
+            fetch = Message(
+                MessageType.MEDIA.FETCH,
+                emitter="SERVER",
+                receiver=received_msg.emitter,
+                value={"media_ref": digest, "message_type": received_msg.message_type, "receiver": received_msg.receiver},
+            )
+            server.send_message(client, fetch.to_json())
+            return
+        if not self._admit_media(client, received_msg.message_type, received_msg.emitter, received_msg.receiver, len(data)):
+            return
+        self.media.remember(client, digest)
+        frame = bytearray(Message(received_msg.message_type, data, received_msg.emitter, received_msg.receiver).to_binary())
+        reception_type = RECEPTION_FOR[received_msg.message_type]
+        self._route_media(client, frame, reception_type, received_msg.emitter, received_msg.receiver, digest)
+
+    def on_media_fetch(self, client, server, received_msg):
+        """Client qui n'a pas (ou plus) le média référencé : on lui envoie les octets"""
+        digest = media_ref(received_msg.value)
+        data = self.media.get(digest) if self.media and digest else None
+        if data is None:
+            warning = Message(MessageType.WARNING, emitter="SERVER", receiver=received_msg.emitter, value={"media_ref": digest, "error": "Média absent du serveur"})
+            server.send_message(client, warning.to_json())
+            return
+        self.media.remember(client, digest)
+        message = Message(MessageType.MEDIA.DATA, pack_media_data(digest, data), "SERVER", received_msg.emitter)
+        server.send_binary(client, message.to_binary())
+
+    def on_history_request(self, client, received_msg):
+        """Historique rejoué depuis le journal dans un thread de fond : tout pour un admin, ses conversations pour un client"""
+        # le filtre porte sur le nom déclaré par la connexion, pas sur le champ emitter choisi par le client
+        name = self.clients.name_of(client)
+        if name is None:
+            self.log.warning("[historique] demande refusée de id=%s (client non déclaré)", client["id"])
+            refused = Message(MessageType.WARNING, emitter="SERVER", receiver=received_msg.emitter, value="Historique réservé aux clients déclarés")
+            self.server.send_message(client, refused.to_json())
+            return
+        value = received_msg.parsed_value()
+        value = value if isinstance(value, dict) else {}
+        try:
+            since = float(value.get("since") or 0)
+            last = max(1, int(value.get("last") or HISTORY_LAST))
+            if math.isnan(since):
+                raise ValueError(since)
+        except (TypeError, ValueError, OverflowError):
+            # valeurs venues du client : une demande malformée reçoit une erreur, la connexion reste ouverte
+            error_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=name, value="Erreur: demande d'historique invalide (since : timestamp, last : entier).")
+            self._send_reception(client, error_msg)
+            return
+        # jusqu'à maintenant : la suite arrive en direct, sans doublon
+        until = time.time()
+        threading.Thread(
+            target=self._replay_history,
+            args=(client, name, since, until, last),
+            daemon=True,
+        ).start()
+
+    def on_profile_request(self, client, received_msg):
+        """ADMIN_PROFILE d'un admin : ouvre une fenêtre de profilage, le résumé part aux admins à la fin"""
+        name = self.clients.name_of(client)
+        if not is_admin_name(name):
+            self.log.warning("[profil] demande refusée de %s (réservé aux admins)", name or f"id={client['id']}")
+            refused = Message(MessageType.WARNING, emitter="SERVER", receiver=received_msg.emitter, value="Profilage réservé aux admins")
+            self.server.send_message(client, refused.to_json())
+            return
+        value = received_msg.parsed_value()
+        value = value if isinstance(value, dict) else {}
+        self.start_profile(
+            value.get("duration", PROFILE_DURATION),
+            value.get("interval", PROFILE_INTERVAL),
+            value.get("memory", True),
+            requested_by=name,
+        )
+
+    def start_profile(self, duration=PROFILE_DURATION, interval=PROFILE_INTERVAL, memory=True, requested_by="SERVER"):
+        """Fenêtre de profilage (piles + tracemalloc) ; renvoie ses paramètres, None si indisponible ou déjà en cours"""
+        if not self.profiler:
+            status = {"status": "disabled"}
+            params = None
+        else:
+            try:
+                params = self.profiler.start(duration, interval, memory, on_done=self._profile_done)
+            except (TypeError, ValueError):
+                params = None
+            status = {"status": "started", **params} if params else {"status": "busy", "active": self.profiler.snapshot()["active"]}
+        self.log.info("[profil] %s demandé par %s", status["status"], requested_by)
+        self._send_profile_status({**status, "requested_by": requested_by})
+        return params
+
+    def _profile_done(self, summary):
+        top = ", ".join(f"{entry['function']} {entry['pct']}%" for entry in summary.get("top_self", [])[:3])
+        self.log.info("[profil] terminé : %s échantillons actifs, %s -> %s", summary.get("busy_samples"), top or summary.get("error"), summary.get("files"))
+        self._send_profile_status({"status": "error" if "error" in summary else "done", **summary})
+
+    def _send_profile_status(self, value):
+        if self._has_admins():
+            emitter = f"SERVER-{self.cluster.worker}" if self.cluster else "SERVER"
+            self._send_admin_message(Message(MessageType.ADMIN.PROFILE, emitter=emitter, receiver="ADMIN", value=value))
+
+    def _replay_history(self, client, name, since, until, last):
+        events = []
+        if self.journal:
+            rooms = self.rooms.rooms_of(client) if self.rooms else frozenset()
+            match = None if is_admin_name(name) else (
+                lambda event: name in (event["emitter"], event["receiver"]) or event["receiver"] == "ALL" or event["receiver"] in rooms
+            )
+            # fenêtre glissante : seuls les last derniers messages restent en mémoire
+            events = list(deque(self.journal.replay(since, until, match), maxlen=last))
+        for start in range(0, max(len(events), 1), HISTORY_BATCH_SIZE):
+            chunk = events[start:start + HISTORY_BATCH_SIZE]
+            batch = Message(MessageType.HISTORY.BATCH, emitter="SERVER", receiver=name, value={
+                "events": chunk,
+                "done": start + HISTORY_BATCH_SIZE >= len(events),
+            })
+            self.server.send_message(client, batch.to_json())
+
+    def _relay_chunk(self, server, client, frame, payload):
+        """Relaie un morceau dès son arrivée, sans jamais assembler le fichier"""
+        try:
+            transfer_id, index = unpack_chunk_header(payload)
+        except (ValueError, struct.error):
+            return
+        # l'émetteur écrit dans l'en-tête binaire : seule la connexion de l'émetteur du transfert compte
+        transfer = self._transfer_party(client, transfer_id, "emitter")
+        if transfer is None:
+            return
+        receiver_client = self.clients.get(transfer.receiver, None)
+        if receiver_client is None:
+            # le destinataire reprendra au prochain TRANSFER_START
+            return
+        transfer.touch()
+        server.send_binary(receiver_client, frame)
+
+    def on_transfer_message(self, client, server, received_msg):
+        """TRANSFER_START / ACK / END : suivi du dernier morceau acquitté pour la reprise"""
+        value = received_msg.value if isinstance(received_msg.value, dict) else {}
+        transfer_id = value.get("transfer_id")
+        if not is_transfer_id(transfer_id):
+            return
+        if received_msg.message_type == MessageType.TRANSFER.START:
+            emitter = self.clients.name_of(client)
+            if emitter is None:
+                # connexion non déclarée : pas de nom sous lequel ouvrir le transfert
+                return
+            receiver_client = self.clients.get(received_msg.receiver, None)
+            if receiver_client is None or not self.clients.has_feature(received_msg.receiver, "chunked"):
+                warning = Message(
+                    MessageType.WARNING,
+                    emitter="SERVER",
+                    receiver=emitter,
+                    value={"transfer_id": transfer_id, "error": f"Destinataire {received_msg.receiver} absent ou sans transfert par morceaux"},
+                )
+                server.send_message(client, warning.to_json())
+                return
+            if self.transfers.get(transfer_id) is not None and self._transfer_party(client, transfer_id, "emitter") is None:
+                # reprise : seul l'émetteur d'origine relance son transfert
+                return
+            if self.admission and self.transfers.get(transfer_id) is None:
+                # nouveau transfert seulement : une reprise garde sa place, les morceaux ne sont jamais refusés
+                media_type = value.get("media_type")
+                refused = self.admission.check(media_type, value.get("size") or 0, self.transfers.active(media_type))
+                if refused:
+                    self.on_shed(client, media_type, received_msg.receiver, *refused, transfer_id=transfer_id)
+                    return
+            transfer = self.transfers.start(emitter, received_msg.receiver, value)
+            forward = Message(MessageType.TRANSFER.START, emitter=emitter, receiver=received_msg.receiver, value=reception_start(value, transfer.acked + 1))
+            server.send_message(receiver_client, forward.to_json())
+            ack = Message(MessageType.TRANSFER.ACK, emitter="SERVER", receiver=emitter, value={"transfer_id": transfer_id, "index": transfer.acked, "reset": True})
+            server.send_message(client, ack.to_json())
+            if transfer.acked == -1:
+                self._log_admin_event(
+                    MessageType.ADMIN.ROUTING_LOG,
+                    emitter=emitter,
+                    receiver=received_msg.receiver,
+                    message_type=transfer.media_type,
+                    meta={"transfer_id": transfer_id, "size": transfer.size, "chunks": transfer.chunks},
+                )
+        elif received_msg.message_type == MessageType.TRANSFER.ACK:
+            # seul le destinataire acquitte : un tiers qui connaît l'id ne fait ni sauter ni recommencer le transfert
+            if self._transfer_party(client, transfer_id, "receiver") is None:
+                return
+            transfer = self.transfers.ack(transfer_id, value.get("index", -1), value.get("reset", False))
+            if transfer is None:
+                return
+            sender_client = self.clients.get(transfer.emitter, None)
+            if sender_client:
+                server.send_message(sender_client, received_msg.to_json())
+        elif received_msg.message_type == MessageType.TRANSFER.END:
+            if self._transfer_party(client, transfer_id, "emitter") is None:
+                return
+            transfer = self.transfers.end(transfer_id)
+            if transfer is None:
+                return
+            receiver_client = self.clients.get(transfer.receiver, None)
+            if receiver_client:
+                server.send_message(receiver_client, received_msg.to_json())
+
+    def _transfer_party(self, client, transfer_id, role):
+        """Le transfert si la connexion est déclarée sous le nom de son émetteur ou de son destinataire (role), sinon None
+
+        Le nom vient du registre et non du champ emitter du message, que le client choisit librement.
+        """
+        transfer = self.transfers.get(transfer_id)
+        if transfer is None:
+            return None
+        name = self.clients.name_of(client)
+        if name is not None and name == getattr(transfer, role):
+            return transfer
+        self.log.warning("[transfert] %s non autorisé sur %s (%s attendu)", name or f"id={client['id']}", transfer_id, role)
+        return None
+
+    def _admit_media(self, client, message_type, emitter, receiver, size):
+        """False (et un WARNING avec retry_after à l'émetteur) pour un média refusé parce que le serveur est chargé"""
+        refused = self.admission.check(message_type, size) if self.admission else None
+        if refused is None:
+            return True
+        self.on_shed(client, message_type, receiver, *refused)
+        return False
+
+    def on_shed(self, client, message_type, receiver, reason, retry_after, transfer_id=None):
+        """Média différé : l'émetteur le renverra après retry_after secondes, le texte continue de passer"""
+        name = self.clients.name_of(client) or f"id={client['id']}"
+        value = {"message_type": message_type, "receiver": receiver, "reason": reason, "retry_after": retry_after}
+        if transfer_id:
+            value["transfer_id"] = transfer_id
+        warning = Message(MessageType.WARNING, emitter="SERVER", receiver=name, value=value)
+        self.server.send_message(client, warning.to_json())
+        self.log.warning("[admission] %s de %s différé (%s, réessai dans %s s)", message_type, name, reason, retry_after)
+        if self.metrics:
+            self.metrics.incr("shed")
+
+    def _over_quota(self, client, server, message_type, size):
+        """True si le message dépasse le budget du client (signalé au plus une fois par intervalle)"""
+        refused = self.quotas.check(client, message_type, size)
+        if not refused:
+            return False
+        reason, report = refused
+        if report:
+            self.on_throttled(client, server, message_type or "default", reason)
+        return True
+
+    def on_throttled(self, client, server, message_type, reason):
+        """Message au-delà du budget du client : WARNING au client et compteurs au dashboard"""
+        name = self.clients.name_of(client) or f"id={client['id']}"
+        counters = self.quotas.counters(client)
+        warning = Message(MessageType.WARNING, emitter="SERVER", receiver=name, value={
+            "message_type": message_type,
+            "reason": reason,
+            "throttled": counters,
+        })
+        server.send_message(client, warning.to_json())
+        self.log.warning("[quota] %s limité (%s, %s)", name, message_type, reason)
+        self._log_admin_event(
+            MessageType.ADMIN.THROTTLE,
+            emitter=name,
+            receiver="SERVER",
+            message_type=message_type,
+            value=reason,
+            meta={"client_id": client["id"], "throttled": counters},
+        )
 
     def on_message_received(self, client, server, message):
-        print(f"\n[message reçu] {message}")
-        received_msg = Message.from_json(message)
+        if self.metrics is None:
+            self._handle_message(client, server, message)
+            return
+        started = time.perf_counter_ns()
+        message_type = self._handle_message(client, server, message)
+        self.metrics.message_in(message_type, len(message), time.perf_counter_ns() - started)
+
+    def _handle_message(self, client, server, message):
+        """Traite une trame reçue ; renvoie son type (pour les métriques)"""
+        if self.keepalive:
+            self.keepalive.touch(client)
+        binary = isinstance(message, (bytes, bytearray)) and not is_codec_frame(message)
+        peeked = None
+        if self.quotas:
+            # avant tout décodage : le type se lit en tête de trame, un message refusé ne coûte rien de plus
+            peeked = Message.peek_type(message)
+            if (peeked is not None or binary) and self._over_quota(client, server, peeked, len(message)):
+                return peeked
+        if binary:
+            # lu avant le relais, qui retype la trame sur place
+            message_type = BINARY_TYPES_BY_CODE.get(message[0]) if message else None
+            self.on_binary_received(client, server, message)
+            return message_type
+        received_msg = Message.from_frame(message)
+        if self.quotas and peeked is None and self._over_quota(client, server, received_msg.message_type, len(message)):
+            # clés JSON dans un autre ordre ou trame d'un codec : le type réel n'est connu qu'après décodage
+            return received_msg.message_type
+        if received_msg.message_type == MessageType.SYS_MESSAGE and received_msg.value == "pong":
+            # réponse au keep-alive : touch() a déjà noté l'activité
+            return received_msg.message_type
+        if received_msg.message_type == MessageType.ACK or (
+            received_msg.message_type == MessageType.SYS_MESSAGE and received_msg.value == "MESSAGE OK"
+        ):
+            self.on_ack(client, received_msg)
+            return received_msg.message_type
+        self.log.info("[message reçu] %s", message)
         if received_msg.message_type == MessageType.DECLARATION:
+            if is_room_name(received_msg.emitter):
+                warning = Message(MessageType.WARNING, emitter="SERVER", receiver=received_msg.emitter, value=f"Nom réservé aux salons : {received_msg.emitter}")
+                server.send_message(client, warning.to_json())
+                return received_msg.message_type
             response = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=received_msg.emitter, value=f"Déclaration reçue de {received_msg.emitter}")
             server.send_message(client, response.to_json())
-            self.clients[received_msg.emitter] = client
-            print(f"[info] Client '{received_msg.emitter}' enregistré")
-            self.broadcast_clients_list()
+            features = self._declared_features(received_msg.value)
+            codecs = self._declared_codecs(received_msg.value)
+            if codecs is not None:
+                # annonce en JSON, puis tout ce qui est diffusé à ce client utilise le codec choisi
+                client["codec"] = negotiate(codecs)
+                chosen = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver=received_msg.emitter, value={"codec": client["codec"].name})
+                server.send_message(client, chosen.to_json())
+            if "media_ref" in features:
+                # le client n'envoie de références que si le serveur a un store pour les résoudre
+                offered = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver=received_msg.emitter, value={"features": ["media_ref"] if self.media else []})
+                server.send_message(client, offered.to_json())
+            if "ack" in features:
+                # ACK 0 : début de session, le client compte les RECEPTION_* à partir d'ici
+                start = Message(MessageType.ACK, emitter="SERVER", receiver=received_msg.emitter, value=0)
+                server.send_message(client, start.to_json())
+                self.delivery.start(client)
+            else:
+                self._send_receipts(self.delivery.stop(client), NOT_RECEIVED)
+            self.clients.add(received_msg.emitter, client, features)
+            if self.cluster:
+                self.cluster.join(received_msg.emitter)
+            self.log.info("[info] Client '%s' enregistré", received_msg.emitter)
+            self.schedule_clients_list()
+            if self.outbox:
+                self.outbox.remember(received_msg.emitter)
+            self._drain_outbox(received_msg.emitter)
             self._log_admin_event(
                 MessageType.ADMIN.CLIENT_CONNECTED,
                 emitter=received_msg.emitter,
@@ -114,68 +934,100 @@ class WSServer:
             )
         
         elif received_msg.message_type == MessageType.ENVOI.CLIENT_LIST:
-            users_list = list(self.clients.keys())
+            users_list = list(self._client_names())
             response = Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver=received_msg.receiver, value=users_list)
             server.send_message(client, response.to_json())
-            print(f"CLIENTS = {users_list}")
+            self.log.info("CLIENTS = %s", users_list)
+
+        elif received_msg.message_type == MessageType.MEDIA.FETCH:
+            self.on_media_fetch(client, server, received_msg)
 
-        elif received_msg.message_type in [MessageType.ENVOI.TEXT, MessageType.ENVOI.IMAGE, MessageType.ENVOI.AUDIO, MessageType.ENVOI.VIDEO]:
+        elif received_msg.message_type == MessageType.ADMIN.PROFILE:
+            self.on_profile_request(client, received_msg)
+
+        elif received_msg.message_type == MessageType.HISTORY.REQUEST:
+            self.on_history_request(client, received_msg)
+
+        elif received_msg.message_type in (MessageType.ROOM.JOIN, MessageType.ROOM.LEAVE):
+            self.on_room_request(client, received_msg)
+
+        elif received_msg.message_type in RECEPTION_FOR and received_msg.message_type in MEDIA_KINDS and media_ref(received_msg.parsed_value()):
+            if self.media:
+                self.on_media_ref(client, server, received_msg, media_ref(received_msg.value))
+            else:
+                # serveur sans store : une référence relayée serait illisible pour le destinataire
+                warning = Message(MessageType.WARNING, emitter="SERVER", receiver=received_msg.emitter, value={"media_ref": media_ref(received_msg.value), "error": "Références média non prises en charge"})
+                server.send_message(client, warning.to_json())
+
+        elif received_msg.message_type in RECEPTION_FOR:
+            if not self._admit_media(client, received_msg.message_type, received_msg.emitter, received_msg.receiver, len(message)):
+                return received_msg.message_type
             self._log_admin_event(
                 MessageType.ADMIN.ROUTING_LOG,
                 emitter=received_msg.emitter,
                 receiver=received_msg.receiver,
                 message_type=received_msg.message_type,
-                value=received_msg.value,
+                value=received_msg,
             )
             if received_msg.receiver == "SERVER":
-                print(f"[{received_msg.emitter}] {received_msg.value}")
+                self.log.info("[%s] %s", received_msg.emitter, received_msg.value)
             if received_msg.receiver == "SERVER" and received_msg.message_type == MessageType.SYS_MESSAGE:
                 ack_msg = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver="", value="VU")
                 server.send_message(client, ack_msg.to_json())
             if received_msg.receiver == "ALL":
-                reception_type = MessageType.RECEPTION.TEXT
-                if received_msg.message_type == MessageType.ENVOI.IMAGE:
-                    reception_type = MessageType.RECEPTION.IMAGE
-                elif received_msg.message_type == MessageType.ENVOI.AUDIO:
-                    reception_type = MessageType.RECEPTION.AUDIO
-                elif received_msg.message_type == MessageType.ENVOI.VIDEO:
-                    reception_type = MessageType.RECEPTION.VIDEO
-                
-                for client in self.clients.values():
-                    message = Message(reception_type, emitter=received_msg.emitter, receiver="ALL", value=received_msg.value)
-                    self.server.send_message(client, message.to_json())
+                reception_type = RECEPTION_FOR[received_msg.message_type]
+                # un seul encodage JSON + trame pour tous les destinataires, value recopiée telle que reçue
+                message = received_msg.forward(reception_type, receiver="ALL")
+                self._broadcast_reception(self.clients.clients(), message, reception_type)
+                if self.cluster:
+                    self.cluster.publish("reception", message.encode(JSON))
+            elif is_room_name(received_msg.receiver):
+                members = self._room_members(client, received_msg.receiver, received_msg.emitter)
+                if members is not None:
+                    reception_type = RECEPTION_FOR[received_msg.message_type]
+                    # même diffusion serialize-once, limitée aux membres : O(membres), pas O(clients)
+                    message = received_msg.forward(reception_type)
+                    self._broadcast_reception(self.rooms.clients(received_msg.receiver), message, reception_type)
+                    if self.cluster and self.rooms.has_remote(received_msg.receiver):
+                        self.cluster.publish("reception", message.encode(JSON), room=received_msg.receiver)
             else:
                 receiver_client = self.clients.get(received_msg.receiver, None)
+                reception_type = RECEPTION_FOR[received_msg.message_type]
+                forwarded = lambda: received_msg.forward(reception_type).encode(JSON)
+                if self.outbox and self.outbox.holds(received_msg.receiver) and self._hold(client, received_msg.receiver, TEXT, forwarded(), received_msg.emitter):
+                    return received_msg.message_type
                 if receiver_client:
-                    reception_type = MessageType.RECEPTION.TEXT
-                    if received_msg.message_type == MessageType.ENVOI.IMAGE:
-                        reception_type = MessageType.RECEPTION.IMAGE
-                    elif received_msg.message_type == MessageType.ENVOI.AUDIO:
-                        reception_type = MessageType.RECEPTION.AUDIO
-                    elif received_msg.message_type == MessageType.ENVOI.VIDEO:
-                        reception_type = MessageType.RECEPTION.VIDEO
-                    forward_msg = Message(reception_type, emitter=received_msg.emitter, receiver=received_msg.receiver, value=received_msg.value)
-                    server.send_message(receiver_client, forward_msg.to_json())
-                else:
+                    forward_msg = received_msg.forward(reception_type)
+                    self._send_reception(receiver_client, forward_msg, received_msg.emitter, received_msg.receiver)
+                elif not self._send_remote(received_msg.receiver, "reception", forwarded(), emitter=received_msg.emitter) and not (
+                    self.outbox and self._hold(client, received_msg.receiver, TEXT, forwarded(), received_msg.emitter)
+                ):
                     error_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=received_msg.emitter, value=f"Erreur: destinataire {received_msg.receiver} non trouvé.")
-                    server.send_message(client, error_msg.to_json())
+                    self._send_reception(client, error_msg)
+                    if self.metrics:
+                        self.metrics.incr("unknown_receiver")
+        elif received_msg.message_type in TRANSFER_TYPES:
+            self.on_transfer_message(client, server, received_msg)
+
         elif received_msg.message_type == MessageType.SYS_MESSAGE:
              # Forward SYS_MESSAGE (like VU) to the target receiver
              target = received_msg.receiver
              if target and target != "SERVER" and target != "ALL":
                  receiver_client = self.clients.get(target, None)
+                 forward_msg = Message(MessageType.SYS_MESSAGE, emitter=received_msg.emitter, receiver=target, value=received_msg.value)
                  if receiver_client:
-                     forward_msg = Message(MessageType.SYS_MESSAGE, emitter=received_msg.emitter, receiver=target, value=received_msg.value)
                      server.send_message(receiver_client, forward_msg.to_json())
+                 else:
+                     self._send_remote(target, "text", forward_msg.to_json())
+        return received_msg.message_type
 
-        print("[SERVER] > ", end="", flush=True)
 
     def input_loop(self):
         print("\nChat serveur démarré. Tapez 'dest:message' pour envoyer (ex: Client:bonjour)")
         print("Tapez 'img:dest:chemin' pour envoyer une image (ex: img:Client:/path/image.png)")
         print("Tapez 'audio:dest:chemin' pour envoyer un audio (ex: audio:Client:/path/audio.mp3)")
         print("Tapez 'video:dest:chemin' pour envoyer une video (ex: video:Client:/path/video.mp4)")
-        print("Tapez 'list' pour voir les clients connectés, 'disconnect' pour quitter.\n")
+        print("Tapez 'list' pour voir les clients connectés, 'fanout' pour les mesures de diffusion, 'queues' pour les files d'envoi, 'keepalive' pour les pings, 'handshakes' pour l'admission des connexions, 'admission' pour les plafonds de charge, 'admin' pour le flux admin, 'media' pour le store de médias, 'quotas' pour les limites par client, 'metrics' pour les compteurs et temps de routage, 'profile [s]' pour profiler le serveur, 'outbox' pour les messages en attente, 'rooms' pour les salons, 'journal' pour l'historique, 'log' pour le journal, 'disconnect' pour quitter.\n")
         while self.running:
             try:
                 print("[SERVER] > ", end="", flush=True)
@@ -183,9 +1035,57 @@ class WSServer:
                 if user_input.lower() == "disconnect":
                     self.running = False
                     self.server.shutdown_gracefully()
+                    if self.outbox:
+                        self.outbox.close()
+                    if self.journal:
+                        self.journal.stop()
+                    self.log.close()
                     break
                 elif user_input.lower() == "list":
-                    print(f"Clients connectés: {list(self.clients.keys())}")
+                    print(f"Clients connectés: {list(self.clients.names())}")
+                elif user_input.lower() == "fanout":
+                    print(f"Diffusions: {self.fanout.summary()}")
+                elif user_input.lower() == "log":
+                    print(f"Journal: {self.log.stats()}")
+                elif user_input.lower() == "journal":
+                    print(f"Journal des messages: {self.journal.snapshot() if self.journal else 'désactivé'}")
+                elif user_input.lower() == "rooms":
+                    print(f"Salons: {self.rooms.snapshot() if self.rooms else 'désactivé'}")
+                elif user_input.lower() == "outbox":
+                    print(f"Messages en attente: {self.outbox.snapshot() if self.outbox else 'désactivé'}")
+                elif user_input.lower().split(" ")[0] == "profile":
+                    # profile [secondes] : résumé dans le journal et sur le dashboard à la fin
+                    args = user_input.split()
+                    try:
+                        duration = float(args[1]) if len(args) > 1 else PROFILE_DURATION
+                    except ValueError:
+                        print("Format: profile [secondes]")
+                        continue
+                    params = self.start_profile(duration)
+                    if params:
+                        print(f"Profilage pendant {params['duration']} s, résultats dans {self.profiler.directory}/")
+                    else:
+                        print(f"Profilage: {self.profiler.snapshot() if self.profiler else 'désactivé'}")
+                elif user_input.lower() == "metrics":
+                    for message_type, stats in (self.metrics.summary() if self.metrics else {}).items():
+                        print(f"  {message_type}: {stats}")
+                    print(f"Métriques: {self.metrics_snapshot()['counters'] if self.metrics else 'désactivé'}")
+                elif user_input.lower() == "quotas":
+                    print(f"Quotas: {self.quotas.snapshot() if self.quotas else 'sans limite'}")
+                elif user_input.lower() == "media":
+                    print(f"Médias: {self.media.snapshot() if self.media else 'désactivé'}")
+                elif user_input.lower() == "admin":
+                    print(f"Flux admin: {self.admin_feed.snapshot() if self.admin_feed else 'synchrone'}")
+                elif user_input.lower() == "handshakes":
+                    limiter = getattr(self.server, "handshakes", None)
+                    print(f"Handshakes: {limiter.snapshot() if limiter else 'sans limite'}")
+                elif user_input.lower() == "admission":
+                    print(f"Admission: {self.admission.snapshot() if self.admission else 'sans plafond'}")
+                elif user_input.lower() == "keepalive":
+                    print(f"Keep-alive: {self.keepalive.snapshot() if self.keepalive else 'désactivé'}")
+                elif user_input.lower() == "queues":
+                    for name, stats in self.queue_stats().items():
+                        print(f"  {name}: {stats}")
                 elif user_input.lower().startswith("img:"):
                     parts = user_input[4:].split(":", 1)
                     if len(parts) == 2:
@@ -214,11 +1114,10 @@ class WSServer:
                     dest, value = user_input.split(":", 1)
                     dest = dest.strip()
                     value = value.strip()
-                    if dest.lower() == "ALL":
-                        for name, client in self.clients.items():
-                            msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=name, value=value)
-                            self.server.send_message(client, msg.to_json())
-                        print(f"[envoyé à tous] {value}")
+                    if dest.upper() == "ALL":
+                        msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver="ALL", value=value)
+                        record = self._broadcast_reception(self.clients.clients(), msg, MessageType.RECEPTION.TEXT)
+                        print(f"[envoyé à tous] {value} ({record['clients']} clients, {record['write_ms']} ms)")
                         self._log_admin_event(
                             MessageType.ADMIN.ROUTING_LOG,
                             emitter="SERVER",
@@ -226,11 +1125,28 @@ class WSServer:
                             message_type=MessageType.RECEPTION.TEXT,
                             value=value,
                         )
+                    elif is_room_name(dest):
+                        members = self.rooms.clients(dest) if self.rooms else ()
+                        msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=dest, value=value)
+                        if self.cluster and self.rooms and self.rooms.has_remote(dest):
+                            self.cluster.publish("reception", msg.encode(JSON), room=dest)
+                        elif not members:
+                            print(f"[erreur] Salon '{dest}' non trouvé")
+                            continue
+                        record = self._broadcast_reception(members, msg, MessageType.RECEPTION.TEXT)
+                        print(f"[envoyé à {dest}] {value} ({record['clients']} membres)")
+                        self._log_admin_event(
+                            MessageType.ADMIN.ROUTING_LOG,
+                            emitter="SERVER",
+                            receiver=dest,
+                            message_type=MessageType.RECEPTION.TEXT,
+                            value=value,
+                        )
                     else:
                         receiver_client = self.clients.get(dest, None)
                         if receiver_client:
                             msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=dest, value=value)
-                            self.server.send_message(receiver_client, msg.to_json())
+                            self._send_reception(receiver_client, msg)
                             print(f"[envoyé à {dest}] {value}")
                             self._log_admin_event(
                                 MessageType.ADMIN.ROUTING_LOG,
@@ -246,119 +1162,74 @@ class WSServer:
             except EOFError:
                 break
 
-    def start(self):
-        print(f"Serveur WS sur ws://{self.host}:{self.port}")
+    def start_services(self):
+        """Threads de fond : stats des files, keep-alive, flux admin"""
         self.running = True
+        self.log.start()
+        if self.cluster:
+            self.cluster.start()
+        threading.Thread(target=self._stats_loop, daemon=True).start()
+        if self.keepalive:
+            self.keepalive.start()
+        if self.admin_feed:
+            self.admin_feed.start()
+        if self.outbox:
+            self.outbox.start()
+        if self.journal:
+            self.journal.start()
+
+    def start(self):
+        print(f"Serveur WS ({self.engine}) sur ws://{self.host}:{self.port}")
+        self.start_services()
 
         input_thread = threading.Thread(target=self.input_loop, daemon=True)
         input_thread.start()
 
         self.server.run_forever()
 
-    def send_image(self, filepath, dest):
+    def _send_media(self, filepath, dest, reception_type, label):
         with open(filepath, "rb") as f:
-            img_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"IMG:{img_base64}"
-        if dest.lower() == "ALL":
-            for name, client in self.clients.items():
-                msg = Message(MessageType.RECEPTION.IMAGE, emitter="SERVER", receiver=name, value=value)
-                self.server.send_message(client, msg.to_json())
-            print(f"[image envoyée à tous]")
-            self._log_admin_event(
-                MessageType.ADMIN.ROUTING_LOG,
-                emitter="SERVER",
-                receiver="ALL",
-                message_type=MessageType.RECEPTION.IMAGE,
-                value=value,
-            )
+            raw = f.read()
+        if dest.upper() == "ALL":
+            dest = "ALL"
+            targets = self.clients.items()
         else:
             receiver_client = self.clients.get(dest, None)
-            if receiver_client:
-                msg = Message(MessageType.RECEPTION.IMAGE, emitter="SERVER", receiver=dest, value=value)
-                self.server.send_message(receiver_client, msg.to_json())
-                print(f"[image envoyée à {dest}]")
-                self._log_admin_event(
-                    MessageType.ADMIN.ROUTING_LOG,
-                    emitter="SERVER",
-                    receiver=dest,
-                    message_type=MessageType.RECEPTION.IMAGE,
-                    value=value,
-                )
-            else:
+            if not receiver_client:
                 print(f"[erreur] Client '{dest}' non trouvé")
+                return
+            targets = [(dest, receiver_client)]
+        frame = bytearray(Message(reception_type, emitter="SERVER", receiver=dest, value=raw).to_binary())
+        digest = self.media.put(raw)[0] if self.media else None
+        self._deliver_media(frame, targets, digest=digest)
+        print(f"[{label} à {'tous' if dest == 'ALL' else dest}]")
+        self._log_admin_event(
+            MessageType.ADMIN.ROUTING_LOG,
+            emitter="SERVER",
+            receiver=dest,
+            message_type=reception_type,
+            value=raw,
+        )
+
+    def send_image(self, filepath, dest):
+        self._send_media(filepath, dest, MessageType.RECEPTION.IMAGE, "image envoyée")
 
     def send_audio(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            audio_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"AUDIO:{audio_base64}"
-        if dest.lower() == "ALL":
-            for name, client in self.clients.items():
-                msg = Message(MessageType.RECEPTION.AUDIO, emitter="SERVER", receiver=name, value=value)
-                self.server.send_message(client, msg.to_json())
-            print(f"[audio envoyé à tous]")
-            self._log_admin_event(
-                MessageType.ADMIN.ROUTING_LOG,
-                emitter="SERVER",
-                receiver="ALL",
-                message_type=MessageType.RECEPTION.AUDIO,
-                value=value,
-            )
-        else:
-            receiver_client = self.clients.get(dest, None)
-            if receiver_client:
-                msg = Message(MessageType.RECEPTION.AUDIO, emitter="SERVER", receiver=dest, value=value)
-                self.server.send_message(receiver_client, msg.to_json())
-                print(f"[audio envoyé à {dest}]")
-                self._log_admin_event(
-                    MessageType.ADMIN.ROUTING_LOG,
-                    emitter="SERVER",
-                    receiver=dest,
-                    message_type=MessageType.RECEPTION.AUDIO,
-                    value=value,
-                )
-            else:
-                print(f"[erreur] Client '{dest}' non trouvé")
+        self._send_media(filepath, dest, MessageType.RECEPTION.AUDIO, "audio envoyé")
 
     def send_video(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            video_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"VIDEO:{video_base64}"
-        if dest.lower() == "ALL":
-            for name, client in self.clients.items():
-                msg = Message(MessageType.RECEPTION.VIDEO, emitter="SERVER", receiver=name, value=value)
-                self.server.send_message(client, msg.to_json())
-            print(f"[video envoyée à tous]")
-            self._log_admin_event(
-                MessageType.ADMIN.ROUTING_LOG,
-                emitter="SERVER",
-                receiver="ALL",
-                message_type=MessageType.RECEPTION.VIDEO,
-                value=value,
-            )
-        else:
-            receiver_client = self.clients.get(dest, None)
-            if receiver_client:
-                msg = Message(MessageType.RECEPTION.VIDEO, emitter="SERVER", receiver=dest, value=value)
-                self.server.send_message(receiver_client, msg.to_json())
-                print(f"[video envoyée à {dest}]")
-                self._log_admin_event(
-                    MessageType.ADMIN.ROUTING_LOG,
-                    emitter="SERVER",
-                    receiver=dest,
-                    message_type=MessageType.RECEPTION.VIDEO,
-                    value=value,
-                )
-            else:
-                print(f"[erreur] Client '{dest}' non trouvé")
+        self._send_media(filepath, dest, MessageType.RECEPTION.VIDEO, "video envoyée")
 
     @staticmethod
-    def dev():
-        return WSServer(Context.dev())
+    def dev(engine="threaded"):
+        return WSServer(Context.dev(), engine)
 
     @staticmethod
-    def prod():
-        return WSServer(Context.prod())
+    def prod(engine="threaded"):
+        return WSServer(Context.prod(), engine)
 
 if __name__ == "__main__":
-    ws_server = WSServer.dev()
+    import sys
+    engine = sys.argv[1] if len(sys.argv) > 1 else "threaded"
+    ws_server = WSServer.dev(engine)
     ws_server.start()
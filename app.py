@@ -1,11 +1,12 @@
 # app.py
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, jsonify, request
 import threading
 import time
 import json
 
 from Context import Context
 from Message import MessageType, Message
+from Metrics import render_prometheus
 from WSClient import WSClient
 
 app = Flask(__name__)
@@ -14,6 +15,13 @@ app = Flask(__name__)
 # Stockage global
 # ----------------------------
 clients = set()
+queue_stats = {}
+# en cluster, chaque worker (SERVER-0, SERVER-1...) envoie les files de ses clients
+queue_stats_by_server = {}
+# dernier ADMIN_METRICS de chaque serveur (ou worker), exporté sur /metrics
+metrics_by_server = {}
+# dernier ADMIN_PROFILE terminé de chaque serveur (ou worker), relu par GET /profile
+profiles_by_server = {}
 messages = []
 message_seq = 0
 MAX_MESSAGES = 500
@@ -22,7 +30,7 @@ MAX_MESSAGES = 500
 # WebSocket Client ADMIN
 # ----------------------------
 ctx = Context.prod()
-admin_client = WSClient(ctx, username="ADMIN")
+admin_client = WSClient(ctx, username="ADMIN", deflate=True)
 
 def ws_listener():
     """Thread qui écoute le serveur principal et met à jour clients/messages"""
@@ -41,6 +49,7 @@ def ws_listener():
         if message_type in (
             MessageType.ADMIN.CLIENT_CONNECTED,
             MessageType.ADMIN.CLIENT_DISCONNECTED,
+            MessageType.ADMIN.THROTTLE,
         ):
             return "event"
         return "text"
@@ -67,7 +76,6 @@ def ws_listener():
             messages = messages[-MAX_MESSAGES:]
 
     def on_message_override(ws, message):
-        global clients, messages
         # Appel de la fonction originale pour les prints etc
         admin_client.on_message(ws, message)
 
@@ -76,6 +84,59 @@ def ws_listener():
         except:
             return
 
+        # Lot d'événements du flux admin (AdminFeed)
+        if data.get("message_type") == MessageType.ADMIN.BATCH:
+            batch = (data.get("data") or {}).get("value") or {}
+            for event in batch.get("events", []):
+                handle_event(event)
+            dropped = batch.get("dropped")
+            if dropped:
+                append_message({
+                    "timestamp": time.time(),
+                    "message_type": MessageType.ADMIN.BATCH,
+                    "kind": "event",
+                    "emitter": "SERVER",
+                    "receiver": "ADMIN",
+                    "value": f"{sum(dropped.values())} événements non affichés (surcharge serveur)",
+                })
+            return
+        # Historique rejoué par le journal du serveur
+        if data.get("message_type") == MessageType.HISTORY.BATCH:
+            for event in ((data.get("data") or {}).get("value") or {}).get("events", []):
+                msg_type = event.get("message_type")
+                append_message({
+                    "timestamp": event.get("timestamp", time.time()),
+                    "message_type": msg_type,
+                    "kind": summarize_kind(msg_type, event.get("value")),
+                    "emitter": event.get("emitter"),
+                    "receiver": event.get("receiver"),
+                    "value": summarize_value(msg_type, event.get("value")),
+                })
+            return
+        handle_event(data)
+
+    def summarize_profile(profile):
+        status = profile.get("status")
+        if status == "started":
+            return f"profilage lancé pour {profile.get('duration')} s par {profile.get('requested_by')}"
+        if status == "busy":
+            return "profilage déjà en cours"
+        if status == "disabled":
+            return "profilage désactivé sur ce serveur"
+        if status == "error":
+            return f"profilage en erreur : {profile.get('error')}"
+        top = ", ".join(f"{entry['function']} {entry['pct']}%" for entry in profile.get("top_self", [])[:3])
+        grown = ", ".join(f"{entry['where']} +{entry['size_kb']} Ko" for entry in (profile.get("memory") or {}).get("top", [])[:3])
+        summary = f"profil : {profile.get('busy_samples')} échantillons actifs"
+        if top:
+            summary += f" ; CPU {top}"
+        if grown:
+            summary += f" ; mémoire {grown}"
+        folded = (profile.get("files") or {}).get("folded")
+        return summary + (f" ; {folded}" if folded else "")
+
+    def handle_event(data):
+        global clients, messages, queue_stats
         msg_type = data.get("message_type")
         payload = data.get("data") or {}
         emitter = payload.get("emitter")
@@ -87,6 +148,30 @@ def ws_listener():
             raw_clients = value or []
             clients = {name for name in raw_clients if not is_admin_client(name)}
 
+        # Files d'envoi par client (profondeur, pertes)
+        elif msg_type == MessageType.ADMIN.QUEUE_STATS:
+            queue_stats_by_server[emitter] = value if isinstance(value, dict) else {}
+            queue_stats = {name: stats for worker_stats in queue_stats_by_server.values() for name, stats in worker_stats.items()}
+
+        # Compteurs et histogrammes du serveur, relus par /metrics
+        elif msg_type == MessageType.ADMIN.METRICS:
+            if isinstance(value, dict):
+                metrics_by_server[emitter] = value
+
+        # Profilage à la demande : démarrage, refus, puis résumé à la fin de la fenêtre
+        elif msg_type == MessageType.ADMIN.PROFILE:
+            profile = value if isinstance(value, dict) else {}
+            if profile.get("status") in ("done", "error"):
+                profiles_by_server[emitter] = profile
+            append_message({
+                "timestamp": time.time(),
+                "message_type": msg_type,
+                "kind": "event",
+                "emitter": emitter,
+                "receiver": receiver,
+                "value": summarize_profile(profile),
+            })
+
         # Nouveau message
         elif msg_type == MessageType.ADMIN.ROUTING_LOG:
             log_payload = value if isinstance(value, dict) else {}
@@ -113,6 +198,19 @@ def ws_listener():
                 "receiver": receiver,
                 "value": summarize_value(msg_type, value),
             })
+        # Client limité par ses quotas : type refusé, raison et compteurs cumulés
+        elif msg_type == MessageType.ADMIN.THROTTLE:
+            log_payload = value if isinstance(value, dict) else {}
+            throttled = (log_payload.get("meta") or {}).get("throttled") or {}
+            total = sum(sum(counts.values()) for counts in throttled.values())
+            append_message({
+                "timestamp": log_payload.get("timestamp", time.time()),
+                "message_type": msg_type,
+                "kind": "event",
+                "emitter": emitter,
+                "receiver": receiver,
+                "value": f"limité : {log_payload.get('message_type')} ({log_payload.get('value')}), {total} messages refusés",
+            })
         elif msg_type in (
             MessageType.RECEPTION.TEXT,
             MessageType.RECEPTION.IMAGE,
@@ -131,8 +229,14 @@ def ws_listener():
                 "value": summarize_value(msg_type, value),
             })
 
+    def on_open_override(ws):
+        admin_client.on_open(ws)
+        # les derniers messages du journal : l'historique survit au redémarrage du dashboard
+        admin_client.request_history(last=MAX_MESSAGES)
+
     # Override la méthode on_message
     admin_client.ws.on_message = on_message_override
+    admin_client.ws.on_open = on_open_override
     admin_client.connect()
 
 # Lancement du thread WS
@@ -152,9 +256,10 @@ def index():
 def stream():
     def event_stream():
         last_clients = set()
+        last_queue_stats = {}
         last_messages_len = 0
         while True:
-            global clients, messages
+            global clients, messages, queue_stats
             time.sleep(0.5)
 
             # Envoi clients si changement
@@ -163,6 +268,12 @@ def stream():
                 yield f"data: {data}\n\n"
                 last_clients = set(clients)
 
+            # Envoi files d'envoi si changement
+            if queue_stats is not last_queue_stats:
+                data = json.dumps({"type": "queues", "queues": queue_stats})
+                yield f"data: {data}\n\n"
+                last_queue_stats = queue_stats
+
             # Envoi messages si changement
             if len(messages) != last_messages_len:
                 for msg in messages[last_messages_len:]:
@@ -172,6 +283,26 @@ def stream():
 
     return Response(event_stream(), mimetype="text/event-stream")
 
+# ----------------------------
+# Métriques au format Prometheus
+# ----------------------------
+@app.route("/metrics")
+def metrics():
+    return Response(render_prometheus(dict(metrics_by_server)), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+# ----------------------------
+# Profilage à la demande
+# ----------------------------
+@app.route("/profile", methods=["GET", "POST"])
+def profile():
+    """POST : lance une fenêtre de profilage sur le serveur ; GET : derniers résumés reçus"""
+    if request.method == "POST":
+        options = request.get_json(silent=True) or {}
+        value = {key: options[key] for key in ("duration", "interval", "memory") if key in options}
+        admin_client.send_message(Message(MessageType.ADMIN.PROFILE, emitter="ADMIN", receiver="SERVER", value=value))
+        return jsonify({"requested": value}), 202
+    return jsonify(dict(profiles_by_server))
+
 # ----------------------------
 # RUN
 # ----------------------------
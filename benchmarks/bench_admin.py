@@ -0,0 +1,79 @@
+"""
+Latence de routage selon le flux admin.
+
+Trois cas, même charge (P paires de clients qui s'envoient des ENVOI_TEXT
+pendant D secondes) :
+
+- no_admin : aucun admin connecté
+- admin_sync : A admins, un message admin envoyé pendant le routage (historique)
+- admin_batched : A admins, événements mis en file et publiés par lots (AdminFeed)
+
+Usage : python3 benchmarks/bench_admin.py [--engine asyncio] [--admins 3] [--pairs 50] [--duration 5] [--json out.json]
+"""
+import argparse
+import asyncio
+
+from bench_client import BenchClient, free_port, raise_fd_limit, start_server_process, write_json
+from bench_engines import measure_throughput
+
+from Message import MessageType
+
+MODES = {
+    "no_admin": (0, {}),
+    "admin_sync": (None, {"admin_feed": False}),
+    "admin_batched": (None, {}),
+}
+
+
+async def bench_mode(mode, args):
+    admins, kwargs = MODES[mode]
+    admins = args.admins if admins is None else admins
+    port = free_port()
+    proc = start_server_process(port, args.engine, quotas=False, **kwargs)
+    try:
+        watchers = [BenchClient(port, f"ADMIN{i}") for i in range(admins)]
+        for watcher in watchers:
+            await watcher.connect()
+        if watchers:
+            await asyncio.wait_for(asyncio.gather(*(w.declared.wait() for w in watchers)), 30)
+        result = await measure_throughput(port, args.pairs, args.duration)
+        await asyncio.sleep(0.5)
+        frames = sum(
+            w.by_type.get(MessageType.ADMIN.ROUTING_LOG, 0) + w.by_type.get(MessageType.ADMIN.BATCH, 0)
+            for w in watchers
+        )
+        for watcher in watchers:
+            await watcher.close()
+        return {"mode": mode, "engine": args.engine, "admins": admins, "admin_frames": frames, **result}
+    finally:
+        proc.terminate()
+        proc.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", default="asyncio")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--pairs", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+    raise_fd_limit()
+
+    results = []
+    for mode in args.modes.split(","):
+        result = asyncio.run(bench_mode(mode.strip(), args))
+        results.append(result)
+        print(
+            f"{result['mode']:>13}: {result['messages_per_sec']} msg/s, "
+            f"p50={result['latency_p50_ms']} ms p99={result['latency_p99_ms']} ms | "
+            f"{result['admin_frames']} trames admin reçues"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Outils communs aux benchmarks : serveur dans un process séparé et clients asyncio légers."""
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from Message import Message, MessageType
+from WSFrame import OPCODE_CLOSE_CONN, OPCODE_PING, OPCODE_PONG, OPCODE_TEXT, encode_frame, read_frame, read_http_headers
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_server(port, engine, kwargs, quiet):
+    from Context import Context
+    from WSServer import WSServer
+
+    raise_fd_limit()
+    if quiet:
+        sys.stdout = sys.stderr = open(os.devnull, "w")
+        logging.disable(logging.CRITICAL)
+    server = WSServer(Context("127.0.0.1", port), engine, **kwargs)
+    server.start_services()
+    server.server.run_forever()
+
+
+def start_server_process(port, engine="threaded", quiet=True, **kwargs):
+    """Lance WSServer dans un process dédié pour ne pas partager le GIL avec les clients"""
+    proc = multiprocessing.Process(target=_run_server, args=(port, engine, kwargs, quiet), daemon=True)
+    proc.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return proc
+        time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"Le serveur {engine} n'a pas démarré sur le port {port}")
+
+
+def proc_status(pid):
+    """RSS (Ko) et nombre de threads d'un process, lus dans /proc"""
+    status = {"rss_kb": None, "threads": None}
+    with contextlib.suppress(OSError), open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                status["rss_kb"] = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                status["threads"] = int(line.split()[1])
+    return status
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies, prefix="latency"):
+    """p50 / p99 / p999 en ms d'une liste de latences en secondes"""
+    ordered = sorted(latencies)
+    summary = {}
+    for name, pct in (("p50", 50), ("p99", 99), ("p999", 99.9)):
+        value = percentile(ordered, pct)
+        summary[f"{prefix}_{name}_ms"] = round(value * 1000, 3) if value is not None else None
+    return summary
+
+
+def git_commit():
+    """Commit du dépôt mesuré, pour comparer les résultats d'un commit à l'autre"""
+    with contextlib.suppress(OSError, subprocess.SubprocessError):
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    return None
+
+
+class BenchClient:
+    """Client minimal qui parle le protocole JSON de WSClient, sans thread"""
+
+    def __init__(self, port, username, host="127.0.0.1"):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.reader = None
+        self.writer = None
+        self.received = 0
+        self.received_bytes = 0
+        self.latencies = []
+        self.by_type = {}
+        self.declared = asyncio.Event()
+        self._reader_task = None
+
+    async def connect(self, declare=True):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 20)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.writer.write(
+            (
+                f"GET / HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+            ).encode()
+        )
+        status, _ = await read_http_headers(self.reader)
+        if " 101 " not in status:
+            # handshake refusé (503 pendant une vague de connexions)
+            self.writer.close()
+            raise ConnectionRefusedError(status)
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        if declare:
+            self.send_message(Message(MessageType.DECLARATION, emitter=self.username, receiver="", value=""))
+
+    def send_raw(self, payload, opcode=OPCODE_TEXT):
+        self.writer.write(encode_frame(payload, opcode, mask=True))
+
+    def send_message(self, message):
+        self.send_raw(message.to_json())
+
+    def send_text(self, dest, value):
+        self.send_message(Message(MessageType.ENVOI.TEXT, emitter=self.username, receiver=dest, value=value))
+
+    def send_timed(self, dest, message_type=MessageType.ENVOI.TEXT, padding=""):
+        value = f"{time.perf_counter()}|{padding}"
+        self.send_message(Message(message_type, emitter=self.username, receiver=dest, value=value))
+
+    def on_frame(self, opcode, payload):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return
+        message_type = data.get("message_type")
+        self.by_type[message_type] = self.by_type.get(message_type, 0) + 1
+        value = (data.get("data") or {}).get("value")
+        if message_type == MessageType.SYS_MESSAGE and value == "ping":
+            self.send_message(Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="pong"))
+            return
+        if message_type == MessageType.RECEPTION.TEXT and isinstance(value, str):
+            if value.startswith("Déclaration reçue"):
+                self.declared.set()
+        if message_type in (
+            MessageType.RECEPTION.TEXT,
+            MessageType.RECEPTION.IMAGE,
+            MessageType.RECEPTION.AUDIO,
+            MessageType.RECEPTION.VIDEO,
+        ) and isinstance(value, str) and "|" in value:
+            stamp = value.split("|", 1)[0]
+            with contextlib.suppress(ValueError):
+                self.latencies.append(time.perf_counter() - float(stamp))
+                self.received += 1
+
+    async def _read_loop(self):
+        try:
+            while True:
+                fin, opcode, payload, _ = await read_frame(self.reader)
+                self.received_bytes += len(payload)
+                if opcode == OPCODE_CLOSE_CONN:
+                    break
+                if opcode == OPCODE_PING:
+                    self.send_raw(payload, OPCODE_PONG)
+                    continue
+                self.on_frame(opcode, payload)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def close(self):
+        if self.writer is None:
+            return
+        with contextlib.suppress(Exception):
+            self.send_raw(b"\x03\xe8", OPCODE_CLOSE_CONN)
+            await self.writer.drain()
+            self.writer.close()
+        if self._reader_task:
+            self._reader_task.cancel()
+
+
+def write_json(path, results):
+    if path == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
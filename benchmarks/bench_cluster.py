@@ -0,0 +1,119 @@
+"""
+Débit de Cluster selon le nombre de workers.
+
+Pour chaque nombre de workers, Cluster.serve tourne dans son propre process et
+G process de charge ouvrent chacun P paires de clients qui s'envoient des
+ENVOI_TEXT pendant D secondes. Émetteur et destinataire sont acceptés par des
+workers quelconques : une partie du trafic passe par le broker.
+
+Le gain n'apparaît qu'avec au moins autant de cœurs libres que de workers +
+process de charge (os.cpu_count() est affiché).
+
+Usage : python3 benchmarks/bench_cluster.py [--workers 1,2,4] [--engine asyncio] [--loaders 2] [--pairs 25] [--duration 5] [--json out.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from bench_client import free_port, raise_fd_limit, write_json
+from bench_engines import measure_throughput
+
+
+def _run_cluster(port, workers, engine, options):
+    from Cluster import serve
+    from Context import Context
+
+    raise_fd_limit()
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    logging.disable(logging.CRITICAL)
+    serve(Context("127.0.0.1", port), workers, engine, **options)
+
+
+def start_cluster(port, workers, engine, **options):
+    # pas daemon : le process du cluster crée lui-même ses workers
+    proc = multiprocessing.Process(target=_run_cluster, args=(port, workers, engine, options))
+    proc.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return proc
+        time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"Le cluster n'a pas démarré sur le port {port}")
+
+
+def _run_loader(port, pairs, duration, prefix, results):
+    raise_fd_limit()
+
+    async def run():
+        return await measure_throughput(port, pairs, duration, prefix=prefix)
+
+    results.put(asyncio.run(run()))
+
+
+def bench_workers(workers, args):
+    port = free_port()
+    proc = start_cluster(port, workers, args.engine, quotas=False, admission=False)
+    try:
+        # le temps que chaque worker soit relié au broker
+        time.sleep(0.5)
+        results = multiprocessing.Queue()
+        loaders = [
+            multiprocessing.Process(target=_run_loader, args=(port, args.pairs, args.duration, f"g{i}-", results))
+            for i in range(args.loaders)
+        ]
+        for loader in loaders:
+            loader.start()
+        loads = [results.get(timeout=args.duration + 60) for _ in loaders]
+        for loader in loaders:
+            loader.join()
+    finally:
+        proc.terminate()
+        proc.join()
+    return {
+        "workers": workers,
+        "engine": args.engine,
+        "pairs": args.pairs * args.loaders,
+        "sent": sum(load["sent"] for load in loads),
+        "received": sum(load["received"] for load in loads),
+        "messages_per_sec": round(sum(load["messages_per_sec"] for load in loads), 1),
+        "latency_p50_ms": max(load["latency_p50_ms"] or 0 for load in loads),
+        "latency_p99_ms": max(load["latency_p99_ms"] or 0 for load in loads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--engine", default="asyncio")
+    parser.add_argument("--loaders", type=int, default=2)
+    parser.add_argument("--pairs", type=int, default=25)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cœurs")
+    results = []
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        result = bench_workers(workers, args)
+        baseline = baseline or result["messages_per_sec"]
+        result["speedup"] = round(result["messages_per_sec"] / baseline, 2) if baseline else None
+        results.append(result)
+        print(
+            f"{workers:>3} workers: {result['messages_per_sec']:>10} msg/s (x{result['speedup']}) | "
+            f"p50={result['latency_p50_ms']} ms p99={result['latency_p99_ms']} ms"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
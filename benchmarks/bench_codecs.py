@@ -0,0 +1,97 @@
+"""
+Coût d'encodage / décodage d'un Message selon le codec.
+
+Formes mesurées (R répétitions chacune) :
+
+- text : ENVOI_TEXT de chat court
+- client_list : RECEPTION_CLIENT_LIST de N noms
+- media_b64 : ENVOI_IMAGE de 1 Mo en base64 dans la value (chemin historique)
+- media_raw : ENVOI_IMAGE de 1 Mo en octets bruts (codecs binaires seulement)
+
+"stdlib" est l'ancien Message.to_json / from_json (json de la stdlib) ; "json"
+est le codec JSON actuel (orjson s'il est installé). msgpack et cbor ne sont
+mesurés que s'ils sont installés.
+
+Usage : python3 benchmarks/bench_codecs.py [--repeat 2000] [--names 500] [--media-kb 1024] [--json out.json]
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+import fake_transport  # noqa: F401  (ajoute la racine du dépôt au sys.path)
+from bench_client import write_json
+
+from Codecs import CODECS, JSON
+from Message import Message, MessageType
+
+
+class StdlibJson:
+    """Référence : json de la stdlib, comme l'ancien Message"""
+
+    name = "stdlib"
+    tag = None
+
+    def encode(self, data):
+        return json.dumps(data)
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+def shapes(names, media_kb):
+    raw = os.urandom(media_kb * 1024)
+    return {
+        "text": Message(MessageType.ENVOI.TEXT, emitter="Client1", receiver="Client2", value="bonjour, ça va ?"),
+        "client_list": Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver="ALL", value=[f"client{i}" for i in range(names)]),
+        "media_b64": Message(MessageType.ENVOI.IMAGE, emitter="Client1", receiver="Client2", value="IMG:" + base64.b64encode(raw).decode("utf-8")),
+        "media_raw": Message(MessageType.ENVOI.IMAGE, emitter="Client1", receiver="Client2", value=raw),
+    }
+
+
+def measure(codec, message, repeat):
+    data = message.to_dict()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        payload = codec.encode(data)
+    encoded = time.perf_counter()
+    for _ in range(repeat):
+        codec.decode(payload)
+    decoded = time.perf_counter()
+    return {
+        "bytes": len(payload),
+        "encode_us": round((encoded - started) * 1e6 / repeat, 2),
+        "decode_us": round((decoded - encoded) * 1e6 / repeat, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--names", type=int, default=500)
+    parser.add_argument("--media-kb", type=int, default=1024)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    codecs = [StdlibJson()] + list(CODECS.values())
+    results = []
+    for shape, message in shapes(args.names, args.media_kb).items():
+        # les gros médias coûtent des millisecondes : moins de répétitions
+        repeat = max(10, args.repeat // 100) if shape.startswith("media") else args.repeat
+        for codec in codecs:
+            if shape == "media_raw" and (codec.tag is None or codec is JSON):
+                continue
+            record = {"shape": shape, "codec": codec.name, **measure(codec, message, repeat)}
+            results.append(record)
+            print(
+                f"{shape:>11} {codec.name:>7}: {record['bytes']:>9} octets | "
+                f"encodage {record['encode_us']:10.2f} µs | décodage {record['decode_us']:10.2f} µs"
+            )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
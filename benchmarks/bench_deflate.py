@@ -0,0 +1,90 @@
+"""
+permessage-deflate : taux de compression et coût CPU par forme de message.
+
+- server : trame envoyée par le serveur, compressée sans contexte (diffusable)
+- client : flux de messages du client, compressé avec contexte (voie montante)
+
+Formes : chat texte, RECEPTION_CLIENT_LIST, ADMIN_BATCH de routage, image
+JPEG en base64 (ignorée : déjà compressée), audio WAV binaire.
+
+Usage : python3 benchmarks/bench_deflate.py [--repeat 200] [--names 500] [--json out.json]
+"""
+import argparse
+import base64
+import os
+import time
+
+import fake_transport  # noqa: F401  (ajoute la racine du dépôt au sys.path)
+from bench_client import write_json
+
+from Deflate import PerMessageDeflate
+from Message import Message, MessageType
+from WSFrame import OPCODE_BINARY, OPCODE_TEXT, encode_frame
+
+
+def shapes(names):
+    jpeg = b"\xff\xd8\xff\xe0" + os.urandom(256 * 1024)
+    wav = b"RIFF\x00\x00\x00\x00WAVEfmt " + bytes(range(256)) * 1024
+    events = [
+        {"message_type": MessageType.ADMIN.ROUTING_LOG,
+         "data": {"emitter": f"client{i}", "receiver": "ALL", "value": {"message_type": MessageType.ENVOI.TEXT, "value": f"message {i}", "timestamp": 1700000000.0 + i}}}
+        for i in range(256)
+    ]
+    return {
+        "chat": (Message(MessageType.ENVOI.TEXT, emitter="Client1", receiver="Client2", value="salut, tu es dispo pour la réunion de 14h ?").to_json(), OPCODE_TEXT),
+        "client_list": (Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver="ALL", value=[f"client{i}" for i in range(names)]).to_json(), OPCODE_TEXT),
+        "admin_batch": (Message(MessageType.ADMIN.BATCH, emitter="SERVER", receiver="ADMIN", value={"events": events}).to_json(), OPCODE_TEXT),
+        "jpeg_b64": (Message(MessageType.RECEPTION.IMAGE, emitter="Client1", receiver="Client2", value="IMG:" + base64.b64encode(jpeg).decode("utf-8")).to_json(), OPCODE_TEXT),
+        "wav_binary": (Message(MessageType.ENVOI.AUDIO, emitter="Client1", receiver="Client2", value=wav).to_binary(), OPCODE_BINARY),
+    }
+
+
+def measure(side, payload, opcode, repeat):
+    payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+    if side == "server":
+        deflate = PerMessageDeflate()
+        frame = encode_frame(payload, opcode)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            deflate.outgoing(frame)
+    else:
+        deflate = PerMessageDeflate(context_takeover=True)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            deflate.deflate(payload, opcode)
+    elapsed = time.perf_counter() - started
+    stats = deflate.snapshot()
+    compressed = stats["compressed"]
+    return {
+        "bytes": len(payload),
+        "compressed": compressed > 0,
+        "ratio": stats["ratio_out"],
+        "wire_bytes": stats["wire_bytes"] // compressed if compressed else len(payload),
+        "us_per_message": round(elapsed * 1e6 / repeat, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--names", type=int, default=500)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for shape, (payload, opcode) in shapes(args.names).items():
+        for side in ("server", "client"):
+            record = {"shape": shape, "side": side, **measure(side, payload, opcode, args.repeat)}
+            results.append(record)
+            ratio = f"{record['ratio']:.3f}" if record["compressed"] else "  non"
+            print(
+                f"{shape:>11} {side:>6}: {record['bytes']:>8} -> {record['wire_bytes']:>8} octets "
+                f"(ratio {ratio}) | {record['us_per_message']:9.2f} µs/message"
+            )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Compare les moteurs de WSServer (threaded vs asyncio).
+
+1. connexions tenues : N connexions WebSocket ouvertes en parallèle, RSS et threads du serveur
+2. débit : P paires de clients déclarés s'envoient des ENVOI_TEXT pendant D secondes
+
+Usage : python3 benchmarks/bench_engines.py --clients 2000 --pairs 50 --duration 5 [--json out.json]
+"""
+import argparse
+import asyncio
+import time
+
+from bench_client import (
+    BenchClient,
+    free_port,
+    percentile,
+    proc_status,
+    raise_fd_limit,
+    start_server_process,
+    write_json,
+)
+
+
+async def hold_connections(port, count, concurrency=200):
+    clients = []
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def open_one(i):
+        nonlocal failed
+        async with semaphore:
+            client = BenchClient(port, f"idle{i}")
+            try:
+                await asyncio.wait_for(client.connect(declare=False), 10)
+                clients.append(client)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(open_one(i) for i in range(count)))
+    return clients, failed, time.perf_counter() - start
+
+
+async def measure_throughput(port, pairs, duration, prefix=""):
+    senders = [BenchClient(port, f"{prefix}send{i}") for i in range(pairs)]
+    receivers = [BenchClient(port, f"{prefix}recv{i}") for i in range(pairs)]
+    everyone = senders + receivers
+    for client in everyone:
+        await client.connect()
+    await asyncio.wait_for(asyncio.gather(*(c.declared.wait() for c in everyone)), 30)
+
+    sent = 0
+    stop_at = time.perf_counter() + duration
+
+    async def pump(sender, receiver):
+        nonlocal sent
+        while time.perf_counter() < stop_at:
+            for _ in range(20):
+                sender.send_timed(receiver.username)
+                sent += 1
+            await sender.drain()
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(pump(s, r) for s, r in zip(senders, receivers)))
+    await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - start
+
+    latencies = [lat for r in receivers for lat in r.latencies]
+    received = sum(r.received for r in receivers)
+    for client in everyone:
+        await client.close()
+    return {
+        "sent": sent,
+        "received": received,
+        "messages_per_sec": round(received / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    }
+
+
+async def bench_engine(engine, args):
+    port = free_port()
+    proc = start_server_process(port, engine, quotas=False, admission=False)
+    try:
+        baseline = proc_status(proc.pid)
+        clients, failed, connect_time = await hold_connections(port, args.clients)
+        await asyncio.sleep(1)
+        loaded = proc_status(proc.pid)
+        for client in clients:
+            await client.close()
+        await asyncio.sleep(1)
+
+        throughput = await measure_throughput(port, args.pairs, args.duration)
+        return {
+            "engine": engine,
+            "connections_requested": args.clients,
+            "connections_held": len(clients),
+            "connections_failed": failed,
+            "connect_time_s": round(connect_time, 3),
+            "rss_idle_kb": baseline["rss_kb"],
+            "rss_loaded_kb": loaded["rss_kb"],
+            "threads_loaded": loaded["threads"],
+            **throughput,
+        }
+    finally:
+        proc.terminate()
+        proc.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="threaded,asyncio")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--pairs", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    if args.clients + 2 * args.pairs + 64 > limit:
+        print(f"[warn] limite de descripteurs ({limit}) trop basse pour {args.clients} clients")
+
+    results = []
+    for engine in args.engines.split(","):
+        result = asyncio.run(bench_engine(engine.strip(), args))
+        results.append(result)
+        print(
+            f"{result['engine']:>9}: {result['connections_held']}/{result['connections_requested']} connexions "
+            f"({result['threads_loaded']} threads, RSS {result['rss_loaded_kb']} Ko) | "
+            f"{result['messages_per_sec']} msg/s, p50={result['latency_p50_ms']} ms p99={result['latency_p99_ms']} ms"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Diffusion "ALL" : encodage par client (ancien chemin) vs serialize-once (FanOut).
+
+Mesure en process avec un transport factice, pour 10 à 2000 clients et des
+payloads texte / image 5 Mo. Le coût serialize-once doit croître avec le
+nombre de sockets, pas avec octets x clients.
+
+Usage : python3 benchmarks/bench_fanout.py [--clients 10,100,1000] [--json out.json]
+"""
+import argparse
+import base64
+import contextlib
+import io
+import os
+import time
+
+from fake_transport import install
+from bench_client import write_json
+
+from Context import Context
+from Message import Message, MessageType
+
+PAYLOADS = {
+    "text": "Salut tout le monde !",
+    "image_5mb": "IMG:" + base64.b64encode(os.urandom(5 * 1024 * 1024 * 3 // 4)).decode(),
+}
+
+
+def per_client(server, value):
+    """Ancien chemin : un Message + to_json + encodage de trame par client"""
+    for client in server.clients.clients():
+        message = Message(MessageType.RECEPTION.IMAGE, emitter="bench", receiver="ALL", value=value)
+        server.server.send_message(client, message.to_json())
+
+
+def serialize_once(server, value):
+    message = Message(MessageType.RECEPTION.IMAGE, emitter="bench", receiver="ALL", value=value)
+    server.fanout.broadcast(server.clients.clients(), message.to_json())
+
+
+def build_server(count):
+    WSServer = install()
+    server = WSServer(Context("127.0.0.1", 0), "fake")
+    for i in range(count):
+        client = server.server.connect()
+        server.clients.add(f"client{i}", client)
+    return server
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="10,100,1000")
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for count in [int(c) for c in args.clients.split(",")]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = build_server(count)
+        for name, value in PAYLOADS.items():
+            old = timed(per_client, server, value)
+            new = timed(serialize_once, server, value)
+            record = server.fanout.history[-1]
+            results.append({
+                "clients": count,
+                "payload": name,
+                "payload_bytes": len(value),
+                "per_client_ms": round(old * 1000, 2),
+                "serialize_once_ms": round(new * 1000, 2),
+                "encode_ms": record["encode_ms"],
+                "per_socket_us": record["per_socket_us"],
+                "speedup": round(old / new, 1) if new else None,
+            })
+            print(
+                f"{count:>6} clients {name:>10}: par client {old * 1000:9.2f} ms | "
+                f"serialize-once {new * 1000:8.2f} ms (encodage {record['encode_ms']} ms, "
+                f"{record['per_socket_us']} µs/socket) x{results[-1]['speedup']}"
+            )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
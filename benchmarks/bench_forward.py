@@ -0,0 +1,93 @@
+"""
+Relais d'un média JSON/base64 (ENVOI_IMAGE -> RECEPTION_IMAGE) par le serveur.
+
+- full : document entier décodé puis réencodé (ancien chemin, json de la stdlib)
+- full_json : idem avec le codec JSON actuel (orjson s'il est installé)
+- lazy : en-tête seul décodé, value recopiée telle quelle dans le JSON sortant
+
+Pour chaque taille : temps CPU par message relayé et pic d'allocation (tracemalloc)
+au-delà du texte reçu.
+
+Usage : python3 benchmarks/bench_forward.py [--sizes-kb 16,256,1024,4096] [--repeat 50] [--json out.json]
+"""
+import argparse
+import base64
+import json
+import os
+import time
+import tracemalloc
+
+import fake_transport  # noqa: F401  (ajoute la racine du dépôt au sys.path)
+from bench_client import write_json
+
+from Codecs import JSON
+from Message import Message, MessageType
+
+
+def forward_full(text):
+    data = json.loads(text)
+    received = Message.from_dict(data)
+    forward = Message(MessageType.RECEPTION.IMAGE, emitter=received.emitter, receiver=received.receiver, value=received.value)
+    return json.dumps(forward.to_dict())
+
+
+def forward_full_json(text):
+    received = Message.from_dict(JSON.decode(text))
+    forward = Message(MessageType.RECEPTION.IMAGE, emitter=received.emitter, receiver=received.receiver, value=received.value)
+    return JSON.encode(forward.to_dict())
+
+
+def forward_lazy(text):
+    received = Message.from_json(text)
+    return received.forward(MessageType.RECEPTION.IMAGE).encode(JSON)
+
+
+PATHS = {"full": forward_full, "full_json": forward_full_json, "lazy": forward_lazy}
+
+
+def media_text(size_kb):
+    value = "IMG:" + base64.b64encode(os.urandom(size_kb * 1024)).decode("utf-8")
+    return Message(MessageType.ENVOI.IMAGE, emitter="Client1", receiver="Client2", value=value).to_json()
+
+
+def measure(forward, text, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        forward(text)
+    cpu = time.process_time() - started
+
+    tracemalloc.start()
+    forward(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "cpu_us": round(cpu * 1e6 / repeat, 1),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-kb", default="16,256,1024,4096")
+    parser.add_argument("--paths", default=",".join(PATHS))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for size_kb in (int(size) for size in args.sizes_kb.split(",")):
+        text = media_text(size_kb)
+        for path in args.paths.split(","):
+            record = {"path": path, "media_kb": size_kb, "frame_kb": round(len(text) / 1024, 1), **measure(PATHS[path], text, args.repeat)}
+            results.append(record)
+            print(
+                f"{size_kb:>5} Ko {path:>9}: {record['cpu_us']:10.1f} µs CPU | "
+                f"pic d'allocation {record['peak_alloc_kb']:10.1f} Ko"
+            )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
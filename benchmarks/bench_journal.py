@@ -0,0 +1,88 @@
+"""
+Journal des messages : coût d'écriture et relecture depuis une date.
+
+N messages sont journalisés (répertoire temporaire, un message par seconde
+simulée), puis relus :
+
+- append : temps par message dans le thread de routage (mise en file seule)
+- flush : encodage + écriture par le thread du journal
+- replay tail : les derniers --tail messages, retrouvés par l'index creux
+- replay full : parcours de tout le journal (ce que coûterait une recherche sans index)
+
+Usage : python3 benchmarks/bench_journal.py [--messages 100000,1000000] [--tail 500] [--json out.json]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from collections import deque
+
+import fake_transport  # noqa: F401  (ajoute la racine du dépôt au sys.path)
+from bench_client import write_json
+
+from Journal import Journal
+from Message import MessageType
+
+
+def run(count, tail):
+    directory = tempfile.mkdtemp()
+    try:
+        journal = Journal(directory=directory, segment_bytes=16 * 1024 * 1024)
+        started = time.perf_counter()
+        for i in range(count):
+            journal.append(MessageType.ENVOI.TEXT, f"client{i % 100}", f"client{(i + 1) % 100}", f"message {i}")
+        append_s = time.perf_counter() - started
+        # horodatage simulé : un message par seconde, pour viser une date précise
+        origin = time.time() - count
+        journal.pending = deque((origin + i, envelope) for i, (_, envelope) in enumerate(journal.pending))
+
+        started = time.perf_counter()
+        journal.flush()
+        flush_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        events = list(journal.replay(origin + count - tail))
+        tail_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanned = sum(1 for _ in journal.replay(0))
+        full_s = time.perf_counter() - started
+        snapshot = journal.snapshot()
+        journal.segments[-1].close()
+        return {
+            "append_us_per_message": round(append_s * 1e6 / count, 3),
+            "flush_us_per_message": round(flush_s * 1e6 / count, 3),
+            "replay_tail_ms": round(tail_s * 1000, 2),
+            "replay_tail_events": len(events),
+            "replay_full_ms": round(full_s * 1000, 2),
+            "replay_full_events": scanned,
+            "segments": snapshot["segments"],
+            "bytes": snapshot["bytes"],
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", default="100000,1000000")
+    parser.add_argument("--tail", type=int, default=500)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for count in (int(c) for c in args.messages.split(",")):
+        record = {"messages": count, "tail": args.tail, **run(count, args.tail)}
+        results.append(record)
+        print(
+            f"{count:>8} messages ({record['segments']} segments, {record['bytes'] / 1e6:.1f} Mo) : "
+            f"append {record['append_us_per_message']:6.3f} µs | écriture {record['flush_us_per_message']:6.3f} µs/message | "
+            f"{args.tail} derniers {record['replay_tail_ms']:8.2f} ms | tout relire {record['replay_full_ms']:9.2f} ms"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Charge de bout en bout : WSServer sur 127.0.0.1, N clients simulés (protocole de WSClient).
+
+Un serveur neuf par scénario et par moteur, dans un process séparé :
+
+- text : P paires de clients s'envoient des ENVOI_TEXT en 1:1
+- broadcast : S émetteurs envoient des ENVOI_TEXT à "ALL" devant N clients
+- image / audio / video : P paires se relaient des médias base64 (--media-kb par type)
+- churn : C clients se connectent, se déclarent et se déconnectent en boucle
+
+Chaque résultat porte le débit, les latences p50 / p99 / p999, le RSS et les
+threads du serveur, le commit mesuré et la date : les fichiers JSON de deux
+commits se comparent directement.
+
+Usage : python3 benchmarks/bench_load.py [--engines threaded,asyncio] [--scenarios text,broadcast,image,audio,video,churn]
+        [--pairs 20] [--clients 200] [--duration 5] [--json out.json]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+
+from bench_client import (
+    BenchClient,
+    free_port,
+    git_commit,
+    latency_summary,
+    proc_status,
+    raise_fd_limit,
+    start_server_process,
+    write_json,
+)
+
+from Message import MessageType
+
+SCENARIOS = ("text", "broadcast", "image", "audio", "video", "churn")
+MEDIA_TYPES = {"image": MessageType.ENVOI.IMAGE, "audio": MessageType.ENVOI.AUDIO, "video": MessageType.ENVOI.VIDEO}
+MEDIA_KB = {"image": 256, "audio": 1024, "video": 4096}
+
+
+async def connect_all(port, names):
+    clients = [BenchClient(port, name) for name in names]
+    for client in clients:
+        await client.connect()
+    await asyncio.wait_for(asyncio.gather(*(client.declared.wait() for client in clients)), 60)
+    return clients
+
+
+async def close_all(clients):
+    for client in clients:
+        await client.close()
+
+
+async def pump_pairs(port, pairs, duration, message_type=MessageType.ENVOI.TEXT, padding="", burst=20):
+    """P émetteurs envoient des messages horodatés à leur destinataire pendant duration secondes"""
+    senders = await connect_all(port, [f"send{i}" for i in range(pairs)])
+    receivers = await connect_all(port, [f"recv{i}" for i in range(pairs)])
+    sent = 0
+    stop_at = time.perf_counter() + duration
+
+    async def pump(sender, receiver):
+        nonlocal sent
+        while time.perf_counter() < stop_at:
+            for _ in range(burst):
+                sender.send_timed(receiver.username, message_type, padding)
+                sent += 1
+            await sender.drain()
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(pump(s, r) for s, r in zip(senders, receivers)))
+    await asyncio.sleep(1.0)
+    elapsed = time.perf_counter() - start
+    received = sum(r.received for r in receivers)
+    latencies = [lat for r in receivers for lat in r.latencies]
+    await close_all(senders + receivers)
+    return {
+        "sent": sent,
+        "received": received,
+        "messages_per_sec": round(received / elapsed, 1),
+        "mb_per_sec": round(received * len(padding) / elapsed / 1e6, 2),
+        **latency_summary(latencies),
+    }
+
+
+async def scenario_text(port, args):
+    return await pump_pairs(port, args.pairs, args.duration)
+
+
+async def scenario_broadcast(port, args):
+    audience = await connect_all(port, [f"watch{i}" for i in range(args.clients)])
+    senders = await connect_all(port, [f"speaker{i}" for i in range(args.speakers)])
+    sent = 0
+    stop_at = time.perf_counter() + args.duration
+    interval = 1.0 / args.broadcast_rate
+
+    async def speak(sender):
+        nonlocal sent
+        while time.perf_counter() < stop_at:
+            sender.send_timed("ALL")
+            sent += 1
+            await sender.drain()
+            await asyncio.sleep(interval)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(speak(sender) for sender in senders))
+    await asyncio.sleep(1.0)
+    elapsed = time.perf_counter() - start
+    everyone = audience + senders
+    received = sum(client.received for client in everyone)
+    latencies = [lat for client in everyone for lat in client.latencies]
+    await close_all(everyone)
+    return {
+        "sent": sent,
+        "deliveries": received,
+        "expected_deliveries": sent * len(everyone),
+        "deliveries_per_sec": round(received / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+def media_scenario(kind):
+    async def run(port, args):
+        size = args.media_kb.get(kind, MEDIA_KB[kind]) * 1024
+        # base64 dans le JSON, comme les clients historiques
+        padding = base64.b64encode(os.urandom(size)).decode("ascii")
+        return await pump_pairs(port, args.media_pairs, args.duration, MEDIA_TYPES[kind], padding, burst=1)
+    return run
+
+
+async def scenario_churn(port, args):
+    """Connexion + DECLARATION + fermeture en boucle ; latence jusqu'à la réponse à la déclaration"""
+    stop_at = time.perf_counter() + args.duration
+    latencies = []
+    failed = 0
+
+    async def cycle(worker):
+        nonlocal failed
+        round_index = 0
+        while time.perf_counter() < stop_at:
+            client = BenchClient(port, f"churn{worker}-{round_index}")
+            round_index += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(client.connect(), 10)
+                await asyncio.wait_for(client.declared.wait(), 10)
+                latencies.append(time.perf_counter() - started)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                failed += 1
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(cycle(worker) for worker in range(args.churn)))
+    elapsed = time.perf_counter() - start
+    return {
+        "sessions": len(latencies),
+        "failed": failed,
+        "sessions_per_sec": round(len(latencies) / elapsed, 1),
+        **latency_summary(latencies, "session"),
+    }
+
+
+RUNNERS = {
+    "text": scenario_text,
+    "broadcast": scenario_broadcast,
+    "image": media_scenario("image"),
+    "audio": media_scenario("audio"),
+    "video": media_scenario("video"),
+    "churn": scenario_churn,
+}
+
+
+async def bench(engine, scenario, args):
+    port = free_port()
+    # quotas et admission désactivés : on mesure la capacité du serveur, pas ses limites
+    proc = start_server_process(port, engine, quotas=False, admission=False, outbox=False, journal=False)
+    try:
+        idle = proc_status(proc.pid)
+        result = await RUNNERS[scenario](port, args)
+        loaded = proc_status(proc.pid)
+        return {
+            "engine": engine,
+            "scenario": scenario,
+            "commit": args.commit,
+            "timestamp": round(time.time(), 3),
+            "duration_s": args.duration,
+            **result,
+            "rss_idle_kb": idle["rss_kb"],
+            "rss_kb": loaded["rss_kb"],
+            "threads": loaded["threads"],
+        }
+    finally:
+        proc.terminate()
+        proc.join()
+
+
+def describe(record):
+    rate = next((record[key] for key in ("messages_per_sec", "deliveries_per_sec", "sessions_per_sec") if key in record), None)
+    prefix = "session" if record["scenario"] == "churn" else "latency"
+    return (
+        f"{record['engine']:>9} {record['scenario']:>9}: {rate:>10}/s | "
+        f"p50={record[f'{prefix}_p50_ms']} p99={record[f'{prefix}_p99_ms']} p999={record[f'{prefix}_p999_ms']} ms | "
+        f"RSS {record['rss_kb']} Ko, {record['threads']} threads"
+    )
+
+
+def parse_media_kb(text):
+    sizes = {}
+    for part in filter(None, text.split(",")):
+        kind, _, kb = part.partition("=")
+        sizes[kind.strip()] = int(kb)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="threaded,asyncio")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--pairs", type=int, default=20, help="paires de clients en 1:1 (text)")
+    parser.add_argument("--clients", type=int, default=200, help="clients qui reçoivent les diffusions")
+    parser.add_argument("--speakers", type=int, default=2, help="émetteurs vers ALL")
+    parser.add_argument("--broadcast-rate", type=float, default=20, help="diffusions par seconde et par émetteur")
+    parser.add_argument("--media-pairs", type=int, default=4)
+    parser.add_argument("--media-kb", type=parse_media_kb, default={}, help="ex: image=256,audio=1024,video=4096")
+    parser.add_argument("--churn", type=int, default=20, help="clients qui se connectent / déconnectent en boucle")
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    args.commit = git_commit()
+    results = []
+    for engine in args.engines.split(","):
+        for scenario in args.scenarios.split(","):
+            record = asyncio.run(bench(engine.strip(), scenario.strip(), args))
+            results.append(record)
+            print(describe(record))
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Médias répétés : octets relayés avec et sans le store adressé par contenu.
+
+Un émetteur envoie K médias distincts, chacun R fois, à N destinataires
+("ALL"). Mesure en process avec le transport factice :
+
+- binary : chaque envoi remonte et redescend en entier (media_store=False)
+- media_ref : après le premier envoi, l'émetteur n'envoie que l'empreinte et
+  les destinataires qui ont déjà le média ne reçoivent qu'une référence
+
+Usage : python3 benchmarks/bench_media_store.py [--clients 10,100] [--media-kb 256] [--distinct 4] [--repeat 10] [--json out.json]
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from fake_transport import install
+from bench_client import write_json
+
+from Context import Context
+from MediaStore import MediaStore, media_hash, ref_value
+from Message import Message, MessageType
+
+MODES = {"binary": False, "media_ref": None}
+
+
+def build_server(count, media_store):
+    WSServer = install()
+    server = WSServer(Context("127.0.0.1", 0), "fake", media_store=media_store)
+    features = ["ack", "binary"] + (["media_ref"] if media_store is not False else [])
+    clients = []
+    for i in range(count + 1):
+        client = server.server.connect()
+        declaration = Message(MessageType.DECLARATION, emitter=f"client{i}", receiver="", value={"features": features})
+        server.server.receive(client, declaration.to_json())
+        clients.append(client)
+    return server, clients[0], clients[1:]
+
+
+def run(count, media, repeat, mode):
+    with contextlib.redirect_stdout(io.StringIO()):
+        server, sender, receivers = build_server(count, MODES[mode])
+        for client in receivers:
+            client["handler"].bytes = 0
+        # store local de l'émetteur (celui de WSClient) : empreinte seule pour un média déjà envoyé
+        store = MediaStore() if mode == "media_ref" else None
+        uplink = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for data in media:
+                digest = media_hash(data) if store is not None else None
+                if digest and store.has(digest):
+                    text = Message(MessageType.ENVOI.IMAGE, emitter="client0", receiver="ALL", value=ref_value(digest, len(data))).to_json()
+                    uplink += len(text)
+                    server.server.receive(sender, text)
+                    continue
+                if digest:
+                    store.put(data, digest)
+                frame = bytearray(Message(MessageType.ENVOI.IMAGE, emitter="client0", receiver="ALL", value=data).to_binary())
+                uplink += len(frame)
+                server.on_binary_received(sender, server.server, frame)
+        elapsed = time.perf_counter() - started
+    return {
+        "uplink_bytes": uplink,
+        "downlink_bytes": sum(client["handler"].bytes for client in receivers),
+        "ms": round(elapsed * 1000, 2),
+        "store": server.media.snapshot() if server.media else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="10,100")
+    parser.add_argument("--media-kb", type=int, default=256)
+    parser.add_argument("--distinct", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    media = [b"\xff\xd8\xff\xe0" + os.urandom(args.media_kb * 1024) for _ in range(args.distinct)]
+    results = []
+    for count in (int(c) for c in args.clients.split(",")):
+        for mode in MODES:
+            record = {"clients": count, "mode": mode, "media_kb": args.media_kb, "sends": args.distinct * args.repeat,
+                      **run(count, media, args.repeat, mode)}
+            results.append(record)
+            print(
+                f"{count:>5} clients {mode:>9}: montant {record['uplink_bytes'] / 1e6:9.2f} Mo | "
+                f"descendant {record['downlink_bytes'] / 1e6:10.2f} Mo | {record['ms']:9.1f} ms"
+            )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
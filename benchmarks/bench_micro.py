@@ -0,0 +1,280 @@
+"""
+Microbenchmarks des fonctions chaudes, en process (transport factice), avec suivi de régressions.
+
+Cas mesurés (µs par appel, meilleur de --repeat séries, comme timeit) :
+
+- codec : Message.to_json / from_json d'un texte court, de 1 Mo et de 20 Mo
+  (from_json ne lit que l'en-tête au-delà de 4 Ko : "+value" force le décodage)
+- dispatch : on_message_received par type de message (DECLARATION, ENVOI_TEXT 1:1
+  et ALL, ENVOI_IMAGE base64 et binaire, ENVOI_CLIENT_LIST, ACK, pong)
+- summarize : _summarize_value d'un texte, d'un média reçu et d'une référence de média
+- clients_list : broadcast_clients_list devant 10 / 1k / 10k clients
+- rooms : ENVOI_TEXT vers un salon de 10 membres parmi 5k salons et 2k clients, le même
+  vers ALL (coût O(membres) contre O(clients)), ROOM_JOIN + ROOM_LEAVE
+- metrics : mises à jour de Metrics sur le chemin de routage (doivent rester sous la
+  microseconde), snapshot et rendu Prometheus
+- media_payload : lecture du payload d'un média côté serveur (en-tête binaire, trame
+  binaire complète, début d'un média base64 pour la compression) et décodage côté
+  interface (interface._decode_media_payload, si PyQt5 est installé)
+
+--save enregistre les résultats comme référence (--baseline) ; sans --save, chaque
+cas est comparé à la référence et ceux plus lents de plus de --threshold sont
+signalés (code de sortie 1, utilisable en CI). La référence dépend de la machine.
+
+Usage : python3 benchmarks/bench_micro.py [--filter dispatch] [--repeat 5] [--threshold 0.2]
+        [--baseline benchmarks/micro_baseline.json] [--save] [--json out.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+
+from fake_transport import ROOT, install
+from bench_client import git_commit, write_json
+
+from Context import Context
+from Deflate import _media_payload
+from Message import Message, MessageType
+from MediaStore import media_hash
+from Metrics import render_prometheus
+from WSFrame import OPCODE_BINARY, OPCODE_TEXT
+
+BASELINE = os.path.join(ROOT, "benchmarks", "micro_baseline.json")
+CLIENT_COUNTS = (10, 1000, 10000)
+ROOM_CLIENTS = 2000
+ROOM_COUNT = 5000
+ROOM_SIZE = 10
+
+
+def make_server():
+    WSServer = install()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return WSServer(Context("127.0.0.1", 0), "fake", quotas=False, outbox=False, journal=False)
+
+
+def declare(server, name, features=()):
+    client = server.server.connect()
+    value = {"features": list(features)} if features else ""
+    server.server.receive(client, Message(MessageType.DECLARATION, emitter=name, receiver="", value=value).to_json())
+    return client
+
+
+def codec_cases():
+    cases = {}
+    for label, size in (("text", 0), ("1mb", 1024 * 1024), ("20mb", 20 * 1024 * 1024)):
+        value = "bonjour, ceci est un message de chat" if not size else "x" * size
+        message = Message(MessageType.ENVOI.TEXT, emitter="alice", receiver="bob", value=value)
+        encoded = message.to_json()
+        cases[f"codec.to_json.{label}"] = message.to_json
+        cases[f"codec.from_json.{label}"] = lambda encoded=encoded: Message.from_json(encoded)
+        cases[f"codec.from_json+value.{label}"] = lambda encoded=encoded: Message.from_json(encoded).value
+    return cases
+
+
+def dispatch_cases(server):
+    alice = declare(server, "alice")
+    declare(server, "bob")
+    for i in range(8):
+        declare(server, f"watcher{i}")
+    receive = server.server.receive
+    image = os.urandom(256 * 1024)
+    frames = {
+        "declaration": Message(MessageType.DECLARATION, emitter="alice", receiver="", value="").to_json(),
+        "text": Message(MessageType.ENVOI.TEXT, emitter="alice", receiver="bob", value="salut bob").to_json(),
+        "text_all": Message(MessageType.ENVOI.TEXT, emitter="alice", receiver="ALL", value="salut tout le monde").to_json(),
+        "image_b64": Message(MessageType.ENVOI.IMAGE, emitter="alice", receiver="bob", value=image).to_base64_json(),
+        "image_binary": Message(MessageType.ENVOI.IMAGE, emitter="alice", receiver="bob", value=image).to_binary(),
+        "client_list": Message(MessageType.ENVOI.CLIENT_LIST, emitter="alice", receiver="SERVER", value="").to_json(),
+        "ack": Message(MessageType.ACK, emitter="alice", receiver="SERVER", value=1).to_json(),
+        "pong": Message(MessageType.SYS_MESSAGE, emitter="alice", receiver="SERVER", value="pong").to_json(),
+    }
+    cases = {}
+    for label, frame in frames.items():
+        if isinstance(frame, bytes):
+            # le relais binaire retype la trame sur place : une copie neuve par appel, comme une trame reçue
+            cases[f"dispatch.{label}"] = lambda frame=frame: receive(alice, bytearray(frame))
+        else:
+            cases[f"dispatch.{label}"] = lambda frame=frame: receive(alice, frame)
+    return cases
+
+
+def summarize_cases(server):
+    image = Message(MessageType.ENVOI.IMAGE, emitter="alice", receiver="bob", value=os.urandom(64 * 1024)).to_base64_json()
+    received = Message.from_json(image)
+    digest = media_hash(b"media")
+    ref = Message.from_json(Message(MessageType.ENVOI.IMAGE, emitter="alice", receiver="bob", value={"media_ref": digest, "size": 5}).to_json())
+    summarize = server._summarize_value
+    return {
+        "summarize.text": lambda: summarize(MessageType.ENVOI.TEXT, "salut bob"),
+        "summarize.media": lambda: summarize(MessageType.ENVOI.IMAGE, received),
+        "summarize.media_ref": lambda: summarize(MessageType.ENVOI.IMAGE, ref),
+    }
+
+
+def clients_list_cases():
+    cases = {}
+    for count in CLIENT_COUNTS:
+        server = make_server()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(count):
+                declare(server, f"client{i}")
+        cases[f"clients_list.{count}"] = server.broadcast_clients_list
+    return cases
+
+
+def rooms_cases():
+    server = make_server()
+    clients = [declare(server, f"member{i}") for i in range(ROOM_CLIENTS)]
+    receive = server.server.receive
+    for room in range(ROOM_COUNT):
+        for member in range(ROOM_SIZE):
+            index = (room * ROOM_SIZE + member) % ROOM_CLIENTS
+            join = Message(MessageType.ROOM.JOIN, emitter=f"member{index}", receiver="SERVER", value=f"#room{room}")
+            receive(clients[index], join.to_json())
+    sender = clients[0]
+    room_text = Message(MessageType.ENVOI.TEXT, emitter="member0", receiver="#room0", value="salut le salon").to_json()
+    all_text = Message(MessageType.ENVOI.TEXT, emitter="member0", receiver="ALL", value="salut le salon").to_json()
+    join = Message(MessageType.ROOM.JOIN, emitter="member0", receiver="SERVER", value="#bench").to_json()
+    leave = Message(MessageType.ROOM.LEAVE, emitter="member0", receiver="SERVER", value="#bench").to_json()
+
+    def join_leave():
+        receive(sender, join)
+        receive(sender, leave)
+
+    return {
+        f"rooms.text_{ROOM_SIZE}_members": lambda: receive(sender, room_text),
+        f"rooms.text_all_{ROOM_CLIENTS}": lambda: receive(sender, all_text),
+        "rooms.join_leave": join_leave,
+    }
+
+
+def metrics_cases(server):
+    metrics = server.metrics
+    for i in range(1000):
+        metrics.message_in(MessageType.ENVOI.TEXT, 120, 5000 + i * 37)
+    return {
+        "metrics.message_in": lambda: metrics.message_in(MessageType.ENVOI.TEXT, 120, 12345),
+        "metrics.message_out": lambda: metrics.message_out(MessageType.RECEPTION.TEXT, 120),
+        "metrics.fanout": lambda: metrics.fanout(MessageType.RECEPTION.TEXT, 120, 50),
+        "metrics.snapshot": server.metrics_snapshot,
+        "metrics.prometheus": lambda: render_prometheus({"SERVER": server.metrics_snapshot()}),
+    }
+
+
+def media_payload_cases():
+    media = b"\xff\xd8\xff" + os.urandom(1024 * 1024)
+    frame = Message(MessageType.ENVOI.IMAGE, emitter="alice", receiver="bob", value=media).to_binary()
+    b64 = Message(MessageType.ENVOI.IMAGE, emitter="alice", receiver="bob", value=media).to_base64_json().encode("utf-8")
+    cases = {
+        "media_payload.binary_header": lambda: Message.read_binary_header(frame),
+        "media_payload.from_frame": lambda: Message.from_frame(frame),
+        "media_payload.sniff_binary": lambda: _media_payload(frame, OPCODE_BINARY),
+        "media_payload.sniff_b64": lambda: _media_payload(b64, OPCODE_TEXT),
+    }
+    try:
+        from interface import WSClientQt
+    except ImportError:
+        print("interface._decode_media_payload non mesuré : PyQt5 n'est pas installé", file=sys.stderr)
+        return cases
+    value = Message.from_json(b64.decode("utf-8")).value
+    received = Message.from_frame(frame).value
+    cases["media_payload.client_b64"] = lambda: WSClientQt._decode_media_payload(value, "IMG:")
+    cases["media_payload.client_binary"] = lambda: WSClientQt._decode_media_payload(received, "IMG:")
+    return cases
+
+
+def build_cases(selected):
+    server = make_server()
+    groups = (
+        ("codec", codec_cases),
+        ("dispatch", lambda: dispatch_cases(server)),
+        ("summarize", lambda: summarize_cases(server)),
+        ("clients_list", clients_list_cases),
+        ("rooms", rooms_cases),
+        ("metrics", lambda: metrics_cases(server)),
+        ("media_payload", media_payload_cases),
+    )
+    cases = {}
+    for group, build in groups:
+        if selected(group):
+            with contextlib.redirect_stdout(io.StringIO()):
+                cases.update((name, fn) for name, fn in build().items() if selected(name))
+    return cases
+
+
+def measure(fn, repeat):
+    """µs par appel : meilleur de repeat séries d'au moins 0,2 s (timeit.autorange)"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    with contextlib.redirect_stdout(io.StringIO()):
+        best = min(timer.repeat(repeat, number))
+    return best * 1e6 / number
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="ne mesure que les cas qui contiennent l'un de ces mots (séparés par des virgules)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2, help="ralentissement toléré vs la référence (0.2 = +20 %%)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="enregistre les résultats comme nouvelle référence")
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    words = [word for word in args.filter.split(",") if word]
+
+    def selected(name):
+        # un groupe est construit si l'un des mots le vise ou vise l'un de ses cas
+        return not words or any(word in name or name in word for word in words)
+
+    baseline = None if args.save else load_baseline(args.baseline)
+    reference = (baseline or {}).get("results", {})
+    if baseline:
+        print(f"Référence : {args.baseline} (commit {baseline.get('commit')}), seuil +{args.threshold:.0%}")
+
+    results = {}
+    regressions = []
+    for name, fn in build_cases(selected).items():
+        us = measure(fn, args.repeat)
+        results[name] = round(us, 3)
+        line = f"{name:<32} {us:>12.3f} µs"
+        if name in reference:
+            change = us / reference[name] - 1
+            line += f"  (référence {reference[name]:.3f} µs, {change:+.0%})"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  <- RÉGRESSION"
+        print(line)
+
+    record = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "threshold": args.threshold,
+        "results": results,
+        "regressions": regressions,
+    }
+    if args.save:
+        write_json(args.baseline, {key: record[key] for key in ("commit", "python", "machine", "results")})
+        print(f"Référence enregistrée dans {args.baseline}")
+    if args.json:
+        write_json(args.json, record)
+    if regressions:
+        print(f"{len(regressions)} régression(s) au-delà de +{args.threshold:.0%} : {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Messages en attente pour un client hors ligne : coût de mise en attente et de vidange.
+
+Un émetteur envoie N ENVOI_TEXT à un destinataire absent (transport factice,
+en process, boîte sur disque dans un répertoire temporaire), puis le
+destinataire se déclare :
+
+- put : temps de routage par message mis en attente
+- flush : écriture + fsync groupés de toute la file
+- declaration : temps de traitement de la DECLARATION (la vidange part en fond)
+- drain : temps jusqu'à ce que tous les messages soient livrés
+
+Usage : python3 benchmarks/bench_outbox.py [--messages 1000,10000] [--size 200] [--json out.json]
+"""
+import argparse
+import contextlib
+import io
+import shutil
+import tempfile
+import time
+
+from fake_transport import install
+from bench_client import write_json
+
+from Context import Context
+from Message import Message, MessageType
+
+
+def declare(server, name):
+    client = server.server.connect()
+    server.server.receive(client, Message(MessageType.DECLARATION, emitter=name, receiver="", value="").to_json())
+    return client
+
+
+def run(count, size):
+    WSServer = install()
+    directory = tempfile.mkdtemp()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = WSServer(Context("127.0.0.1", 0), "fake", quotas=False, outbox={"directory": directory})
+            sender = declare(server, "sender")
+            # target s'est déjà déclaré une fois : seuls les noms connus ont une boîte
+            server.outbox.remember("target")
+            text = Message(MessageType.ENVOI.TEXT, emitter="sender", receiver="target", value="x" * size).to_json()
+
+            started = time.perf_counter()
+            for _ in range(count):
+                server.server.receive(sender, text)
+            put_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            server.outbox.flush()
+            flush_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            target = declare(server, "target")
+            declaration_s = time.perf_counter() - started
+            while server.outbox.snapshot()["delivered"] < count:
+                time.sleep(0.001)
+            drain_s = time.perf_counter() - started
+        return {
+            "put_us_per_message": round(put_s * 1e6 / count, 2),
+            "flush_ms": round(flush_s * 1000, 2),
+            "declaration_ms": round(declaration_s * 1000, 2),
+            "drain_ms": round(drain_s * 1000, 2),
+            "delivered_frames": target["handler"].frames,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", default="1000,10000")
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for count in (int(c) for c in args.messages.split(",")):
+        record = {"messages": count, "size": args.size, **run(count, args.size)}
+        results.append(record)
+        print(
+            f"{count:>7} messages : mise en attente {record['put_us_per_message']:7.2f} µs/message | "
+            f"fsync groupé {record['flush_ms']:8.2f} ms | déclaration {record['declaration_ms']:6.2f} ms | "
+            f"vidange {record['drain_ms']:9.2f} ms"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Quotas par client : coût d'un client qui inonde le serveur, avec et sans limites.
+
+Pendant --duration secondes, un client envoie des ENVOI_TEXT (ou des images
+base64) aussi vite que possible à un destinataire, pendant qu'un client
+normal envoie un message toutes les 50 ms. Mesure en process avec le
+transport factice :
+
+- off : quotas=False, tout est décodé et relayé
+- on : quotas par défaut, les messages au-delà du budget sont jetés avant décodage
+
+Usage : python3 benchmarks/bench_quotas.py [--duration 2] [--kind text,image] [--size-kb 1] [--json out.json]
+"""
+import argparse
+import base64
+import contextlib
+import io
+import os
+import time
+
+from fake_transport import install
+from bench_client import write_json
+
+from Context import Context
+from Message import Message, MessageType
+
+MODES = {"off": False, "on": None}
+POLITE_INTERVAL = 0.05
+
+
+def flood_message(kind, size):
+    if kind == "image":
+        value = "IMG:" + base64.b64encode(b"\xff\xd8\xff\xe0" + os.urandom(size)).decode("utf-8")
+        return Message(MessageType.ENVOI.IMAGE, emitter="flooder", receiver="target", value=value).to_json()
+    return Message(MessageType.ENVOI.TEXT, emitter="flooder", receiver="target", value="x" * size).to_json()
+
+
+def run(mode, kind, size, duration):
+    WSServer = install()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = WSServer(Context("127.0.0.1", 0), "fake", quotas=MODES[mode], admin_feed=False)
+        clients = {}
+        for name in ("flooder", "polite", "target"):
+            client = server.server.connect()
+            server.server.receive(client, Message(MessageType.DECLARATION, emitter=name, receiver="", value="").to_json())
+            clients[name] = client
+        for client in clients.values():
+            client["handler"].frames = client["handler"].bytes = 0
+        target = clients["target"]["handler"]
+        flood = flood_message(kind, size)
+        polite = Message(MessageType.ENVOI.TEXT, emitter="polite", receiver="target", value="bonjour").to_json()
+
+        sent = polite_sent = 0
+        started = time.perf_counter()
+        next_polite = started
+        while True:
+            now = time.perf_counter()
+            if now - started >= duration:
+                break
+            if now >= next_polite:
+                server.server.receive(clients["polite"], polite)
+                polite_sent += 1
+                next_polite += POLITE_INTERVAL
+            server.server.receive(clients["flooder"], flood)
+            sent += 1
+        elapsed = time.perf_counter() - started
+        warnings = clients["flooder"]["handler"].frames
+    return {
+        "flood_sent": sent,
+        "delivered": target.frames,
+        "polite_sent": polite_sent,
+        "target_bytes": target.bytes,
+        "warnings": warnings,
+        "us_per_flood_message": round(elapsed * 1e6 / max(1, sent), 2),
+        "quotas": server.quotas.snapshot()["throttled"] if server.quotas else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--kind", default="text,image")
+    parser.add_argument("--size-kb", type=float, default=1)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    results = []
+    size = int(args.size_kb * 1024)
+    for kind in args.kind.split(","):
+        for mode in MODES:
+            record = {"kind": kind, "mode": mode, "size_kb": args.size_kb, **run(mode, kind, size, args.duration)}
+            results.append(record)
+            print(
+                f"{kind:>6} quotas {mode:>3}: {record['flood_sent']:>8} envoyés | {record['delivered']:>8} livrés | "
+                f"{record['target_bytes'] / 1e6:8.2f} Mo vers la cible | {record['us_per_flood_message']:7.2f} µs/message | "
+                f"{record['warnings']} trames vers l'émetteur"
+            )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
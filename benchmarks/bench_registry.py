@@ -0,0 +1,107 @@
+"""
+Registre des clients : dict nu + parcours linéaire (ancien WSServer) vs ClientRegistry.
+
+Pour N clients (dont quelques ADMIN) : connexion (déclaration), sélection des
+admins pour R messages routés (fan-out admin), puis déconnexion de tous.
+L'ancien chemin scanne tous les clients à chaque déconnexion et à chaque
+message routé ; le registre répond par index.
+
+Usage : python3 benchmarks/bench_registry.py [--clients 10000] [--admins 3] [--routed 1000] [--json out.json]
+"""
+import argparse
+import time
+
+import fake_transport  # noqa: F401  (ajoute la racine du dépôt au sys.path)
+from bench_client import write_json
+
+from ClientRegistry import ClientRegistry
+
+
+class LegacyRegistry:
+    """Ancien WSServer : dict nom -> client, rôle recalculé et départ trouvé par parcours"""
+
+    def __init__(self):
+        self.clients = {}
+
+    def add(self, name, client):
+        self.clients[name] = client
+
+    def remove_client(self, client):
+        left_name = None
+        for name, c in list(self.clients.items()):
+            if c["id"] == client["id"]:
+                left_name = name
+                del self.clients[name]
+        return left_name
+
+    def admin_clients(self):
+        return [client for name, client in self.clients.items() if name.upper().startswith("ADMIN")]
+
+
+class IndexedRegistry:
+    def __init__(self):
+        self.clients = ClientRegistry()
+
+    def add(self, name, client):
+        self.clients.add(name, client, ("binary",))
+
+    def remove_client(self, client):
+        return self.clients.remove_client(client)
+
+    def admin_clients(self):
+        return self.clients.admin_clients()
+
+
+def population(count, admins):
+    names = [f"ADMIN{i}" for i in range(admins)] + [f"client{i}" for i in range(count - admins)]
+    return [(name, {"id": i + 1, "address": ("127.0.0.1", 40000 + i)}) for i, name in enumerate(names)]
+
+
+def run(registry, clients, routed):
+    started = time.perf_counter()
+    for name, client in clients:
+        registry.add(name, client)
+    connected = time.perf_counter()
+
+    # un message routé = une sélection des admins + un envoi à chacun
+    reached = 0
+    for _ in range(routed):
+        reached += len(registry.admin_clients())
+    fanned = time.perf_counter()
+
+    for _, client in clients:
+        registry.remove_client(client)
+    finished = time.perf_counter()
+    return {
+        "connect_ms": round((connected - started) * 1000, 2),
+        "admin_fanout_us": round((fanned - connected) * 1e6 / routed, 2),
+        "disconnect_ms": round((finished - fanned) * 1000, 2),
+        "admins_reached": reached // routed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--routed", type=int, default=1000)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    clients = population(args.clients, args.admins)
+    results = []
+    for label, registry in (("dict", LegacyRegistry()), ("registry", IndexedRegistry())):
+        record = {"registry": label, "clients": args.clients, **run(registry, clients, args.routed)}
+        results.append(record)
+        print(
+            f"{label:>9}: connexion {record['connect_ms']:8.2f} ms | "
+            f"admins par message {record['admin_fanout_us']:9.2f} µs | "
+            f"déconnexion {record['disconnect_ms']:9.2f} ms"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
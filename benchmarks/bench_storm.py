@@ -0,0 +1,103 @@
+"""
+Vague de reconnexions : N clients se connectent et se déclarent au même instant.
+
+Mesure le temps jusqu'à ce que tous soient déclarés (time-to-all-connected),
+les percentiles par client, les refus (503 / connexion refusée) et le volume
+de RECEPTION_CLIENT_LIST reçu pendant la vague, pour chaque débit d'admission
+des handshakes (0 = sans limite).
+
+Avec --workers, le serveur tourne en Cluster (un listener SO_REUSEPORT par worker).
+
+Usage : python3 benchmarks/bench_storm.py [--clients 1000] [--engine asyncio] [--rates 0,500] [--backlog 1024] [--workers 0] [--json out.json]
+"""
+import argparse
+import asyncio
+import time
+
+from bench_client import BenchClient, free_port, percentile, raise_fd_limit, start_server_process, write_json
+from bench_cluster import start_cluster
+
+from Message import MessageType
+
+
+async def storm(port, count, timeout):
+    clients = [BenchClient(port, f"storm{i}") for i in range(count)]
+    started = time.perf_counter()
+    done = []
+    refused = 0
+
+    async def join(client):
+        nonlocal refused
+        try:
+            await asyncio.wait_for(client.connect(), timeout)
+            await asyncio.wait_for(client.declared.wait(), timeout)
+            done.append(time.perf_counter() - started)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            refused += 1
+
+    await asyncio.gather(*(join(client) for client in clients))
+    # les listes diffusées juste après la dernière déclaration
+    await asyncio.sleep(0.5)
+    lists = sum(client.by_type.get(MessageType.RECEPTION.CLIENT_LIST, 0) for client in clients)
+    received_bytes = sum(client.received_bytes for client in clients)
+    for client in clients:
+        await client.close()
+    return {
+        "connected": len(done),
+        "refused": refused,
+        "all_connected_s": round(max(done), 3) if done else None,
+        "connect_p50_ms": round(percentile(done, 50) * 1000, 1) if done else None,
+        "connect_p99_ms": round(percentile(done, 99) * 1000, 1) if done else None,
+        "client_lists": lists,
+        "received_mb": round(received_bytes / 1e6, 2),
+    }
+
+
+def bench_rate(rate, args):
+    port = free_port()
+    handshake = {"rate": rate, "burst": max(1, rate // 2)} if rate else False
+    if args.workers:
+        proc = start_cluster(port, args.workers, args.engine, backlog=args.backlog, handshake=handshake)
+    else:
+        proc = start_server_process(port, args.engine, backlog=args.backlog, handshake=handshake)
+    try:
+        time.sleep(0.5)
+        result = asyncio.run(storm(port, args.clients, args.timeout))
+    finally:
+        proc.terminate()
+        proc.join()
+    return {"engine": args.engine, "workers": args.workers, "backlog": args.backlog, "handshake_rate": rate, "clients": args.clients, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--engine", default="asyncio")
+    parser.add_argument("--rates", default="0,500")
+    parser.add_argument("--backlog", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="fichier de sortie JSON ('-' pour stdout)")
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    if args.clients + 64 > limit:
+        print(f"[warn] limite de descripteurs ({limit}) trop basse pour {args.clients} clients")
+
+    results = []
+    for rate in (int(r) for r in args.rates.split(",")):
+        result = bench_rate(rate, args)
+        results.append(result)
+        label = f"{rate}/s" if rate else "sans limite"
+        print(
+            f"{label:>12}: {result['connected']}/{result['clients']} connectés en {result['all_connected_s']} s "
+            f"(p50={result['connect_p50_ms']} ms p99={result['connect_p99_ms']} ms, {result['refused']} refus) | "
+            f"{result['client_lists']} listes, {result['received_mb']} Mo reçus"
+        )
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Transport factice pour mesurer WSServer en process, sans socket."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from websocket_server.websocket_server import API
+
+from WSFrame import OPCODE_BINARY, encode_frame, frame_header
+
+
+class FakeHandler:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def record(self, length):
+        self.frames += 1
+        self.bytes += length
+
+
+class FakeTransport(API):
+    """Même API que les moteurs de WSServer ; chaque envoi paie l'encodage de trame réel"""
+
+    def __init__(self, host="127.0.0.1", port=0, loglevel=None, **kwargs):
+        self.host = host
+        self.port = port
+        self.clients = {}
+        self.id_counter = 0
+
+    def connect(self):
+        self.id_counter += 1
+        client = {"id": self.id_counter, "handler": FakeHandler(), "address": ("127.0.0.1", 40000 + self.id_counter)}
+        self.clients[client["id"]] = client
+        self.new_client(client, self)
+        return client
+
+    def disconnect(self, client):
+        self.client_left(client, self)
+        self.clients.pop(client["id"], None)
+
+    def set_fn_frame_dropped(self, fn):
+        # pas de file d'envoi : aucune trame n'est jamais jetée
+        pass
+
+    def receive(self, client, message):
+        self.message_received(client, self, message)
+
+    def _unicast(self, client, msg):
+        # comme websocket_server : encodage UTF-8 + en-tête à chaque appel
+        client["handler"].record(len(encode_frame(msg)))
+
+    def _multicast(self, msg):
+        for client in list(self.clients.values()):
+            self._unicast(client, msg)
+
+    def send_binary(self, client, data):
+        client["handler"].record(len(frame_header(len(data), OPCODE_BINARY)) + len(data))
+
+    def send_frame(self, client, frame):
+        client["handler"].record(len(frame))
+
+    def queue_stats(self, client):
+        return {"depth": 0, "bytes": 0, "dropped": 0}
+
+    def drop_client(self, client):
+        if client["id"] in self.clients:
+            self.disconnect(client)
+
+    def _run_forever(self, threaded):
+        pass
+
+    def _shutdown_gracefully(self, status=None, reason=None):
+        pass
+
+
+def install():
+    """Enregistre le moteur 'fake' dans WSServer.ENGINES"""
+    import WSServer
+
+    WSServer.ENGINES["fake"] = FakeTransport
+    return WSServer.WSServer
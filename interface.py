@@ -16,7 +16,9 @@ except Exception:
     QVideoWidget = None
     QT_MULTIMEDIA_AVAILABLE = False
 
+from Codecs import JSON, PREFERRED
 from Context import Context
+from Delivery import describe_receipt
 from Message import Message, MessageType
 from WSClient import WSClient
 
@@ -51,9 +53,11 @@ class WSClientQt(QtCore.QObject):
     status_signal = QtCore.pyqtSignal(bool, str)
     error_signal = QtCore.pyqtSignal(str)
 
-    def __init__(self, ctx, username="Client"):
+    def __init__(self, ctx, username="Client", binary=True, chunked=True):
         super().__init__()
-        self._client = WSClient(ctx, username)
+        store_dir = os.path.join(os.path.dirname(__file__), "received_media", "store")
+        self._client = WSClient(ctx, username, binary, chunked, codecs=PREFERRED, deflate=True, media_store={"directory": store_dir})
+        self._client.on_transfer_complete = self.on_transfer_complete
         self.ws = self._client.ws
         self.ws.on_open = self.on_open
         self.ws.on_message = self.on_message
@@ -66,13 +70,17 @@ class WSClientQt(QtCore.QObject):
 
     def on_open(self, ws):
         self._client.connected = True
-        message = Message(MessageType.DECLARATION, emitter=self._client.username, receiver="", value="")
-        ws.send(message.to_json())
+        self._client.enable_deflate(ws)
+        ws.send(self._client.declaration().to_json())
+        self._client.transfers.resume_all()
         self.status_signal.emit(True, "connected")
         self.log_signal.emit(f"[{_timestamp()}] connected as {self._client.username}")
 
     def on_close(self, ws, close_status_code, close_msg):
         self._client.connected = False
+        self._client.codec = JSON
+        self._client.server_features = set()
+        self._client.acks.stop()
         self.status_signal.emit(False, "disconnected")
         self.log_signal.emit(f"[{_timestamp()}] disconnected")
 
@@ -81,27 +89,41 @@ class WSClientQt(QtCore.QObject):
         self.log_signal.emit(f"[{_timestamp()}] error: {error}")
 
     def on_message(self, ws, message):
-        received_msg = Message.from_json(message)
+        received_msg = Message.from_frame(message)
+
+        if self._client.transfers.on_message(received_msg):
+            return
 
         if received_msg.message_type == MessageType.SYS_MESSAGE and received_msg.value == "ping":
             pong_msg = Message(MessageType.SYS_MESSAGE, emitter=self._client.username, receiver="", value="pong")
             ws.send(pong_msg.to_json())
             return
 
-        if received_msg.message_type in [
-            MessageType.RECEPTION.TEXT,
-            MessageType.RECEPTION.IMAGE,
-            MessageType.RECEPTION.AUDIO,
-            MessageType.RECEPTION.VIDEO,
-        ]:
-            ack_msg = Message(MessageType.SYS_MESSAGE, emitter=self._client.username, receiver="", value="MESSAGE OK")
-            ws.send(ack_msg.to_json())
+        # Réponse du serveur à la DECLARATION (codec, capacités)
+        if self._client.on_codec(received_msg):
+            return
+
+        # ACK cumulatif différé (voir Delivery.CumulativeAck)
+        if self._client.acks.on_message(received_msg):
+            return
+
+        # Média refusé par le serveur chargé : renvoyé après retry_after
+        self._client.on_deferred(received_msg)
+
+        # Médias reçus par empreinte : complétés depuis le cache local ou après MEDIA_DATA
+        for ready in self._client.on_media(received_msg):
+            self._emit_message(ready)
+
+    def _emit_message(self, received_msg):
+        value = received_msg.value
+        if received_msg.message_type == MessageType.SYS_MESSAGE:
+            value = describe_receipt(value) or value
 
         payload = {
             "type": received_msg.message_type,
             "emitter": received_msg.emitter,
             "receiver": received_msg.receiver,
-            "value": received_msg.value,
+            "value": value,
         }
         self.message_signal.emit(payload)
 
@@ -118,6 +140,17 @@ class WSClientQt(QtCore.QObject):
             if raw:
                 self.video_signal.emit(raw, received_msg.emitter)
 
+    def on_transfer_complete(self, message_type, emitter, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        os.remove(path)
+        self.message_signal.emit({"type": message_type, "emitter": emitter, "receiver": self._client.username, "value": raw})
+        if message_type == MessageType.RECEPTION.IMAGE:
+            self.image_signal.emit(raw, emitter)
+        elif message_type == MessageType.RECEPTION.AUDIO:
+            self.audio_signal.emit(raw, emitter)
+        elif message_type == MessageType.RECEPTION.VIDEO:
+            self.video_signal.emit(raw, emitter)
 
     def disconnect(self):
         if self._client.connected:
@@ -134,6 +167,12 @@ class WSClientQt(QtCore.QObject):
     def send_image(self, filepath, dest):
         self._client.send_image(filepath, dest)
 
+    def join_room(self, room):
+        self._client.join_room(room)
+
+    def leave_room(self, room):
+        self._client.leave_room(room)
+
     def send_audio(self, filepath, dest):
         self._client.send_audio(filepath, dest)
 
@@ -142,6 +181,9 @@ class WSClientQt(QtCore.QObject):
 
     @staticmethod
     def _decode_media_payload(value, prefix):
+        # Trame binaire : le payload est déjà brut
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value)
         if not isinstance(value, str):
             return None
         if value.startswith(prefix):
@@ -279,7 +321,7 @@ class ChatWindow(QtWidgets.QMainWindow):
         input_layout.addWidget(message_label, 1, 0)
 
         self.message_input = QtWidgets.QLineEdit()
-        self.message_input.setPlaceholderText("Type your message...")
+        self.message_input.setPlaceholderText("Type your message... (/join #room, /leave #room)")
         self.message_input.returnPressed.connect(self._send_text)
         input_layout.addWidget(self.message_input, 1, 1, 1, 3)
 
@@ -591,6 +633,9 @@ class ChatWindow(QtWidgets.QMainWindow):
             content = "[video]"
         elif msg_type in (MessageType.RECEPTION.CLIENT_LIST):
             content = "[client list]"
+        elif msg_type in (MessageType.ROOM.JOIN, MessageType.ROOM.LEAVE) and isinstance(value, dict):
+            action = "joined" if msg_type == MessageType.ROOM.JOIN else "left"
+            content = f"{action} {value.get('room')} ({value.get('members')} members)"
         else:
             content = value
         self._append_log(f"[{_timestamp()}] {emitter} -> {receiver}: {content} ")
@@ -645,6 +690,12 @@ class ChatWindow(QtWidgets.QMainWindow):
         text = self.message_input.text().strip()
         if not text:
             return
+        # "/join #salon" et "/leave #salon" : le salon apparaît ensuite dans "Send to"
+        command, _, room = text.partition(" ")
+        if command.lower() in ("/join", "/leave") and room.strip():
+            (self.client.join_room if command.lower() == "/join" else self.client.leave_room)(room.strip())
+            self.message_input.clear()
+            return
         self.client.send(text, dest)
         self._append_log(f"[{_timestamp()}] me -> {dest}: {text}")
         self.message_input.clear()
@@ -13,13 +13,17 @@ const elements = {
     statusPill: document.getElementById("status-pill"),
     statusText: document.getElementById("status-text"),
     clearFeed: document.getElementById("clear-feed"),
+    profileServer: document.getElementById("profile-server"),
 };
 
+const PROFILE_SECONDS = 10;
+
 const state = {
     clients: new Set(),
     messageCount: 0,
     relationCounts: new Map(),
     clientStats: new Map(),
+    queueStats: {},
     lastActivity: null,
 };
 
@@ -124,7 +128,9 @@ function updateClientsList() {
         const right = document.createElement("div");
         right.className = "client-meta";
         const lastSeen = stats.lastSeen ? formatTime(stats.lastSeen / 1000) : "--:--:--";
-        right.textContent = `${stats.messages} msgs | ${lastSeen}`;
+        const queue = state.queueStats[name];
+        const queueText = queue ? ` | q ${queue.depth} · drop ${queue.dropped}` : "";
+        right.textContent = `${stats.messages} msgs${queueText} | ${lastSeen}`;
 
         left.appendChild(dot);
         left.appendChild(label);
@@ -394,6 +400,24 @@ if (elements.clearFeed) {
     });
 }
 
+// The summary shows up in the feed once the server has finished sampling
+if (elements.profileServer) {
+    elements.profileServer.addEventListener("click", () => {
+        elements.profileServer.disabled = true;
+        fetch("/profile", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ duration: PROFILE_SECONDS }),
+        })
+            .catch(() => {})
+            .finally(() => {
+                setTimeout(() => {
+                    elements.profileServer.disabled = false;
+                }, PROFILE_SECONDS * 1000);
+            });
+    });
+}
+
 const evtSource = new EventSource("/stream");
 
 evtSource.onopen = () => setStatus(true);
@@ -409,6 +433,10 @@ evtSource.onmessage = event => {
     if (data.type === "message") {
         handleMessage(data);
     }
+    if (data.type === "queues") {
+        state.queueStats = data.queues || {};
+        updateClientsList();
+    }
 };
 
 updateGraphSize();